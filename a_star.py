@@ -3,7 +3,11 @@ import sys
 import time
 from heapq import *
 
-from base import Node, Action
+import numpy as np
+
+from base import Node, Action, State
+from metrics import record_plan
+from tracing import tracer
 from utils import *
 
 # path cost for traversing various terrains.
@@ -11,8 +15,47 @@ from utils import *
 tile_cost = {MapTiles.P: 1, MapTiles.S: 3, MapTiles.M: 10, MapTiles.W: sys.maxsize, MapTiles.U: sys.maxsize}
 
 
+def cost_grid(problem):
+    """
+    Convert the terrain into an array of tile costs, where impassable tiles
+    (walls and unknown tiles) cost infinity.
+    Args:
+        problem: 2d array of MapTiles. Problem with terrain as map tiles.
+    Returns: numpy.ndarray of float. Cost of stepping onto each tile.
+    """
+    costs = {tile: np.inf if cost == sys.maxsize else float(cost) for tile, cost in tile_cost.items()}
+    return np.vectorize(costs.__getitem__, otypes=[np.float64])(np.asarray(problem, dtype=object))
+
+
+def grid_graph(costs):
+    """
+    Build the sparse graph of moves between neighbouring passable tiles, where
+    each move is weighted by the cost of the tile moved onto. Node i*width + j
+    is the tile (i, j).
+    Args:
+        costs: numpy.ndarray of float. Tile costs as returned by `cost_grid`.
+    Returns: scipy.sparse.csr_matrix. The weighted directed graph.
+    """
+    # scipy is only loaded by the planners that build graphs
+    from scipy.sparse import csr_matrix
+
+    height, width = costs.shape
+    ids = np.arange(height * width).reshape(height, width)
+    passable = np.isfinite(costs)
+
+    sources, targets, weights = [], [], []
+    for a, b in [(np.s_[:, :-1], np.s_[:, 1:]), (np.s_[:-1, :], np.s_[1:, :])]:
+        both = passable[a] & passable[b]
+        sources.extend([ids[a][both], ids[b][both]])
+        targets.extend([ids[b][both], ids[a][both]])
+        weights.extend([costs[b][both], costs[a][both]])
+    return csr_matrix((np.concatenate(weights), (np.concatenate(sources), np.concatenate(targets))),
+                      shape=(height * width, height * width))
+
+
 # cost of acceptable but not optimal path(calories)
-# satisficity = 300
+satisficity = 300
+
 
 def find_actions(size, state, problem):
     """
@@ -45,7 +88,7 @@ def apply_action(state, action):
     return state.move(action)
 
 
-def generate_child(problem, goal, node, action):
+def generate_child(problem, goal, node, action, heuristic=None):
     """
     Generate the child node by performing the legal action on the current state
     and calculating the estimated cost to reach to the goal state and actual cost to
@@ -55,6 +98,8 @@ def generate_child(problem, goal, node, action):
         goal: tuple - (x,y). Goal state to reach.
         node: Object - Node. Node object representing current state.
         action: character - 'S'. Action to perform on the state.
+        heuristic: function(state, goal). Heuristic estimate of the cost to reach the goal,
+        `heuristic_cost` if None.
     Returns: Object - Node. The Child node.
     """
     # get the next state
@@ -62,9 +107,9 @@ def generate_child(problem, goal, node, action):
     # calculate actual cost
     actual_cost = node.actual_cost + tile_cost[problem[state.x][state.y]]
     # calculate heuristic cost
-    heuristic = heuristic_cost(state, goal)
+    estimate = (heuristic or heuristic_cost)(state, goal)
     # calculate F(n) = estimated cost to reach the goal state
-    estimate_cost = actual_cost + heuristic
+    estimate_cost = actual_cost + estimate
     return Node(estimate_cost, actual_cost, state, node, action)
 
 
@@ -99,7 +144,7 @@ def get_solution(node):
     return path, node_cost
 
 
-def a_star_search(start, goal, problem, safe_states):
+def a_star_search(start, goal, problem, safe_states, heuristic=None, deadline=None):
     """
     Find the list of actions to perform on the start state to reach the goal
     state through optimal path with least cost.
@@ -108,81 +153,386 @@ def a_star_search(start, goal, problem, safe_states):
         goal: tuple - (x,y). Goal state to reach.
         problem: 2d list of characters - [['m','p'],['s','p']]. Problem with terrain as characters.
         safe_states:
+        heuristic: function(state, goal). Admissible estimate of the cost to reach the
+        goal, the Manhattan distance `heuristic_cost` if None.
+        deadline: float. Time (as of time.time()) by which the search must return. If
+        it passes first, the search returns the path to the explored state closest to
+        the goal, costed with the estimate of the rest of the way.
     Returns: string. Sequence of actions to take on start state to reach
     the goal state.
     """
     explored = set()
     frontier = []
+    # cheapest cost found so far to reach each state pushed to the frontier
+    best_costs = {State(start): 0}
 
     # push the start node to the frontier
     heappush(frontier, Node(0, 0, start, None, None))
+    # explored node with the lowest estimate of the rest of the way, for a search out of time
+    closest, expanded = None, 0
+    # superseded nodes popped again for an explored state, and the frontier peak while tracing
+    trace, re_expansions, frontier_peak = tracer(), 0, 1
+    started = time.perf_counter() if trace is not None else None
 
     while True:
         # if all nodes in the frontier are explored and path is not found, then
         # there exists no path.
         if len(frontier) == 0:
-            return [], sys.maxsize
+            return finish_search(([], sys.maxsize), start, goal, explored, trace, started, re_expansions,
+                                 frontier_peak)
 
         # select state with least cost from frontier
         node = heappop(frontier)
+        # skip nodes superseded by a cheaper node of the same state
+        if node.state in explored:
+            re_expansions += 1
+            continue
         # print(node.state)
         # goal test the current node
         goal_node = goal_test(node, goal, frontier)
         if goal_node:
             # get the solution(seq. of actions)
-            return get_solution(goal_node)
+            return finish_search(get_solution(goal_node), start, goal, explored, trace, started, re_expansions,
+                                 frontier_peak)
 
         # add state to explored set
         explored.add(node.state)
 
+        if deadline is not None:
+            if closest is None or node.estimate_cost - node.actual_cost < closest.estimate_cost - closest.actual_cost:
+                closest = node
+            expanded += 1
+            if expanded % 256 == 0 and time.time() >= deadline:
+                path, _ = get_solution(closest)
+                return finish_search((path, closest.estimate_cost), start, goal, explored, trace, started,
+                                     re_expansions, frontier_peak, timed_out=True)
+
         # get the list of all possible actions on the state
         actions = find_actions(len(problem) - 1, node.state, problem)
         # expand a node and generate children
         for action in actions:
             # generate a child node by applying actions to the current state
-            child = generate_child(problem, goal, node, action)
+            child = generate_child(problem, goal, node, action, heuristic)
             if child is not None:
                 # check if child is already explored or present in frontier and
-                # (Ref: Line 144)replace the frontier node with child if the child has lower cost
-                if child.state not in explored and child not in frontier:
+                # replace the frontier node with child if the child has lower cost
+                if child.state not in explored and child.actual_cost < best_costs.get(child.state, sys.maxsize):
                     # add node with current state and path cost to reach the node from
                     # the start state to the frontier
                     # if the safeStates passed from the plan is in the frontier then only it will consider it
                     if (len(safe_states) == 0) or (child.state in safe_states) or (child.state == goal):
+                        best_costs[child.state] = child.actual_cost
                         heappush(frontier, child)
+        if trace is not None and len(frontier) > frontier_peak:
+            frontier_peak = len(frontier)
+
+
+def finish_search(path_cost, start, goal, explored, trace, started, re_expansions, frontier_peak, timed_out=False):
+    """
+    Count a finished a_star_search in the metrics, and record its statistics if it was traced.
+    Returns: tuple(list of Action, int). The path and its cost, unchanged.
+    """
+    record_plan('a-star', len(explored))
+    if trace is not None:
+        trace.record('a-star', started, start=start, goal=goal, expanded=len(explored), re_expansions=re_expansions,
+                     frontier_peak=frontier_peak, cost=path_cost[1], found=path_cost[1] != sys.maxsize,
+                     timed_out=timed_out)
+    return path_cost
 
 
-def goal_test(node, goal, frontier):
+def goal_test(node, goal, frontier, satisficity=None):
     """
-    Test whether the goal state has been reached, if not find a goal state
-    in frontier that is satisfiable(<= 300 calories), but not optimal.
+    Test whether the goal state has been reached. With a satisficity, only a goal
+    node that is satisfiable(<= satisficity calories), but not necessarily optimal,
+    is accepted.
     Args:
         node: Object - Node. The node to test for goal.
         goal: tuple(x,y). The goal state.
         frontier: []. list of frontier nodes prioritized by estimated cost
         to reach the goal.
+        satisficity: int. Cost of an acceptable path, None to accept any.
     Returns: Object- Node. The goal node that is either satisfiable or optimal.
     """
-    if node.state == goal:
+    if node.state == goal and (satisficity is None or node.actual_cost <= satisficity):
         return node
 
 
-def generate_test_problem():
+def satisficing_search(start, goal, problem, safe_states, satisficity=satisficity, heuristic=None):
+    """
+    Find a satisfiable path, i.e. any path costing no more than the satisficity,
+    from the start state to the goal state. Nodes are expanded by their potential
+    to lead to a satisfiable path, the ratio of the heuristic cost to the budget
+    left (potential search), nodes that cannot stay within the satisficity are
+    pruned and the goal is accepted as soon as it is generated.
+    Args:
+        start: tuple - (x,y). Start state of the agent
+        goal: tuple - (x,y). Goal state to reach.
+        problem: 2d list of MapTiles. Problem with terrain as map tiles.
+        safe_states: set of State. States the path may go through, all if empty.
+        satisficity: int. Cost of an acceptable path.
+        heuristic: function(state, goal). Admissible estimate of the cost to reach the
+        goal, the Manhattan distance `heuristic_cost` if None.
+    Returns: tuple(list of Action, int). Sequence of actions to take on start state
+    to reach the goal state and its cost, or ([], sys.maxsize) if there is no
+    satisfiable path.
+    """
+    root = Node(0, 0, start, None, None)
+    if goal_test(root, goal, [], satisficity):
+        return get_solution(root)
+
+    best_costs = {root.state: 0}
+    # frontier of (heuristic cost / budget left, tie breaker, node)
+    frontier = [(0, 0, root)]
+    pushed = 1
+    while len(frontier) > 0:
+        _, _, node = heappop(frontier)
+        if node.actual_cost > best_costs[node.state]:
+            continue
+
+        for action in find_actions(len(problem) - 1, node.state, problem):
+            child = generate_child(problem, goal, node, action, heuristic)
+            if child.estimate_cost > satisficity or child.actual_cost >= best_costs.get(child.state, sys.maxsize):
+                continue
+            if len(safe_states) > 0 and child.state not in safe_states and child.state != goal:
+                continue
+            if goal_test(child, goal, frontier, satisficity):
+                return get_solution(child)
+            best_costs[child.state] = child.actual_cost
+            budget = max(satisficity - child.actual_cost, sys.float_info.epsilon)
+            heappush(frontier, ((child.estimate_cost - child.actual_cost) / budget, pushed, child))
+            pushed += 1
+
+    return [], sys.maxsize
+
+
+def ara_star_solutions(start, goal, problem, safe_states, initial_weight=3.0, weight_step=0.5, heuristic=None,
+                       deadline=None):
     """
-    Generates random problem with m, p & s terrain of size from 5x5 to 100x100.
+    Anytime repairing A* (ARA*). Runs weighted A* with the heuristic inflated by
+    the initial weight, which finds a first path fast, then lowers the weight
+    step by step down to 1 (the optimal path), reusing the search effort of the
+    previous iterations each time.
+    Args:
+        start: tuple - (x,y). Start state of the agent
+        goal: tuple - (x,y). Goal state to reach.
+        problem: 2d list of MapTiles. Problem with terrain as map tiles.
+        safe_states: set of State. States the path may go through, all if empty.
+        initial_weight: float. Inflation of the heuristic of the first iteration.
+        weight_step: float. Decrease of the inflation after each iteration.
+        heuristic: function(state, goal). Admissible estimate of the cost to reach the
+        goal, the Manhattan distance `heuristic_cost` if None.
+        deadline: float. Time (as of time.time()) after which an improving iteration
+        is abandoned; the first iteration always runs to completion.
+    Returns: generator of tuple(list of Action, int, float). Path and cost found by each
+    iteration, which is at most the weight times the optimal cost, and the weight.
+    """
+    start, goal = State(start), State(goal)
+    heuristic = heuristic or heuristic_cost
+    height, width = len(problem), len(problem[0])
+    moves = [(Directions.NORTH, -1, 0), (Directions.SOUTH, 1, 0), (Directions.WEST, 0, -1), (Directions.EAST, 0, 1)]
+    target = (goal.x, goal.y)
+
+    estimates = {}
+    costs = {(start.x, start.y): 0}
+    parents = {(start.x, start.y): None}
+    weight = initial_weight
+
+    def priority(state):
+        if state not in estimates:
+            estimates[state] = heuristic(State(state), goal)
+        return costs[state] + weight * estimates[state]
+
+    opened, closed, inconsistent = {(start.x, start.y)}, set(), set()
+    # the deadline only applies once a first path was yielded
+    expanded, yielded = 0, False
+    while True:
+        frontier = [(priority(state), costs[state], state) for state in opened]
+        heapify(frontier)
+        # expand until no open state could improve the path to the goal
+        while frontier and frontier[0][0] < costs.get(target, sys.maxsize):
+            expanded += 1
+            if deadline is not None and yielded and expanded % 256 == 0 and time.time() >= deadline:
+                return
+            _, cost, state = heappop(frontier)
+            if state not in opened or cost != costs[state]:
+                continue
+            opened.discard(state)
+            closed.add(state)
+
+            for _, dx, dy in moves:
+                child = (state[0] + dx, state[1] + dy)
+                if not (0 <= child[0] < height and 0 <= child[1] < width):
+                    continue
+                step = tile_cost[problem[child[0]][child[1]]]
+                if step == sys.maxsize:
+                    continue
+                if len(safe_states) > 0 and child != target and State(child) not in safe_states:
+                    continue
+                if cost + step < costs.get(child, sys.maxsize):
+                    costs[child] = cost + step
+                    parents[child] = state
+                    if child in closed:
+                        inconsistent.add(child)
+                    else:
+                        opened.add(child)
+                        heappush(frontier, (priority(child), costs[child], child))
+
+        if target not in costs:
+            return
+        states = []
+        state = target
+        while state is not None:
+            states.insert(0, state)
+            state = parents[state]
+        directions = {(dx, dy): direction for direction, dx, dy in moves}
+        path = [Action(location=State(b), direction=directions[(b[0] - a[0], b[1] - a[1])])
+                for a, b in zip(states, states[1:])]
+        # states on the path may have been improved after the goal was reached
+        yield path, sum(tile_cost[problem[a.location.x][a.location.y]] for a in path), weight
+        yielded = True
+
+        if weight <= 1:
+            return
+        weight = max(1.0, weight - weight_step)
+        opened |= inconsistent
+        inconsistent, closed = set(), set()
+
+
+def ara_star_search(start, goal, problem, safe_states, time_limit=0.1, initial_weight=3.0, weight_step=0.5,
+                    heuristic=None):
+    """
+    Find a path from the start state to the goal state with ARA*, improving it
+    while the time limit allows. The first path is always completed, however
+    long it takes.
+    Args:
+        start: tuple - (x,y). Start state of the agent
+        goal: tuple - (x,y). Goal state to reach.
+        problem: 2d list of MapTiles. Problem with terrain as map tiles.
+        safe_states: set of State. States the path may go through, all if empty.
+        time_limit: float. Seconds to spend on improving the path.
+        initial_weight: float. Inflation of the heuristic of the first iteration.
+        weight_step: float. Decrease of the inflation after each iteration.
+        heuristic: function(state, goal). Admissible estimate of the cost to reach the
+        goal, the Manhattan distance `heuristic_cost` if None.
+    Returns: tuple(list of Action, int). Best sequence of actions found to take on
+    start state to reach the goal state and its cost.
+    """
+    deadline = time.time() + time_limit
+    best = [], sys.maxsize
+    for path, cost, _ in ara_star_solutions(start, goal, problem, safe_states, initial_weight, weight_step,
+                                            heuristic, deadline):
+        if cost < best[1]:
+            best = path, cost
+        if time.time() >= deadline:
+            break
+    return best
+
+
+def bidirectional_a_star_search(start, goal, problem, safe_states):
+    """
+    Find the optimal path from the start state to the goal state by running A*
+    forward from the start and backward from the goal at the same time. Moving
+    onto a tile costs its terrain cost, so the backward search pays the cost of
+    the tile it leaves. The search stops once the smallest estimate on either
+    frontier is no better than the best path found where the searches met.
+    Args:
+        start: tuple - (x,y). Start state of the agent
+        goal: tuple - (x,y). Goal state to reach.
+        problem: 2d list of MapTiles. Problem with terrain as map tiles.
+        safe_states: set of State. States the path may go through, all if empty.
+    Returns: tuple(list of Action, int). Sequence of actions to take on start
+    state to reach the goal state and the cost of the path.
+    """
+    start, goal = State(start), State(goal)
+    if start == goal:
+        return [], 0
+    if tile_cost[problem[goal.x][goal.y]] == sys.maxsize:
+        return [], sys.maxsize
+
+    height, width = len(problem), len(problem[0])
+    moves = [(Directions.NORTH, -1, 0), (Directions.SOUTH, 1, 0), (Directions.WEST, 0, -1), (Directions.EAST, 0, 1)]
+
+    def allowed(x, y, end):
+        if not (0 <= x < height and 0 <= y < width) or tile_cost[problem[x][y]] == sys.maxsize:
+            return False
+        return len(safe_states) == 0 or (x, y) == end or State(x, y) in safe_states
+
+    # per direction: best cost so far, parent of each state and the frontier
+    costs = [{(start.x, start.y): 0}, {(goal.x, goal.y): 0}]
+    parents = [{(start.x, start.y): None}, {(goal.x, goal.y): None}]
+    targets = [(goal.x, goal.y), (start.x, start.y)]
+    frontiers = [[(heuristic_cost(start, goal), (start.x, start.y))], [(heuristic_cost(goal, start), (goal.x, goal.y))]]
+    closed = [set(), set()]
+    best, meeting = sys.maxsize, None
+
+    while frontiers[0] and frontiers[1]:
+        if max(frontiers[0][0][0], frontiers[1][0][0]) >= best:
+            break
+        # expand the smaller frontier
+        side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+        _, state = heappop(frontiers[side])
+        if state in closed[side]:
+            continue
+        closed[side].add(state)
+
+        target = targets[side]
+        for _, dx, dy in moves:
+            child = (state[0] + dx, state[1] + dy)
+            if not allowed(child[0], child[1], target):
+                continue
+            # forward pays for the child tile, backward for the tile it leaves
+            step = problem[child[0]][child[1]] if side == 0 else problem[state[0]][state[1]]
+            child_cost = costs[side][state] + tile_cost[step]
+            if child_cost < costs[side].get(child, sys.maxsize):
+                costs[side][child] = child_cost
+                parents[side][child] = state
+                estimate = child_cost + (abs(target[0] - child[0]) + abs(target[1] - child[1])) * tile_cost[MapTiles.PATH]
+                heappush(frontiers[side], (estimate, child))
+                if child in costs[1 - side] and child_cost + costs[1 - side][child] < best:
+                    best, meeting = child_cost + costs[1 - side][child], child
+
+    record_plan('bidirectional-a-star', len(closed[0]) + len(closed[1]))
+    if meeting is None:
+        return [], sys.maxsize
+
+    states = []
+    state = meeting
+    while state is not None:
+        states.insert(0, state)
+        state = parents[0][state]
+    state = parents[1][meeting]
+    while state is not None:
+        states.append(state)
+        state = parents[1][state]
+
+    directions = {(dx, dy): direction for direction, dx, dy in moves}
+    path = [Action(location=State(b), direction=directions[(b[0] - a[0], b[1] - a[1])])
+            for a, b in zip(states, states[1:])]
+    return path, best
+
+
+def generate_test_problem(size=None, wall_density=0.0, seed=None):
+    """
+    Generates random problem with mountain, path & sand terrain (and walls, if
+    requested) of size from 5x5 to 100x100 unless the size is given.
     Selects random size of the terrain, random start and goal state.
+    Args:
+        size: int. Size of the problem terrain, random if None.
+        wall_density: float. Probability of a tile being a wall.
+        seed: int. Seed of the random generator, for reproducible problems.
     Returns: tuple(start, goal, terrain). The random problem with random terrain and states.
     """
-    size = random.randint(5, 100)
-    print(size)
-    start = (random.randint(0, size - 1), random.randint(0, size - 1))
-    print(start)
-    goal = (random.randint(0, size - 1), random.randint(0, size - 1))
-    print(goal)
-    terrain = [[random.choice(['m', 'p', 's']) for i in range(0, size)] for j in range(0, size)]
-    # print the terrain matrix if required
-    # for i in range(0, size):
-    #     print(terrain[i])
+    rng = random.Random(seed)
+    size = size if size is not None else rng.randint(5, 100)
+    weights = [(1 - wall_density) / 3] * 3 + [wall_density]
+    tiles = [MapTiles.P, MapTiles.S, MapTiles.M, MapTiles.W]
+    terrain = np.array(rng.choices(tiles, weights=weights, k=size * size), dtype=object).reshape(size, size)
+
+    # start and goal are never placed on walls
+    start = State(rng.randint(0, size - 1), rng.randint(0, size - 1))
+    goal = State(rng.randint(0, size - 1), rng.randint(0, size - 1))
+    terrain[start.x][start.y] = MapTiles.P
+    terrain[goal.x][goal.y] = MapTiles.P
 
     return (start, goal, terrain)
 
@@ -194,12 +544,12 @@ def test():
     2. (4x4)matrix, start = (0, 0), goal = (2, 2), path = SSSEEN
     3. (5x5)matrix, start = (0, 1), goal = (2, 1), path = SS
     """
-    print(a_star_search((1, 0), (2, 2), [['p', 'p', 'p'], ['p', 'm', 'p'], ['s', 's', 's']]))
-    print(a_star_search((0, 0), (2, 2),
-                        [['m', 'm', 'm', 's'], ['m', 'm', 'm', 's'], ['m', 'm', 'm', 's'], ['p', 'p', 'p', 'p']]))
-    print(
-        a_star_search((0, 1), (2, 1), [['m', 'p', 'p', 'p', 'p'], ['m', 'm', 'm', 'm', 'p'], ['m', 'p', 'm', 'm', 'p'],
-                                       ['m', 'p', 'm', 'm', 'p'], ['m', 'p', 'p', 'p', 'p']]))
+    def terrain(rows):
+        return np.array([[MapTiles[tile.upper()] for tile in row] for row in rows], dtype=object)
+
+    print(a_star_search(State(1, 0), State(2, 2), terrain(['ppp', 'pmp', 'sss']), set()))
+    print(a_star_search(State(0, 0), State(2, 2), terrain(['mmms', 'mmms', 'mmms', 'pppp']), set()))
+    print(a_star_search(State(0, 1), State(2, 1), terrain(['mpppp', 'mmmmp', 'mpmmp', 'mpmmp', 'mpppp']), set()))
 
     """
     Testing randomly generated problems
@@ -207,7 +557,7 @@ def test():
     randomTest1 = generate_test_problem()
     # log the start time before solving
     start = time.time()
-    print(a_star_search(randomTest1[0], randomTest1[1], randomTest1[2]))
+    print(a_star_search(randomTest1[0], randomTest1[1], randomTest1[2], set()))
     # log the end time after solving
     end = time.time()
     # print total time required to solve the problem
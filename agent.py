@@ -1,5 +1,11 @@
+from collections import namedtuple
+from itertools import product
+
+import random
+import time
+
 import numpy as np
-from utils import Directions
+from utils import Directions, MapTiles, object_kind
 
 
 class BaseAgent(object):
@@ -23,6 +29,86 @@ class BaseAgent(object):
         self.initial_strength = initial_strength
         self.name = name
 
+    # whether the game driver calls `observe` with the changes seen before each step
+    observes_deltas = False
+
+    # whether the agent asks a person for its moves, who needs everything printed so far to be written
+    interactive = False
+
+    # time (as of time.time()) by which the current step must return, None if unbounded
+    deadline = None
+
+    # direction taken when a step runs out of time without a plan, a random passable one if None
+    fallback_direction = None
+
+    def set_deadline(self, deadline):
+        """
+        Hook called by the game driver right before `step` when it bounds the
+        time of each step. Agents pass the deadline on to their planners and
+        fall back on `fallback` if no plan is ready in time.
+
+        Parameters
+        ----------
+        deadline: float
+            Time, as returned by time.time(), by which the step must return
+        """
+        self.deadline = deadline
+
+    def expired(self):
+        """
+        Returns
+        -------
+        expired: bool
+            Whether the deadline of the current step passed
+        """
+        return self.deadline is not None and time.time() >= self.deadline
+
+    def fallback(self, location, game_map):
+        """
+        Move made when a step runs out of time before a plan is found:
+        `fallback_direction` if set, otherwise a random direction onto a
+        known tile that is not a wall, or any direction if there is none.
+
+        Parameters
+        ----------
+        location: tuple of int
+            Current location of the agent in the map
+        game_map: numpy.ndarray
+            Map of the game as observed by the agent so far
+
+        Returns
+        -------
+        direction: Directions
+            Which direction to move
+        """
+        if self.fallback_direction is not None:
+            return self.fallback_direction
+
+        moves = {Directions.NORTH: (-1, 0), Directions.SOUTH: (1, 0),
+                 Directions.WEST: (0, -1), Directions.EAST: (0, 1)}
+        passable = []
+        for direction, (dx, dy) in moves.items():
+            x, y = location[0] + dx, location[1] + dy
+            if 0 <= x < len(game_map) and 0 <= y < len(game_map[0]) and \
+                    game_map[x][y] not in (MapTiles.W, MapTiles.U):
+                passable.append(direction)
+        return random.choice(passable or list(moves))
+
+    def observe(self, delta):
+        """
+        Hook called by the game driver right before `step`, for agents that
+        set `observes_deltas`, with what changed in the observations of the
+        agent since its previous step. Agents can keep their own model of the
+        world up to date with it instead of scanning the whole map.
+
+        Parameters
+        ----------
+        delta: WorldDelta
+            Tiles revealed, objects that appeared or left, and the positions
+            of the moving objects in sight
+        """
+        pass
+
     def step(self, location, strength, game_map, map_objects):
         """
 
@@ -45,6 +131,46 @@ class BaseAgent(object):
         """
         pass
 
+    def step_batch(self, locations, strengths, maps, objects):
+        """
+        Moves of the agent in several games at once, called by the drivers
+        playing many games in lockstep (see `driver.play_batch`) for the games
+        that share this instance. Agents backed by a vectorised policy
+        implement it to decide for all the games in one call. By default
+        `step` is called for each game in turn, which only suits agents whose
+        moves depend on their arguments alone.
+
+        Parameters
+        ----------
+        locations: list of tuple of int
+            Current location of the agent in each game
+        strengths: list of int
+            Current strength of the agent in each game
+        maps: list of numpy.ndarray
+            Map of each game as observed by the agent so far
+        objects: list of dict
+            Objects discovered by the agent so far in each game
+
+        Returns
+        -------
+        directions: list of Directions
+            Which direction to move in each game
+        """
+        return [self.step(location, strength, game_map, map_objects)
+                for location, strength, game_map, map_objects
+                in zip(locations, strengths, maps, objects)]
+
+    @classmethod
+    def batches_natively(cls):
+        """
+        Returns
+        -------
+        native: bool
+            Whether the agent implements `step_batch` itself, and can then
+            play several games at once with a single instance
+        """
+        return cls.step_batch is not BaseAgent.step_batch
+
 
 class RandomAgent(BaseAgent):
     """
@@ -89,6 +215,12 @@ class RandomAgent(BaseAgent):
         """
         return np.random.choice(list(Directions))
 
+    def step_batch(self, locations, strengths, maps, objects):
+        """
+        Random moves in several games, drawn at once
+        """
+        return list(np.random.choice(list(Directions), len(locations)))
+
 
 class HumanAgent(BaseAgent):
     """
@@ -107,6 +239,8 @@ class HumanAgent(BaseAgent):
         Name of the agent
     """
 
+    interactive = True
+
     def __init__(self, height, width, initial_strength, name='human_agent'):
         super().__init__(height=height, width=width,
                          initial_strength=initial_strength, name=name)
@@ -142,3 +276,164 @@ class HumanAgent(BaseAgent):
             dirchar = input("Please enter a direction (N/S/E/W): ").upper()
 
         return dir_dict[dirchar]
+
+
+# Changes of the world seen by an agent since its previous step: tiles revealed
+# as a dict of location -> tile, objects that appeared and objects that left as
+# dicts of location -> object, and optionally every moving object in sight as a
+# dict of location -> object (None when the moving objects are part of the
+# added and removed objects)
+WorldDelta = namedtuple('WorldDelta', ['revealed', 'added', 'removed', 'moving'], defaults=[None])
+
+
+class WorldModel(object):
+    """
+    Model of the world kept by an agent across its steps: the map known so
+    far, the objects seen and an index of their locations by kind, and the
+    visited and unvisited locations.
+
+    Only the changes since the previous step are applied, so keeping the
+    model costs time proportional to what changed rather than to the size of
+    the map. The changes either come from the game driver (`apply`, for
+    agents that observe deltas) or are found by `update`, which only looks at
+    the tiles around the agent and compares the objects location by location.
+
+    Parameters
+    ----------
+    height: int
+        Height of the game map
+    width: int
+        Width of the game map
+    radius: int
+        Distance up to which tiles are revealed around the agent
+    """
+
+    def __init__(self, height, width, radius=1):
+        self.height = height
+        self.width = width
+        self.radius = radius
+
+        self.game_map = np.full((height, width), MapTiles.U)
+        self.objects = {}
+        self.index = {kind: set() for kind in ['power_up', 'boss', 'monster', 'agent']}
+        self.static = {}
+        self.moving = {}
+        self._pending = None
+        self.visited = set()
+        self.unvisited = set(product(range(height), range(width)))
+        self.location = None
+
+    def observe(self, delta):
+        """
+        Keep the changes passed by the game driver for the next `update`.
+
+        Parameters
+        ----------
+        delta: WorldDelta
+            Changes since the previous step
+        """
+        self._pending = delta
+
+    def update(self, location, game_map, map_objects):
+        """
+        Apply what changed in the observations of the agent: the changes
+        passed to `observe` if any, or else the differences found with the
+        observations.
+
+        Parameters
+        ----------
+        location: tuple of int
+            Current location of the agent in the map
+        game_map: numpy.ndarray
+            Map of the game as observed by the agent so far
+        map_objects: dict
+            Objects discovered by the agent so far
+
+        Returns
+        -------
+        delta: WorldDelta
+            Changes applied to the model
+        """
+        if self._pending is not None:
+            delta, self._pending = self._pending, None
+            return self.apply(location, delta)
+
+        row, col = location
+        window = (slice(max(row - self.radius, 0), row + self.radius + 1),
+                  slice(max(col - self.radius, 0), col + self.radius + 1))
+        changed = np.argwhere(np.asarray(game_map[window]) != self.game_map[window])
+        revealed = {(int(i) + window[0].start, int(j) + window[1].start):
+                    game_map[i + window[0].start][j + window[1].start] for i, j in changed}
+
+        added, removed = {}, {}
+        for loc, map_object in map_objects.items():
+            previous = self.objects.get(loc)
+            if previous is None or object_kind(previous) != object_kind(map_object):
+                added[loc] = map_object
+                if previous is not None:
+                    removed[loc] = previous
+            else:
+                # the same kind of object, only its state may have changed
+                self.objects[loc] = map_object
+        for loc, map_object in self.objects.items():
+            if loc not in map_objects:
+                removed[loc] = map_object
+
+        return self.apply(location, WorldDelta(revealed, added, removed))
+
+    def apply(self, location, delta):
+        """
+        Apply the changes seen by the agent since its previous step.
+
+        Parameters
+        ----------
+        location: tuple of int
+            Current location of the agent in the map
+        delta: WorldDelta
+            Changes since the previous step
+
+        Returns
+        -------
+        delta: WorldDelta
+            The changes applied
+        """
+        location = (location[0], location[1])
+        self.location = location
+        self.visited.add(location)
+        self.unvisited.discard(location)
+
+        for (row, col), tile in delta.revealed.items():
+            self.game_map[row, col] = tile
+
+        if delta.moving is not None:
+            # the objects in sight are the static ones, hidden by any moving object on the same tile
+            for loc in delta.removed:
+                self.static.pop(loc, None)
+            self.static.update(delta.added)
+
+            added, removed = {}, {}
+            for loc in set(self.moving) | set(delta.moving) | set(delta.added) | set(delta.removed):
+                previous = self.objects.get(loc)
+                current = delta.moving.get(loc, self.static.get(loc))
+                if previous is not None and (current is None or object_kind(previous) != object_kind(current)):
+                    removed[loc] = previous
+                if current is not None and (previous is None or object_kind(previous) != object_kind(current)):
+                    added[loc] = current
+                elif current is not None:
+                    self.objects[loc] = current
+            self.moving = dict(delta.moving)
+            delta = WorldDelta(delta.revealed, added, removed, delta.moving)
+
+        for loc, map_object in delta.removed.items():
+            if loc not in delta.added:
+                self.objects.pop(loc, None)
+            kind = object_kind(map_object)
+            if kind is not None:
+                self.index[kind].discard(loc)
+        for loc, map_object in delta.added.items():
+            self.objects[loc] = map_object
+            kind = object_kind(map_object)
+            if kind is not None:
+                self.index[kind].add(loc)
+
+        return delta
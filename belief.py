@@ -0,0 +1,80 @@
+import random
+
+import numpy as np
+
+from utils import MapTiles
+
+
+class GoalBelief(object):
+    """
+    Belief of where the goal may be: a uniform distribution over the tiles that
+    are neither visited nor known to be walls.
+
+    The distribution is kept as a boolean mask and the number of tiles it
+    covers, so it is updated from the tiles around the agent only and
+    normalised on demand. Goals are sampled from the cumulative sum of the
+    mask, which is recomputed only after the mask changed.
+    """
+
+    def __init__(self, height, width):
+        """
+        Constructor
+        Args:
+            height: int. Height of the game map.
+            width: int. Width of the game map.
+        """
+        self._candidates = np.ones((height, width), dtype=bool)
+        self._count = height * width
+        self._cumulative = None
+
+    def update(self, row, col, game_map, radius=1):
+        """
+        Rule out the visited tile and the walls revealed around it.
+        Args:
+            row: int. Row of the agent.
+            col: int. Column of the agent.
+            game_map: 2d array of MapTiles. Map as observed by the agent so far.
+            radius: int. Distance up to which tiles are revealed around the agent.
+        Returns: bool. Whether the belief changed.
+        """
+        window = (slice(max(row - radius, 0), row + radius + 1), slice(max(col - radius, 0), col + radius + 1))
+        excluded = np.asarray(game_map[window]) == MapTiles.W
+        excluded[row - window[0].start, col - window[1].start] = True
+
+        candidates = self._candidates[window]
+        excluded &= candidates
+        if not excluded.any():
+            return False
+
+        candidates[excluded] = False
+        self._count -= int(np.count_nonzero(excluded))
+        self._cumulative = None
+        return True
+
+    def probability(self, row, col):
+        """
+        Returns: float. Probability of the goal being at the tile.
+        """
+        if not self._candidates[row, col]:
+            return 0.0
+        return 1.0 / self._count
+
+    def probabilities(self):
+        """
+        Returns: numpy.ndarray of float. Normalised probability of the goal being at each tile.
+        """
+        if self._count == 0:
+            return np.zeros(self._candidates.shape)
+        return self._candidates / float(self._count)
+
+    def sample(self):
+        """
+        Sample a tile from the belief.
+        Returns: tuple(int, int). Row and column of the tile, or None if every tile was ruled out.
+        """
+        if self._count == 0:
+            return None
+        if self._cumulative is None:
+            self._cumulative = np.cumsum(self._candidates, axis=None)
+        index = int(np.searchsorted(self._cumulative, random.random() * self._count, side='right'))
+        return divmod(index, self._candidates.shape[1])
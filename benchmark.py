@@ -0,0 +1,378 @@
+import json
+import os
+import platform
+import signal
+import subprocess
+import sys
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from contextlib import contextmanager
+
+import numpy as np
+
+from a_star import a_star_search, bidirectional_a_star_search, generate_test_problem
+from base import State
+from depth_limited import depth_limited_search
+from hpa_star import HierarchicalPlanner
+from landmarks import landmark_heuristic
+from metrics import PLANNER_EXPANSIONS
+from problem_solving_agent import GameMap, Location, ProblemSolvingAgent
+from utils import MapTiles
+
+PROBLEM_SIZES = [10, 20, 50, 100, 200, 500, 1000, 2000]
+WALL_DENSITIES = [0.0, 0.1, 0.3]
+
+
+class BenchmarkTimeout(Exception):
+    """
+    Raised when a planner runs longer than the time allowed for one problem
+    """
+    pass
+
+
+def run_a_star(start, goal, problem):
+    return a_star_search(start, goal, problem, set())
+
+
+def run_alt_a_star(start, goal, problem):
+    # the landmark tables are cached per map, so only the first run pays for them
+    return a_star_search(start, goal, problem, set(), landmark_heuristic(problem))
+
+
+def run_bidirectional_a_star(start, goal, problem):
+    return bidirectional_a_star_search(start, goal, problem, set())
+
+
+def run_hpa_star(start, goal, problem):
+    return HierarchicalPlanner(problem).search(start, goal)
+
+
+def run_depth_limited(start, goal, problem):
+    return depth_limited_search(start, [goal], problem)
+
+
+def run_path_searcher(start, goal, problem):
+    # Location takes (row, column) tuples and stores them as (x=column, y=row)
+    game_map = GameMap(None, problem, {})
+    game_map.set_goal(Location((goal.x, goal.y)))
+    # best_path counts the nodes expanded in the metrics, as it does for the agent
+    agent = ProblemSolvingAgent(len(problem), len(problem[0]), 100)
+    path = agent.best_path(Location((start.x, start.y)), game_map)
+    return list(path), path.cost(game_map)
+
+
+# wall times below this are too noisy to be compared against a baseline
+MIN_COMPARED_TIME = 0.01
+
+# planner name -> (runner, largest problem size it is run on, planner label its expanded nodes are recorded as)
+PLANNERS = {
+    'a-star': (run_a_star, 2000, 'a-star'),
+    'alt-a-star': (run_alt_a_star, 1000, 'a-star'),
+    'bidirectional-a-star': (run_bidirectional_a_star, 1000, 'bidirectional-a-star'),
+    'hpa-star': (run_hpa_star, 2000, 'hpa-star'),
+    'depth-limited': (run_depth_limited, 50, 'depth-limited'),
+    'depth-limited-path-searcher': (run_path_searcher, 20, 'depth-limited-path-searcher'),
+}
+
+
+# modules timed by the import benchmark, and the packages they must only import when used
+IMPORT_MODULES = ['play', 'driver', 'agent', 'problem_solving_agent', 'knowledge_based_agent', 'propositional_kb']
+LAZY_PACKAGES = ['scipy', 'sympy', 'emoji']
+
+
+def generate_corpus(sizes, densities, seed):
+    """
+    Describe the fixed-seed problems of the benchmark; the problems themselves are
+    generated on demand with `generate_test_problem`.
+    Args:
+        sizes: list of int. Sizes of the problem terrains.
+        densities: list of float. Wall densities of the problem terrains.
+        seed: int. Base seed of the corpus.
+    Returns: list of dict. Name, size, wall density and seed of every problem.
+    """
+    corpus = []
+    for size in sizes:
+        for density in densities:
+            corpus.append({'name': '%dx%d-w%02d' % (size, size, round(density * 100)),
+                           'size': size, 'wall_density': density, 'seed': seed + len(corpus)})
+    return corpus
+
+
+def nodes_expanded(label):
+    """
+    Returns: int. Nodes expanded so far by the planner, as counted by `metrics.record_plan`.
+    """
+    return int(PLANNER_EXPANSIONS.labels(label).values()[0])
+
+
+@contextmanager
+def time_limit(seconds):
+    """
+    Raise BenchmarkTimeout when the context runs longer than the given seconds.
+    Only enforced on platforms with SIGALRM.
+    """
+    if not seconds or not hasattr(signal, 'SIGALRM'):
+        yield
+        return
+
+    def expire(signum, frame):
+        raise BenchmarkTimeout()
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def run_benchmark(corpus, planners, timeout=60, repeat=3, measure_memory=True, verbose=True):
+    """
+    Run every planner on every problem of the corpus it is sized for.
+    Args:
+        corpus: list of dict. Problems as described by `generate_corpus`.
+        planners: list of str. Names of the planners in PLANNERS to run.
+        timeout: float. Seconds allowed for a planner on one problem.
+        repeat: int. Number of timed runs, the fastest of which is reported.
+        measure_memory: bool. Whether to rerun each problem under tracemalloc for its peak memory.
+        verbose: bool. Whether to print every result as it is measured.
+    Returns: list of dict. One result per planner and problem.
+    """
+    results = []
+    for spec in corpus:
+        start, goal, problem = generate_test_problem(spec['size'], spec['wall_density'], spec['seed'])
+        for name in planners:
+            runner, max_size, label = PLANNERS[name]
+            if spec['size'] > max_size:
+                continue
+
+            result = {'planner': name, 'problem': spec['name'], 'size': spec['size'],
+                      'wall_density': spec['wall_density'], 'seed': spec['seed'], 'status': 'ok',
+                      'cost': None, 'nodes_expanded': None, 'wall_time': None, 'peak_memory': None}
+            try:
+                # wall time is the best of the repeated runs, measured without any instrumentation;
+                # the planners count their expanded nodes in the metrics on every run
+                for _ in range(repeat):
+                    expanded = nodes_expanded(label)
+                    with time_limit(timeout):
+                        began = time.perf_counter()
+                        _, cost = runner(start, goal, problem)
+                        elapsed = time.perf_counter() - began
+                    result['wall_time'] = min(elapsed, result['wall_time'] or elapsed)
+                    result['nodes_expanded'] = nodes_expanded(label) - expanded
+                result['cost'] = None if cost == sys.maxsize else int(cost)
+
+                # peak memory comes from one more, traced, run
+                if measure_memory:
+                    tracemalloc.start()
+                    try:
+                        with time_limit(timeout * 4):
+                            runner(start, goal, problem)
+                        result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+                    finally:
+                        tracemalloc.stop()
+            except BenchmarkTimeout:
+                result['status'] = 'timeout'
+            except ValueError:
+                # DepthLimitedPathSearcher raises when it has nowhere to go
+                result['status'] = 'no-path'
+
+            if verbose:
+                print('%-28s %-14s %-8s cost=%-8s nodes=%-10s time=%-10s memory=%s' % (
+                    name, spec['name'], result['status'], result['cost'], result['nodes_expanded'],
+                    '%.4fs' % result['wall_time'] if result['wall_time'] is not None else None,
+                    result['peak_memory']))
+            results.append(result)
+    return results
+
+
+def compare(results, baseline, tolerance=1.25):
+    """
+    Compare results against a baseline run of the same corpus.
+    Args:
+        results: list of dict. Results of the current run.
+        baseline: list of dict. Results of the baseline run.
+        tolerance: float. Allowed ratio of time, memory and expanded nodes over the baseline.
+    Returns: list of str. A description of every regression found.
+    """
+    previous = {(r['planner'], r['problem']): r for r in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get((result['planner'], result['problem']))
+        if old is None or old['status'] != 'ok':
+            continue
+        label = '%s on %s' % (result['planner'], result['problem'])
+        if result['status'] != 'ok':
+            regressions.append('%s: %s (was ok)' % (label, result['status']))
+            continue
+        if old['cost'] is not None and (result['cost'] is None or result['cost'] > old['cost']):
+            regressions.append('%s: cost %s (was %s)' % (label, result['cost'], old['cost']))
+        for key in ['wall_time', 'peak_memory', 'nodes_expanded']:
+            if key == 'wall_time' and max(old[key], result[key]) < MIN_COMPARED_TIME:
+                continue
+            if old[key] and result[key] and result[key] > old[key] * tolerance:
+                regressions.append('%s: %s %.4g (was %.4g)' % (label, key, result[key], old[key]))
+    return regressions
+
+
+def exploration_problem():
+    """
+    A 6x6 sand map with an unknown first row and two path tiles at (3,3) and (3,4), where going
+    back and forth on the path tiles costs nothing but explores nothing.
+    Returns: tuple(State, State, numpy.ndarray). The start, the goal and the problem.
+    """
+    problem = np.full((6, 6), MapTiles.S, dtype=object)
+    problem[0, :] = MapTiles.U
+    problem[3, 3] = problem[3, 4] = MapTiles.P
+    return State((3, 3)), State((0, 0)), problem
+
+
+def check_exploration():
+    """
+    Check that the depth-limited search reaches an unknown tile of the exploration problem;
+    anything else is a regression even without a baseline.
+    Returns: list of str. A description of the regression, if any.
+    """
+    start, goal, problem = exploration_problem()
+    path, cost = depth_limited_search(start, [goal], problem)
+    if len(path) == 0 or problem[path[-1].location.x][path[-1].location.y] != MapTiles.U:
+        return ['depth-limited on the exploration problem: %s with cost %s reaches no unknown tile' % (
+            ', '.join(action.direction.name for action in path), cost)]
+    return []
+
+
+def run_import_benchmark(modules, repeat=3, verbose=True):
+    """
+    Import each module in a fresh interpreter under `python -X importtime`.
+    Args:
+        modules: list of str. Names of the modules to import.
+        repeat: int. Number of imports per module, the fastest of which is reported.
+        verbose: bool. Whether to print every result as it is measured.
+    Returns: list of dict. Module, import time in seconds and lazy packages imported along.
+    """
+    results = []
+    for module in modules:
+        result = {'module': module, 'status': 'ok', 'import_time': None, 'lazy_imports': []}
+        for _ in range(repeat):
+            process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                                     cwd=os.path.dirname(os.path.abspath(__file__)),
+                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+            if process.returncode != 0:
+                result['status'] = 'error'
+                break
+            # lines read "import time: self [us] | cumulative | imported package"
+            elapsed, imported = 0, set()
+            for line in process.stderr.splitlines():
+                fields = line.split('|')
+                if not line.startswith('import time:') or not fields[1].strip().isdigit():
+                    continue
+                name = fields[2].strip()
+                imported.add(name.split('.')[0])
+                if name == module:
+                    elapsed = int(fields[1]) / 1e6
+            result['import_time'] = min(elapsed, result['import_time'] or elapsed)
+            result['lazy_imports'] = sorted(imported.intersection(LAZY_PACKAGES))
+
+        if verbose:
+            print('%-28s %-8s time=%-10s lazy imports=%s' % (
+                module, result['status'],
+                '%.4fs' % result['import_time'] if result['import_time'] is not None else None,
+                ','.join(result['lazy_imports']) or None))
+        results.append(result)
+    return results
+
+
+def compare_imports(results, baseline, tolerance=1.25):
+    """
+    Check the import times against a baseline run, and that no module imports
+    a lazy package at load time.
+    Args:
+        results: list of dict. Results of the current run.
+        baseline: list of dict. Results of the baseline run, may be empty.
+        tolerance: float. Allowed ratio of import time over the baseline.
+    Returns: list of str. A description of every regression found.
+    """
+    previous = {r['module']: r for r in baseline}
+    regressions = []
+    for result in results:
+        if result['status'] != 'ok':
+            regressions.append('import of %s: %s' % (result['module'], result['status']))
+            continue
+        if result['lazy_imports']:
+            regressions.append('import of %s: loads %s' % (result['module'], ', '.join(result['lazy_imports'])))
+        old = previous.get(result['module'])
+        if old is None or old['status'] != 'ok' or max(old['import_time'], result['import_time']) < MIN_COMPARED_TIME:
+            continue
+        if result['import_time'] > old['import_time'] * tolerance:
+            regressions.append('import of %s: import_time %.4g (was %.4g)' % (
+                result['module'], result['import_time'], old['import_time']))
+    return regressions
+
+
+def main(args):
+    parser = ArgumentParser(description='Benchmark the path planners on a fixed-seed problem corpus')
+
+    parser.add_argument('--sizes', type=int, nargs='+', default=PROBLEM_SIZES,
+                        help='Sizes of the problem terrains')
+    parser.add_argument('--wall-densities', type=float, nargs='+', default=WALL_DENSITIES,
+                        help='Wall densities of the problem terrains')
+    parser.add_argument('--planners', nargs='+', choices=list(PLANNERS), default=list(PLANNERS),
+                        help='Planners to benchmark')
+    parser.add_argument('--seed', type=int, default=671,
+                        help='Base seed of the problem corpus')
+    parser.add_argument('--timeout', type=float, default=60,
+                        help='Seconds allowed for a planner on one problem')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of timed runs per planner and problem')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='Skip the tracemalloc run that measures peak memory')
+    parser.add_argument('--output', type=str,
+                        help='Path of the JSON file to save the results to')
+    parser.add_argument('--baseline', type=str,
+                        help='Path of a JSON file with baseline results to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help='Allowed ratio of time, memory and expanded nodes over the baseline')
+    parser.add_argument('--imports', action='store_true',
+                        help='Benchmark the import time of the game modules instead of the planners')
+
+    args = parser.parse_args(args)
+
+    if args.imports:
+        key = 'imports'
+        results = run_import_benchmark(IMPORT_MODULES, repeat=args.repeat)
+    else:
+        key = 'results'
+        corpus = generate_corpus(args.sizes, args.wall_densities, args.seed)
+        results = run_benchmark(corpus, args.planners, timeout=args.timeout, repeat=args.repeat,
+                                measure_memory=not args.no_memory)
+
+    if args.output:
+        report = {'python': platform.python_version(), 'machine': platform.platform(),
+                  'seed': args.seed, key: results}
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    baseline = []
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f).get(key, [])
+    # modules loading lazy packages are regressions even without a baseline
+    if args.imports:
+        regressions = compare_imports(results, baseline, args.tolerance)
+    else:
+        regressions = compare(results, baseline, args.tolerance)
+        if 'depth-limited' in args.planners:
+            regressions.extend(check_exploration())
+    for regression in regressions:
+        print('REGRESSION', regression)
+    if regressions:
+        return 1
+    if args.baseline:
+        print('No regressions against', args.baseline)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
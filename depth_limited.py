@@ -1,50 +1,137 @@
-import copy
 import math
 import random
 import sys
+import time
 
 from base import Action, PathCost
+from metrics import record_plan
+from tracing import tracer
 from utils import MapTiles, Directions
 
 
 class DepthLimitedSearch(object):
+    """
+    Depth-limited search over the paths leaving the start. A path ends when it
+    steps onto an unknown tile, reaches the depth limit or cannot be extended;
+    the search returns the cheapest of these paths.
+
+    Paths that reach an unknown tile rank before the paths that do not, then
+    the cheapest and, between paths of the same cost, the shortest. The best
+    cost-to-go then only depends on the tile and the number of steps left, so
+    it is kept in a transposition table keyed by (tile, remaining depth) and
+    every state is evaluated once, whatever the paths leading to it. A path
+    that reaches an unknown tile after crossing a tile twice never wins: the
+    path without the detour reaches it too, is shorter, and costs no more.
+    The search deepens iteratively and stops as soon as a path of cost -1 is
+    found (an unknown tile reached over zero-cost tiles), as nothing deeper
+    can beat it.
+
+    Entries of states whose subtree never comes close to the row or column of
+    the goal expand the same way for any goal, and are shared by the searches
+    of every goal on the same map.
+
+    Given a deadline, the search returns the best path of the deepest
+    iteration it completed in time.
+    """
 
     def __init__(self, problem, depth_limit):
         self.problem = problem
         self.depth_limit = depth_limit
+        # (location, remaining depth) -> (cost-to-go, best action, whether it reaches an unknown
+        # tile, steps), valid for every goal
+        self._shared = {}
+        # number of states evaluated so far, and the deepest limit any search completed
+        self.expanded = 0
+        self.depth_reached = 0
+        # whether a search ran out of time before its last iteration
+        self.timed_out = False
+
+    def search(self, start, goal, deadline=None):
+        # entries of this goal only
+        table = {}
+        for limit in range(self.depth_limit + 1):
+            # the start is at depth 0, paths stop once they are deeper than the limit;
+            # the first iteration only looks at the neighbours and always completes
+            cost = self._cost_to_go(start, limit + 1, goal, table, deadline if limit > 0 else None)
+            if cost is None:
+                # out of time, fall back on the previous iteration
+                limit -= 1
+                cost = self._entries(start, limit + 1, goal, table)[(start, limit + 1)][0]
+                self.timed_out = True
+                break
+            if cost < 0 or (deadline is not None and time.time() >= deadline):
+                break
+        self.depth_reached = max(self.depth_reached, limit)
 
-    def search(self, start, goal):
-        paths = self._search([], start, goal, 0)
-        path_costs = [PathCost(path=path, cost=self.cost(path)) for path in paths]
-        sorted(path_costs, key=lambda x: x.cost)
-        return path_costs[0] if len(path_costs) > 0 else None
-
-    def _search(self, past_path, current_location, goal, depth):
-        children = self.expand(current_location, goal)
-        if len(children) == 0 or depth > self.depth_limit:
-            return [past_path, ]
-
-        past_locations = [l for l, _ in past_path]
-        results = []
-        for child in children:
-            if child.location in past_locations:
+        path, location, remaining = [], start, limit + 1
+        while True:
+            action = self._entries(location, remaining, goal, table)[(location, remaining)][1]
+            if action is None:
+                break
+            path.append(action)
+            if self.is_unknown(action.location):
+                break
+            location, remaining = action.location, remaining - 1
+
+        return PathCost(path=path, cost=cost)
+
+    def _entries(self, location, remaining, goal, table):
+        # the subtree only expands tiles less than `remaining` steps away
+        if abs(location.x - goal.x) >= remaining and abs(location.y - goal.y) >= remaining:
+            return self._shared
+        return table
+
+    def _cost_to_go(self, start, depth, goal, table, deadline=None):
+        # post-order evaluation with an explicit stack of (location, remaining depth, children);
+        # None if the deadline passed first, the entries stored so far stay valid
+        stack, visits = [(start, depth, None)], 0
+        while len(stack) > 0:
+            visits += 1
+            if deadline is not None and visits % 256 == 0 and time.time() >= deadline:
+                return None
+            location, remaining, children = stack[-1]
+            entries = self._entries(location, remaining, goal, table)
+            if (location, remaining) in entries:
+                stack.pop()
                 continue
 
-            path = copy.deepcopy(past_path)
-            path.append(child)
-
-            if self.is_unknown(child.location):
-                results.append(path)
-            else:
-                for p in self._search(path, child.location, goal, depth + 1):
-                    results.append(p)
-
-        return results if len(results) > 0 else [past_path, ]
+            if children is None:
+                children = self.expand(location, goal) if remaining > 0 else []
+                stack[-1] = (location, remaining, children)
+                pending = [(child.location, remaining - 1, None) for child in children
+                           if not self.is_unknown(child.location) and
+                           (child.location, remaining - 1) not in
+                           self._entries(child.location, remaining - 1, goal, table)]
+                if len(pending) > 0:
+                    stack.extend(pending)
+                    continue
+
+            best = (0, None, False, 0)
+            for child in children:
+                if self.is_unknown(child.location):
+                    entry = (-1, child, True, 1)
+                else:
+                    cost, _, explores, steps = \
+                        self._entries(child.location, remaining - 1, goal, table)[(child.location, remaining - 1)]
+                    entry = (self.tile_value(child.location) + cost, child, explores, steps + 1)
+                if best[1] is None or rank(entry) < rank(best):
+                    best = entry
+            entries[(location, remaining)] = best
+            stack.pop()
+            self.expanded += 1
+
+        return self._entries(start, depth, goal, table)[(start, depth)][0]
+
+    def explores(self, path):
+        """
+        Returns: bool. Whether the path ends on an unknown tile.
+        """
+        return len(path) > 0 and self.is_unknown(path[-1].location)
 
     def cost(self, path):
         costs = 0
         for location, direction in path:
-            tile = self.problem[location.y][location.x]
+            tile = self.problem[location.x][location.y]
             if tile == MapTiles.U:
                 costs = costs - 1
                 break
@@ -53,6 +140,9 @@ class DepthLimitedSearch(object):
 
         return costs
 
+    def tile_value(self, location):
+        return self.problem[location.x][location.y].value
+
     def expand(self, cur_loc, goal):
         children = []
 
@@ -84,18 +174,51 @@ class DepthLimitedSearch(object):
         return tile == MapTiles.U
 
 
-def depth_limited_search(start, goals, problem):
+def rank(entry):
+    """
+    Order of the entries of the transposition table: the paths reaching an unknown tile first,
+    then by cost and by number of steps.
+    """
+    cost, _, explores, steps = entry
+    return not explores, cost, steps
+
+
+def depth_limited_search(start, goals, problem, deadline=None):
     shape = problem.shape
     depth_limit = int(math.sqrt(shape[0] * shape[1]) / 2)
 
+    goals = [goal for goal in goals if goal is not None]
     if len(goals) > depth_limit:
-        goals = random.choices(list(goals), k=depth_limit)
+        goals = random.sample(goals, k=depth_limit)
 
+    trace = tracer()
+    started = time.perf_counter() if trace is not None else None
+
+    # one searcher for every goal, so that they share its transposition table
     searcher = DepthLimitedSearch(problem, depth_limit=depth_limit)
-    path_costs = [x for x in [searcher.search(start, goal) for goal in goals if goal is not None] if x is not None]
-    sorted(path_costs, key=lambda x: x[1], reverse=True)
-    if len(path_costs) == 0:
-        return [], sys.maxsize
 
-    best_decision = path_costs[0]
+    def ranked(path_cost):
+        return rank((path_cost.cost, None, searcher.explores(path_cost.path), len(path_cost.path)))
+
+    best_decision, attempted = None, 0
+    for goal in goals:
+        attempted += 1
+        path_cost = searcher.search(start, goal, deadline)
+        if best_decision is None or ranked(path_cost) < ranked(best_decision):
+            best_decision = path_cost
+        if best_decision.cost < 0:
+            # no path can cost less than -1
+            break
+        if deadline is not None and time.time() >= deadline:
+            # keep the best of the goals searched in time
+            break
+
+    record_plan('depth-limited', searcher.expanded)
+    if trace is not None:
+        trace.record('depth-limited', started, start=start, goals=len(goals), goals_attempted=attempted,
+                     expanded=searcher.expanded, shared_entries=len(searcher._shared), depth_limit=depth_limit,
+                     depth_reached=searcher.depth_reached, cost=best_decision.cost if best_decision else sys.maxsize,
+                     timed_out=searcher.timed_out or (deadline is not None and attempted < len(goals)))
+    if best_decision is None:
+        return [], sys.maxsize
     return best_decision.path, best_decision.cost
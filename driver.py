@@ -1,13 +1,53 @@
 import os
 import json
+import time
+from functools import lru_cache
 from itertools import cycle, product
 
 import numpy as np
-import scipy.signal as signal
-import emoji as em
 
 import utils
-from agent import BaseAgent
+from agent import BaseAgent, WorldDelta
+from metrics import AGENT_STEP_SECONDS, GAME_STEPS, GAMES
+from observation import ObservedMap, RevealMask
+from output import default_writer
+from world import ChunkedWorld
+from tracing import tracer
+
+
+@lru_cache(maxsize=None)
+def emoji_dict():
+    """
+    Emojis of the tiles and objects of emoji maps. The emoji package is only
+    imported the first time an emoji map is displayed.
+    """
+    import emoji as em
+
+    return {
+        utils.MapTiles.UNKNOWN:
+            em.emojize(':white_large_square:', use_aliases=True),
+        utils.MapTiles.MOUNTAIN:
+            em.emojize(':mountain:', use_aliases=True),
+        utils.MapTiles.SAND:
+            em.emojize(':palm_tree:', use_aliases=True),
+        utils.MapTiles.PATH:
+            em.emojize(':black_large_square:', use_aliases=True),
+        utils.MapTiles.WALL:
+            em.emojize(':construction:', use_aliases=True),
+        'other_agent':
+            em.emojize(':bust_in_silhouette:', use_aliases=True),
+        'agent':
+            em.emojize(':alien:', use_aliases=True),
+        'dynamic_monster':
+            em.emojize(':smiling_imp:', use_aliases=True),
+        'monster':
+            em.emojize(':imp:', use_aliases=True),
+        'powerup':
+            em.emojize(':heartpulse:', use_aliases=True),
+        'boss':
+            em.emojize(':guardsman:', use_aliases=True),
+        'deadagent':
+            em.emojize(':skull:', use_aliases=True)}
 
 
 class GameDriver(object):
@@ -38,13 +78,29 @@ class GameDriver(object):
         Directory in which to save the generated map
     map_file: (optional) str
         Map (JSON) file to load the game map
+    step_time: (optional) float
+        Time budget of each step of an agent in seconds, passed on to the
+        agents as a deadline; unbounded if None
+    chunk_size: (optional) int
+        Size of the chunks of a world generated lazily in a memory-mapped
+        file instead of in memory, for maps too large to hold; see
+        `world.ChunkedWorld`
+    world_seed: (optional) int
+        Seed of the chunked world, drawn from numpy.random if None
+    world_file: (optional) str
+        File of the chunked world, a temporary file if None
+    output: (optional) output.OutputWriter
+        Writer of the messages and maps of the game, the writer shared by
+        the drivers if None
 
     """
 
     def __init__(self, height, width, num_powerups, num_monsters,
                  num_dynamic_monsters, agents,
                  initial_strength, show_map, map_type,
-                 save_dir=None, map_file=None):
+                 save_dir=None, map_file=None, step_time=None,
+                 chunk_size=None, world_seed=None, world_file=None,
+                 output=None):
         objects_count = num_monsters + num_powerups + num_dynamic_monsters + 1
         assert objects_count <= height * width, \
             'Number of objects in the map should be less than the number of ' \
@@ -66,337 +122,473 @@ class GameDriver(object):
         self.objects = {}
         self.dynamic_monsters = {}
 
+        # tiles revealed to each agent, and their views of the game map through them
+        self.agent_masks = []
         self.agent_maps = []
         self.agent_objects = []
         self.agent_moving_objects = [{}] * len(agents)
+        # changes seen by each agent since its previous step, for the agents observing deltas
+        self.agent_revealed = [{} for _ in agents]
+        self.agent_added_objects = [{} for _ in agents]
+        self.agent_removed_objects = [{} for _ in agents]
         self.agent_locations = []
         self.agent_strengths = [initial_strength] * len(agents)
         self.agent_max_strengths = [initial_strength] * len(agents)
         self.agent_final_locs = [[]] * len(agents)
+        # number of steps each agent took longer than the step time
+        self.agent_overruns = [0] * len(agents)
+        self.step_time = step_time
+        # number of steps played so far
+        self.steps = 0
 
         self.map_file = map_file
+        self.chunk_size = chunk_size
+        self.world_seed = world_seed
+        self.world_file = world_file
         self.show_map = show_map
         self.map_type = map_type
+        self.output = output if output is not None else default_writer()
 
-        print('Initializing the game')
+        self.output.info('Initializing the game')
         self.initialize_game()
         if save_dir is not None:
             self.save_map(save_dir)
 
     def play(self, verbose=False):
-        step = -1
+        try:
+            self.play_steps(verbose)
+        finally:
+            # the game is only over once everything it printed is written
+            self.output.flush()
+
+    def play_steps(self, verbose=False):
         while True:
-            step += 1
-            for idx, agent in enumerate(self.agents):
-                # check if the agent is still alive
-                if self.agent_strengths[idx] <= 0:
-                    # agent has died
-                    continue
-                # first update the map for each agent
-                curr_loc = self.agent_locations[idx]
-                self.agent_moving_objects[idx] = {}
-
-                for i, j in product(*[[-1, 0, 1]] * 2):
-                    new_i = curr_loc[0] + i
-                    new_j = curr_loc[1] + j
-
-                    if 0 <= new_i < self.height and 0 <= new_j < self.width:
-                        if (self.agent_maps[idx][new_i, new_j] ==
-                                utils.MapTiles.U):
-                            if (i == -1 and j == -1 and
-                                    self.nwblocks[curr_loc[0], curr_loc[1]] > 0):
-                                # north west walls are blocking
-                                continue
-                            elif (i == -1 and j == 1 and
-                                  self.neblocks[curr_loc[0], curr_loc[1]] > 0):
-                                # north east walls are blocking
-                                continue
-                            elif (i == 1 and j == -1 and
-                                  self.swblocks[curr_loc[0], curr_loc[1]] > 0):
-                                # south west walls are blocking
-                                continue
-                            elif (i == 1 and j == 1 and
-                                  self.seblocks[curr_loc[0], curr_loc[1]] > 0):
-                                # south east walls are blocking
-                                continue
-                            # no walls are blocking
-                            self.agent_maps[idx][new_i, new_j] = \
-                                self.game_map[new_i, new_j]
-                    if (new_i, new_j) in self.objects:
-                        self.agent_objects[idx][(new_i, new_j)] = \
+            observations = self.start_step(verbose)
+            directions = {}
+            for idx, observation in observations.items():
+                directions[idx] = step_agents(
+                    self.agents[idx], [(self, idx, observation)])[0]
+            self.finish_step(directions, verbose)
+
+    def start_step(self, verbose=False):
+        """
+        Start a step of the game: reveal the surroundings of the agents and
+        gather what each of them observes
+
+        Returns
+        -------
+        observations: dict
+            For each agent alive, by index, the arguments of its `step` as a
+            tuple (location, strength, game_map, map_objects)
+        """
+        self.steps += 1
+        step = self.steps - 1
+        for idx, agent in enumerate(self.agents):
+            # check if the agent is still alive
+            if self.agent_strengths[idx] <= 0:
+                # agent has died
+                continue
+            # first update the map for each agent
+            curr_loc = self.agent_locations[idx]
+            self.agent_moving_objects[idx] = {}
+            nwblock, neblock, seblock, swblock = \
+                self.diagonal_blocks(curr_loc)
+
+            for i, j in product(*[[-1, 0, 1]] * 2):
+                new_i = curr_loc[0] + i
+                new_j = curr_loc[1] + j
+
+                if 0 <= new_i < self.height and 0 <= new_j < self.width:
+                    if not self.agent_masks[idx].is_revealed(new_i, new_j):
+                        if i == -1 and j == -1 and nwblock:
+                            # north west walls are blocking
+                            continue
+                        elif i == -1 and j == 1 and neblock:
+                            # north east walls are blocking
+                            continue
+                        elif i == 1 and j == -1 and swblock:
+                            # south west walls are blocking
+                            continue
+                        elif i == 1 and j == 1 and seblock:
+                            # south east walls are blocking
+                            continue
+                        # no walls are blocking
+                        self.agent_masks[idx].reveal(new_i, new_j)
+                        self.agent_revealed[idx][(new_i, new_j)] = \
+                            self.game_map[new_i, new_j]
+                if (new_i, new_j) in self.objects:
+                    if (new_i, new_j) not in self.agent_objects[idx]:
+                        self.agent_added_objects[idx][(new_i, new_j)] = \
                             self.objects[(new_i, new_j)]
-                    if (new_i, new_j) in self.dynamic_monsters:
+                    self.agent_objects[idx][(new_i, new_j)] = \
+                        self.objects[(new_i, new_j)]
+                if (new_i, new_j) in self.dynamic_monsters:
+                    self.agent_moving_objects[idx][(new_i, new_j)] = \
+                        self.dynamic_monsters[(new_i), (new_j)]
+                for jdx in range(len(self.agents)):
+                    if (jdx != idx and
+                            self.agent_locations[jdx] == (new_i, new_j)):
+                        # if the other agent is visible, add an agent
+                        # placeholder to the list of objects for current
+                        # agent
                         self.agent_moving_objects[idx][(new_i, new_j)] = \
-                            self.dynamic_monsters[(new_i), (new_j)]
-                    for jdx in range(len(self.agents)):
-                        if (jdx != idx and
-                                self.agent_locations[jdx] == (new_i, new_j)):
-                            # if the other agent is visible, add an agent
-                            # placeholder to the list of objects for current
-                            # agent
-                            self.agent_moving_objects[idx][(new_i, new_j)] = \
-                                utils.AgentPlaceholder(
-                                    self.agent_strengths[jdx])
-
-            for idx, agent in enumerate(self.agents):
-                # check if the agent is still alive
-                if self.agent_strengths[idx] <= 0:
-                    # agent has died
-                    continue
-                # call each agent and find its final location
-                if verbose:
-                    print('-' * 40)
-                    print(
-                        f'Playing step {step + 1} for {self.agents[idx].name}')
-                    print('\tCurrent location is', curr_loc)
-                    print('\tCurrent strength is', self.agent_strengths[idx])
-                if self.show_map:
-                    self.display_map(idx)
-
-                objects_to_pass = {}
-                objects_to_pass.update(self.agent_objects[idx])
-                objects_to_pass.update(self.agent_moving_objects[idx])
-                direction = agent.step(
-                    location=self.agent_locations[idx],
-                    strength=self.agent_strengths[idx],
-                    game_map=self.agent_maps[idx],
-                    map_objects=objects_to_pass)
-
-                if verbose:
-                    print('{} selected to move in the {} direction.'.format(
-                        self.agents[idx].name, direction.name))
-
-                assert isinstance(direction, utils.Directions), \
-                    'Wrong type of direction returned'
-
-                if direction == utils.Directions.NORTH:
-                    dst_loc = (curr_loc[0] - 1, curr_loc[1])
-                elif direction == utils.Directions.WEST:
-                    dst_loc = (curr_loc[0], curr_loc[1] - 1)
-                elif direction == utils.Directions.SOUTH:
-                    dst_loc = (curr_loc[0] + 1, curr_loc[1])
-                else:
-                    dst_loc = (curr_loc[0], curr_loc[1] + 1)
-
-                if not (0 <= dst_loc[0] < self.height and
-                        0 <= dst_loc[1] < self.width):
-                    # agent tried to move outside of the map
-                    final_loc = curr_loc
-                    self.agent_strengths[idx] -= 1
-                elif (self.game_map[dst_loc[0], dst_loc[1]] ==
-                      utils.MapTiles.WALL):
-                    # agent hit a wall
-                    final_loc = curr_loc
-                    self.agent_strengths[idx] -= 1
-                elif (self.agent_strengths[idx] <
-                      utils.tile_cost[self.game_map[dst_loc[0], dst_loc[1]]]):
-                    # agent does not have enough strength to make the move
-                    final_loc = curr_loc
-                    self.agent_strengths[idx] -= 1
-                else:
-                    # agent moved normally
-                    final_loc = dst_loc
-                    self.agent_strengths[idx] -= \
-                        utils.tile_cost[self.game_map[dst_loc[0], dst_loc[1]]]
-                self.agent_final_locs[idx] = final_loc
-
-            for curr_loc, dynmon in self.dynamic_monsters.items():
-                # move the dynamic monsters to new locations
-                direction = dynmon.move()
-
-                if direction == utils.Directions.NORTH:
-                    dst_loc = (curr_loc[0] - 1, curr_loc[1])
-                elif direction == utils.Directions.WEST:
-                    dst_loc = (curr_loc[0], curr_loc[1] - 1)
-                elif direction == utils.Directions.SOUTH:
-                    dst_loc = (curr_loc[0] + 1, curr_loc[1])
-                else:
-                    dst_loc = (curr_loc[0], curr_loc[1] + 1)
-
-                if not (0 <= dst_loc[0] < self.height and
-                        0 <= dst_loc[1] < self.width):
-                    # dynamic monster tried to move outside of the map
-                    final_loc = curr_loc
-                elif (self.game_map[dst_loc[0], dst_loc[1]] ==
-                      utils.MapTiles.WALL):
-                    # dynamic monster hit a wall
-                    final_loc = curr_loc
-                elif dst_loc in self.dynamic_monsters:
-                    # a dynamic monster is currently in this tile
-                    final_loc = curr_loc
-                else:
-                    # dynamic monster moved normally
-                    final_loc = dst_loc
-
-                if final_loc != curr_loc:
-                    # move the monster
-                    self.dynamic_monsters[final_loc] = \
-                        self.dynamic_monsters[curr_loc]
-                    del self.dynamic_monsters[curr_loc]
-
-            for idx in range(1, len(self.agents)):
-                # check if the agent idx is still alive
-                if self.agent_strengths[idx] <= 0:
+                            utils.AgentPlaceholder(
+                                self.agent_strengths[jdx])
+
+        observations = {}
+        for idx, agent in enumerate(self.agents):
+            # check if the agent is still alive
+            if self.agent_strengths[idx] <= 0:
+                # agent has died
+                continue
+            if verbose:
+                self.output.debug('-' * 40)
+                self.output.debug('Playing step %d for %s', step + 1,
+                                  self.agents[idx].name)
+                self.output.debug('\tCurrent location is %s',
+                                  self.agent_locations[idx])
+                self.output.debug('\tCurrent strength is %s',
+                                  self.agent_strengths[idx])
+            if self.show_map and self.output.wants_frame(step):
+                self.display_map(idx)
+            if agent.interactive:
+                # the player needs to see the map before choosing
+                self.output.flush()
+
+            if agent.observes_deltas:
+                agent.observe(self.pop_delta(idx))
+
+            objects_to_pass = {}
+            objects_to_pass.update(self.agent_objects[idx])
+            objects_to_pass.update(self.agent_moving_objects[idx])
+            observations[idx] = (self.agent_locations[idx],
+                                 self.agent_strengths[idx],
+                                 self.agent_maps[idx], objects_to_pass)
+        return observations
+
+    def finish_step(self, directions, verbose=False):
+        """
+        Finish a step of the game: move the agents and the dynamic monsters,
+        and resolve the fights
+
+        Parameters
+        ----------
+        directions: dict
+            Direction chosen by each agent alive, by index
+
+        Raises
+        ------
+        StopIteration
+            When an agent won the game or all of them have died
+        """
+        for idx, direction in directions.items():
+            curr_loc = self.agent_locations[idx]
+            if verbose:
+                self.output.debug('%s selected to move in the %s direction.',
+                                  self.agents[idx].name, direction.name)
+
+            assert isinstance(direction, utils.Directions), \
+                'Wrong type of direction returned'
+
+            if direction == utils.Directions.NORTH:
+                dst_loc = (curr_loc[0] - 1, curr_loc[1])
+            elif direction == utils.Directions.WEST:
+                dst_loc = (curr_loc[0], curr_loc[1] - 1)
+            elif direction == utils.Directions.SOUTH:
+                dst_loc = (curr_loc[0] + 1, curr_loc[1])
+            else:
+                dst_loc = (curr_loc[0], curr_loc[1] + 1)
+
+            if not (0 <= dst_loc[0] < self.height and
+                    0 <= dst_loc[1] < self.width):
+                # agent tried to move outside of the map
+                final_loc = curr_loc
+                self.agent_strengths[idx] -= 1
+            elif (self.game_map[dst_loc[0], dst_loc[1]] ==
+                  utils.MapTiles.WALL):
+                # agent hit a wall
+                final_loc = curr_loc
+                self.agent_strengths[idx] -= 1
+            elif (self.agent_strengths[idx] <
+                  utils.tile_cost[self.game_map[dst_loc[0], dst_loc[1]]]):
+                # agent does not have enough strength to make the move
+                final_loc = curr_loc
+                self.agent_strengths[idx] -= 1
+            else:
+                # agent moved normally
+                final_loc = dst_loc
+                self.agent_strengths[idx] -= \
+                    utils.tile_cost[self.game_map[dst_loc[0], dst_loc[1]]]
+            self.agent_final_locs[idx] = final_loc
+
+        for curr_loc, dynmon in list(self.dynamic_monsters.items()):
+            # move the dynamic monsters to new locations
+            direction = dynmon.move()
+
+            if direction == utils.Directions.NORTH:
+                dst_loc = (curr_loc[0] - 1, curr_loc[1])
+            elif direction == utils.Directions.WEST:
+                dst_loc = (curr_loc[0], curr_loc[1] - 1)
+            elif direction == utils.Directions.SOUTH:
+                dst_loc = (curr_loc[0] + 1, curr_loc[1])
+            else:
+                dst_loc = (curr_loc[0], curr_loc[1] + 1)
+
+            if not (0 <= dst_loc[0] < self.height and
+                    0 <= dst_loc[1] < self.width):
+                # dynamic monster tried to move outside of the map
+                final_loc = curr_loc
+            elif (self.game_map[dst_loc[0], dst_loc[1]] ==
+                  utils.MapTiles.WALL):
+                # dynamic monster hit a wall
+                final_loc = curr_loc
+            elif dst_loc in self.dynamic_monsters:
+                # a dynamic monster is currently in this tile
+                final_loc = curr_loc
+            else:
+                # dynamic monster moved normally
+                final_loc = dst_loc
+
+            if final_loc != curr_loc:
+                # move the monster
+                self.dynamic_monsters[final_loc] = \
+                    self.dynamic_monsters[curr_loc]
+                del self.dynamic_monsters[curr_loc]
+
+        for idx in range(1, len(self.agents)):
+            # check if the agent idx is still alive
+            if self.agent_strengths[idx] <= 0:
+                # agent has died
+                continue
+
+            for jdx in range(0, idx):
+                # check if the agent jdx is still alive
+                if self.agent_strengths[jdx] <= 0:
                     # agent has died
                     continue
-
-                for jdx in range(0, idx):
-                    # check if the agent jdx is still alive
-                    if self.agent_strengths[jdx] <= 0:
-                        # agent has died
+                # see if two agents decided to move to the same square
+                if self.agent_final_locs[idx] == self.agent_final_locs[jdx]:
+                    # the two agents should fight
+                    strength_denom = self.agent_strengths[idx] + \
+                        self.agent_strengths[jdx]
+                    if strength_denom == 0:
+                        # the two agents have died
                         continue
-                    # see if two agents decided to move to the same square
-                    if self.agent_final_locs[idx] == self.agent_final_locs[jdx]:
-                        # the two agents should fight
-                        strength_denom = self.agent_strengths[idx] + \
-                            self.agent_strengths[jdx]
-                        if strength_denom == 0:
-                            # the two agents have died
-                            continue
-                        idx_win_chance = \
-                            self.agent_strengths[idx] / strength_denom
-                        if np.random.random() < idx_win_chance:
-                            # agent idx wins
-                            if verbose:
-                                print('Agent {} won the fight against agent {}'
-                                      .format(
-                                          self.agents[idx].name,
-                                          self.agents[jdx].name))
-                            self.agent_strengths[idx] += \
-                                self.agent_strengths[jdx]
-                            self.agent_strengths[jdx] = 0
-                            self.agent_objects[jdx] = {}
-                        else:
-                            # agent jdx wins
-                            if verbose:
-                                print('Agent {} won the fight against agent {}'
-                                      .format(
-                                          self.agents[jdx].name,
-                                          self.agents[idx].name))
-                            self.agent_strengths[jdx] += \
-                                self.agent_strengths[idx]
-                            self.agent_strengths[idx] = 0
-                            self.agent_objects[idx] = {}
-
-            for idx in range(len(self.agents)):
-                if self.agent_strengths[idx] <= 0:
-                    # agent has died, skip it
-                    continue
-                # checking objects in the agent's destination tiles
-                final_loc = self.agent_final_locs[idx]
-                if final_loc in self.objects:
-                    if isinstance(self.objects[final_loc], utils.PowerUp):
+                    idx_win_chance = \
+                        self.agent_strengths[idx] / strength_denom
+                    if np.random.random() < idx_win_chance:
+                        # agent idx wins
+                        if verbose:
+                            self.output.info(
+                                'Agent %s won the fight against agent %s',
+                                self.agents[idx].name,
+                                self.agents[jdx].name)
                         self.agent_strengths[idx] += \
-                            self.objects[final_loc].delta
-                        del self.objects[final_loc]
-                        for i in range(len(self.agents)):
-                            if final_loc in self.agent_objects[i]:
-                                del self.agent_objects[i][final_loc]
-                    elif isinstance(self.objects[final_loc],
-                                    utils.StaticMonster):
-                        # fight
-                        win_chance = self.agent_strengths[idx] / \
-                            (self.agent_strengths[idx] +
-                             self.objects[final_loc].strength)
-                        if np.random.random() < win_chance:
-                            # agent wins
-                            if verbose:
-                                print('Agent {} won the fight against {}'
-                                      .format(
-                                          self.agents[idx].name,
-                                          self.objects[final_loc].label))
-                            self.agent_max_strengths[idx] += \
-                                self.objects[final_loc].strength
-                            self.agent_strengths[idx] = \
-                                self.agent_max_strengths[idx]
-                            del self.objects[final_loc]
-                            for i in range(len(self.agents)):
-                                if final_loc in self.agent_objects[i]:
-                                    del self.agent_objects[i][final_loc]
-                        else:
-                            # agent loses
-                            if verbose:
-                                print('Agent {} lost the fight against {}'
-                                      .format(
-                                          self.agents[idx].name,
-                                          self.objects[final_loc].label))
-                            self.agent_strengths[idx] = 0
-                if final_loc in self.dynamic_monsters:
-                    # fight against the dynamic monster
+                            self.agent_strengths[jdx]
+                        self.agent_strengths[jdx] = 0
+                        self.agent_objects[jdx] = {}
+                    else:
+                        # agent jdx wins
+                        if verbose:
+                            self.output.info(
+                                'Agent %s won the fight against agent %s',
+                                self.agents[jdx].name,
+                                self.agents[idx].name)
+                        self.agent_strengths[jdx] += \
+                            self.agent_strengths[idx]
+                        self.agent_strengths[idx] = 0
+                        self.agent_objects[idx] = {}
+
+        for idx in range(len(self.agents)):
+            if self.agent_strengths[idx] <= 0:
+                # agent has died, skip it
+                continue
+            # checking objects in the agent's destination tiles
+            final_loc = self.agent_final_locs[idx]
+            if final_loc in self.objects:
+                if isinstance(self.objects[final_loc], utils.PowerUp):
+                    self.agent_strengths[idx] += \
+                        self.objects[final_loc].delta
+                    del self.objects[final_loc]
+                    self.forget_object(final_loc)
+                elif isinstance(self.objects[final_loc],
+                                utils.StaticMonster):
                     # fight
                     win_chance = self.agent_strengths[idx] / \
                         (self.agent_strengths[idx] +
-                            self.dynamic_monsters[final_loc].strength)
+                         self.objects[final_loc].strength)
                     if np.random.random() < win_chance:
                         # agent wins
                         if verbose:
-                            print('Agent {} won the fight against {}'.format(
+                            self.output.info(
+                                'Agent %s won the fight against %s',
                                 self.agents[idx].name,
-                                self.dynamic_monsters[final_loc].label))
+                                self.objects[final_loc].label)
                         self.agent_max_strengths[idx] += \
-                            self.dynamic_monsters[final_loc].strength
+                            self.objects[final_loc].strength
                         self.agent_strengths[idx] = \
                             self.agent_max_strengths[idx]
-                        del self.dynamic_monsters[final_loc]
+                        del self.objects[final_loc]
+                        self.forget_object(final_loc)
                     else:
                         # agent loses
                         if verbose:
-                            print('Agent {} lost the fight against {}'.format(
+                            self.output.info(
+                                'Agent %s lost the fight against %s',
                                 self.agents[idx].name,
-                                self.dynamic_monsters[final_loc].label))
+                                self.objects[final_loc].label)
                         self.agent_strengths[idx] = 0
+            if final_loc in self.dynamic_monsters:
+                # fight against the dynamic monster
+                # fight
+                win_chance = self.agent_strengths[idx] / \
+                    (self.agent_strengths[idx] +
+                        self.dynamic_monsters[final_loc].strength)
+                if np.random.random() < win_chance:
+                    # agent wins
+                    if verbose:
+                        self.output.info(
+                            'Agent %s won the fight against %s',
+                            self.agents[idx].name,
+                            self.dynamic_monsters[final_loc].label)
+                    self.agent_max_strengths[idx] += \
+                        self.dynamic_monsters[final_loc].strength
+                    self.agent_strengths[idx] = \
+                        self.agent_max_strengths[idx]
+                    del self.dynamic_monsters[final_loc]
+                else:
+                    # agent loses
+                    if verbose:
+                        self.output.info(
+                            'Agent %s lost the fight against %s',
+                            self.agents[idx].name,
+                            self.dynamic_monsters[final_loc].label)
+                    self.agent_strengths[idx] = 0
+
+        for idx in range(len(self.agents)):
+            self.agent_locations[idx] = self.agent_final_locs[idx]
+            if self.agent_strengths[idx] <= 0:
+                self.output.info('Agent %s has died!', self.agents[idx].name)
+                continue
+            elif final_loc == self.goal_loc:
+                self.output.info('Agent %s won the game!',
+                                 self.agents[idx].name)
+                GAMES.labels('won').inc()
+                raise StopIteration('An agent won the game!')
+
+        total_agent_strengths = np.sum(self.agent_strengths)
+        if total_agent_strengths <= 0:
+            GAMES.labels('died').inc()
+            raise StopIteration('All the agents have died!')
+
+    def forget_object(self, loc):
+        """
+        Remove an object that left the game from the objects known by the
+        agents
 
-            for idx in range(len(self.agents)):
-                self.agent_locations[idx] = self.agent_final_locs[idx]
-                if self.agent_strengths[idx] <= 0:
-                    print(f'Agent {self.agents[idx].name} has died!')
-                    continue
-                elif final_loc == self.goal_loc:
-                    print(f'Agent {self.agents[idx].name} won the game!')
-                    raise StopIteration('An agent won the game!')
+        Parameters
+        ----------
+        loc: tuple of int
+            Location of the object
+        """
+        for i in range(len(self.agents)):
+            if loc in self.agent_objects[i]:
+                self.agent_removed_objects[i][loc] = \
+                    self.agent_objects[i].pop(loc)
+                self.agent_added_objects[i].pop(loc, None)
 
-            total_agent_strengths = np.sum(self.agent_strengths)
-            if total_agent_strengths <= 0:
-                raise StopIteration('All the agents have died!')
+    def pop_delta(self, agent_idx):
+        """
+        Collect what changed in the observations of an agent since its
+        previous step, and start over
+
+        Parameters
+        ----------
+        agent_idx: int
+            Index of the agent
+
+        Returns
+        -------
+        delta: WorldDelta
+            Tiles revealed, objects that appeared or left, and the moving
+            objects in sight of the agent
+        """
+        delta = WorldDelta(revealed=self.agent_revealed[agent_idx],
+                           added=self.agent_added_objects[agent_idx],
+                           removed=self.agent_removed_objects[agent_idx],
+                           moving=dict(self.agent_moving_objects[agent_idx]))
+        self.agent_revealed[agent_idx] = {}
+        self.agent_added_objects[agent_idx] = {}
+        self.agent_removed_objects[agent_idx] = {}
+        return delta
 
     def initialize_game(self):
         """
         This function will generate a random map with the given size and
         initialize other required objects
         """
-        if self.map_file is None:
+        if self.map_file is None and self.chunk_size is not None:
+            # generate the chunks of the game map as they are needed
+            self.generate_world()
+        elif self.map_file is None:
             # generate the game map
             self.generate_map()
         else:
             self.load_map(self.map_file)
 
         for _ in self.agents:
-            # create game maps for each agent
-            self.agent_maps.append(
-                np.full((self.height, self.width), utils.MapTiles.UNKNOWN))
+            # create game maps for each agent, views of the game map through
+            # the tiles revealed to the agent
+            mask = RevealMask(self.height, self.width)
+            self.agent_masks.append(mask)
+            self.agent_maps.append(ObservedMap(self.game_map, mask))
 
             # create empty object dictionary for each agent
             self.agent_objects.append({})
 
+    def find_diagonal_blocks(self):
+        """
+        Find the tiles whose diagonal neighbours are hidden by walls (or the
+        border of the map) on both sides
+        """
+        walls = np.pad((self.game_map == utils.MapTiles.WALL), 1,
+                       mode='constant', constant_values=True)
+        north, south = walls[:-2, 1:-1], walls[2:, 1:-1]
+        west, east = walls[1:-1, :-2], walls[1:-1, 2:]
+        self.nwblocks = (north & west).astype(np.int32)
+        self.neblocks = (north & east).astype(np.int32)
+        self.seblocks = (south & east).astype(np.int32)
+        self.swblocks = (south & west).astype(np.int32)
+
+    def diagonal_blocks(self, loc):
+        """
+        Whether the north west, north east, south east and south west
+        neighbours of a tile are hidden by walls (or the border of the map) on
+        both sides
+
+        Parameters
+        ----------
+        loc: tuple
+            Location (row, column) of the tile
+        """
+        i, j = loc
+        if self.nwblocks is not None:
+            return (self.nwblocks[i, j] > 0, self.neblocks[i, j] > 0,
+                    self.seblocks[i, j] > 0, self.swblocks[i, j] > 0)
+        # chunked worlds are too large for the arrays of find_diagonal_blocks
+        wall = utils.MapTiles.WALL
+        north = i == 0 or self.game_map[i - 1, j] == wall
+        south = i == self.height - 1 or self.game_map[i + 1, j] == wall
+        west = j == 0 or self.game_map[i, j - 1] == wall
+        east = j == self.width - 1 or self.game_map[i, j + 1] == wall
+        return north and west, north and east, south and east, south and west
+
     def generate_map(self):
         # TODO: Create a better function for generating the map
         self.game_map = np.random.choice(
             list(utils.MapTiles)[1:], (self.height, self.width),
             p=[0.4, 0.3, 0.2, 0.1])
-        walls = np.pad((self.game_map == utils.MapTiles.WALL), 1,
-                       mode='constant', constant_values=1).astype(np.int32)
-        nw_filters = np.asarray([[0, 0.5, 0], [0.5, 0, 0], [0] * 3])
-        ne_filters = np.asarray([[0, 0.5, 0], [0, 0, 0.5], [0] * 3])
-        se_filters = np.asarray([[0] * 3, [0, 0, 0.5], [0, 0.5, 0]])
-        sw_filters = np.asarray([[0] * 3, [0.5, 0, 0], [0, 0.5, 0]])
-        self.nwblocks = (signal.correlate2d(walls, nw_filters, mode='valid') >=
-                         1).astype(np.int32)
-        self.neblocks = (signal.correlate2d(walls, ne_filters, mode='valid') >=
-                         1).astype(np.int32)
-        self.seblocks = (signal.correlate2d(walls, se_filters, mode='valid') >=
-                         1).astype(np.int32)
-        self.swblocks = (signal.correlate2d(walls, sw_filters, mode='valid') >=
-                         1).astype(np.int32)
+        self.find_diagonal_blocks()
 
         nonwall_indices = np.where(self.game_map != utils.MapTiles.WALL)
         # generate objects in the game map
@@ -441,12 +633,58 @@ class GameDriver(object):
                 loc = (remaining_indices[0][idx], remaining_indices[1][idx])
             self.agent_locations.append(loc)
 
+        self.check_agent_locations()
+
+    def generate_world(self):
+        """
+        Generate a chunked world. Only the chunks around the objects and the
+        agents are drawn up front, the others when they are first seen.
+        """
+        if self.world_seed is None:
+            self.world_seed = int(np.random.randint(2 ** 31))
+        self.game_map = ChunkedWorld(self.height, self.width,
+                                     seed=self.world_seed,
+                                     chunk_size=self.chunk_size,
+                                     path=self.world_file)
+        self.nwblocks = self.neblocks = self.seblocks = self.swblocks = None
+
+        taken = set()
+
+        def empty_tile():
+            # rejection sampling, which only draws the chunks of the tiles
+            # tried instead of listing the empty tiles of the whole map
+            for _ in range(1000):
+                loc = (int(np.random.randint(self.height)),
+                       int(np.random.randint(self.width)))
+                if (loc not in taken and
+                        self.game_map[loc] != utils.MapTiles.WALL):
+                    taken.add(loc)
+                    return loc
+            raise utils.InvalidMapError('Not enough empty tiles are left')
+
+        # the boss
+        self.goal_loc = empty_tile()
+        self.objects[self.goal_loc] = utils.Boss()
+
+        for cnt in range(self.num_powerups + self.num_monsters +
+                         self.num_dynamic_monsters):
+            i, j = empty_tile()
+            if cnt < self.num_powerups:
+                self.objects[(i, j)] = utils.PowerUp()
+            elif cnt < self.num_powerups + self.num_monsters:
+                self.objects[(i, j)] = utils.StaticMonster()
+            else:
+                self.dynamic_monsters[(i, j)] = utils.DynamicMonster(i, j)
+
+        # initial locations for agents
+        for _ in self.agents:
+            self.agent_locations.append(empty_tile())
+
+        self.check_agent_locations()
+
+    def check_agent_locations(self):
         for loc in self.agent_locations:
-            wall_sum = self.nwblocks[loc[0], loc[1]] + \
-                       self.neblocks[loc[0], loc[1]] + \
-                       self.seblocks[loc[0], loc[1]] + \
-                       self.swblocks[loc[0], loc[1]]
-            if wall_sum >= 3:
+            if sum(self.diagonal_blocks(loc)) >= 3:
                 raise utils.InvalidMapError('The map is unsolvable')
 
     def save_map(self, save_dir):
@@ -465,8 +703,13 @@ class GameDriver(object):
         map_dict = {}
         map_dict['height'] = self.height
         map_dict['width'] = self.width
-        map_dict['game_map'] = list(map(
-            lambda t: t.value, self.game_map.flatten().tolist()))
+        if isinstance(self.game_map, ChunkedWorld):
+            # the world is generated again from its seed
+            map_dict['world'] = {'seed': self.game_map.seed,
+                                 'chunk_size': self.game_map.chunk_size}
+        else:
+            map_dict['game_map'] = list(map(
+                lambda t: t.value, self.game_map.flatten().tolist()))
         map_dict['objects'] = [[*list(map(int, k)), v.label]
                                for k, v in self.objects.items()]
         map_dict['agent_locations'] = [list(map(int, k))
@@ -498,24 +741,21 @@ class GameDriver(object):
         assert len(map_dict['agent_locations']) == len(self.agents), \
             'Number of agents in the game do not match'
 
-        self.game_map = np.asarray(
-            list(map(lambda t: utils.MapTiles(t), map_dict['game_map']))
-        ).reshape(self.height, self.width)
+        if 'world' in map_dict:
+            self.world_seed = map_dict['world']['seed']
+            self.chunk_size = map_dict['world']['chunk_size']
+            self.game_map = ChunkedWorld(self.height, self.width,
+                                         seed=self.world_seed,
+                                         chunk_size=self.chunk_size,
+                                         path=self.world_file)
+            self.nwblocks = self.neblocks = self.seblocks = self.swblocks = \
+                None
+        else:
+            self.game_map = np.asarray(
+                list(map(lambda t: utils.MapTiles(t), map_dict['game_map']))
+            ).reshape(self.height, self.width)
 
-        walls = np.pad((self.game_map == utils.MapTiles.WALL), 1,
-                       mode='constant', constant_values=1).astype(np.int32)
-        nw_filters = np.asarray([[0, 0.5, 0], [0.5, 0, 0], [0] * 3])
-        ne_filters = np.asarray([[0, 0.5, 0], [0, 0, 0.5], [0] * 3])
-        se_filters = np.asarray([[0] * 3, [0, 0, 0.5], [0, 0.5, 0]])
-        sw_filters = np.asarray([[0] * 3, [0.5, 0, 0], [0, 0.5, 0]])
-        self.nwblocks = (signal.correlate2d(walls, nw_filters, mode='valid') >=
-                         1).astype(np.int32)
-        self.neblocks = (signal.correlate2d(walls, ne_filters, mode='valid') >=
-                         1).astype(np.int32)
-        self.seblocks = (signal.correlate2d(walls, se_filters, mode='valid') >=
-                         1).astype(np.int32)
-        self.swblocks = (signal.correlate2d(walls, sw_filters, mode='valid') >=
-                         1).astype(np.int32)
+            self.find_diagonal_blocks()
 
         for obj in map_dict['objects']:
             if obj[-1] == 'boss':
@@ -542,38 +782,13 @@ class GameDriver(object):
                       'agent': 'X', 'dynamic_monster': 'D', 'monster': 'O',
                       'powerup': 'R', 'boss': 'B', 'deadagent': '-'}
 
-        emoji_dict = {
-            utils.MapTiles.UNKNOWN:
-                em.emojize(':white_large_square:', use_aliases=True),
-            utils.MapTiles.MOUNTAIN:
-                em.emojize(':mountain:', use_aliases=True),
-            utils.MapTiles.SAND:
-                em.emojize(':palm_tree:', use_aliases=True),
-            utils.MapTiles.PATH:
-                em.emojize(':black_large_square:', use_aliases=True),
-            utils.MapTiles.WALL:
-                em.emojize(':construction:', use_aliases=True),
-            'other_agent':
-                em.emojize(':bust_in_silhouette:', use_aliases=True),
-            'agent':
-                em.emojize(':alien:', use_aliases=True),
-            'dynamic_monster':
-                em.emojize(':smiling_imp:', use_aliases=True),
-            'monster':
-                em.emojize(':imp:', use_aliases=True),
-            'powerup':
-                em.emojize(':heartpulse:', use_aliases=True),
-            'boss':
-                em.emojize(':guardsman:', use_aliases=True),
-            'deadagent':
-                em.emojize(':skull:', use_aliases=True)}
 
         printable_map = np.full(self.agent_maps[agent_idx].shape, "x")
 
         if self.map_type == 'ascii':
             chosen_dict = ascii_dict
         else:
-            chosen_dict = emoji_dict
+            chosen_dict = emoji_dict()
 
         for i in range(self.agent_maps[agent_idx].shape[0]):
             for j in range(self.agent_maps[agent_idx].shape[1]):
@@ -596,6 +811,114 @@ class GameDriver(object):
                 else:
                     printable_map[i, j] = \
                         chosen_dict[self.agent_maps[agent_idx][i, j]]
-        for i in range(self.agent_maps[agent_idx].shape[0]):
-            print(' '.join(printable_map[i, :]))
-        print()
+        self.output.frame(agent_idx, printable_map)
+
+
+def step_agents(agent, games):
+    """
+    Ask an agent for its moves in one or several games, through
+    `step_batch` when there are several
+
+    Parameters
+    ----------
+    agent: BaseAgent
+        Agent playing all the games
+    games: list
+        For each game, a tuple (driver, index of the agent in the game,
+        observation returned by `GameDriver.start_step` for the agent)
+
+    Returns
+    -------
+    directions: list of Directions
+        Direction chosen in each game
+    """
+    step_time = games[0][0].step_time
+    if step_time is not None:
+        deadline = time.time() + step_time
+        agent.set_deadline(deadline)
+    trace = tracer()
+    if trace is not None:
+        # the planner calls of this step are recorded with the agent and the step
+        trace.context = (agent.name, games[0][0].steps)
+    started = time.perf_counter()
+    if len(games) == 1:
+        location, strength, game_map, map_objects = games[0][2]
+        directions = [agent.step(location=location, strength=strength,
+                                 game_map=game_map, map_objects=map_objects)]
+    else:
+        locations, strengths, maps, objects = \
+            (list(values) for values in zip(*[game[2] for game in games]))
+        directions = agent.step_batch(locations, strengths, maps, objects)
+    elapsed = time.perf_counter() - started
+
+    for driver, idx, _ in games:
+        AGENT_STEP_SECONDS.labels(agent.name).observe(elapsed / len(games))
+        if step_time is not None and time.time() > deadline:
+            driver.agent_overruns[idx] += 1
+    GAME_STEPS.inc(len(games))
+    return directions
+
+
+def play_batch(drivers, verbose=False):
+    """
+    Play several games in lockstep. At each step, an agent playing several of
+    the games (the same instance) is asked for its moves in all of them at
+    once with `step_batch`.
+
+    The games draw from numpy.random in turn, so their outcomes differ from
+    those of the same games played one after the other.
+
+    Parameters
+    ----------
+    drivers: list of GameDriver
+        Games to play, with their maps initialized
+    verbose: bool
+        Whether to print the steps of the games
+
+    Returns
+    -------
+    results: list of Exception
+        For each game, the exception that ended it: StopIteration when an
+        agent won or all of them died, or the error raised by an agent
+    """
+    results = [None] * len(drivers)
+    playing = list(range(len(drivers)))
+    try:
+        while len(playing) > 0:
+            groups = {}
+            for game in playing:
+                try:
+                    observations = drivers[game].start_step(verbose)
+                except Exception as e:
+                    results[game] = e
+                    continue
+                for idx, observation in observations.items():
+                    agent = drivers[game].agents[idx]
+                    groups.setdefault(id(agent), (agent, []))[1].append(
+                        (game, idx, observation))
+
+            directions = [{} for _ in drivers]
+            for agent, games in groups.values():
+                try:
+                    moves = step_agents(agent, [
+                        (drivers[game], idx, observation)
+                        for game, idx, observation in games])
+                except Exception as e:
+                    for game, _, _ in games:
+                        results[game] = e
+                    continue
+                for (game, idx, _), direction in zip(games, moves):
+                    directions[game][idx] = direction
+
+            for game in playing:
+                if results[game] is not None:
+                    continue
+                try:
+                    drivers[game].finish_step(directions[game], verbose)
+                except Exception as e:
+                    results[game] = e
+            playing = [game for game in playing if results[game] is None]
+    finally:
+        for driver in drivers:
+            driver.output.flush()
+    return results
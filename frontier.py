@@ -0,0 +1,53 @@
+import numpy as np
+
+from utils import MapTiles
+
+
+def information_gain(game_map, radius=1):
+    """
+    Number of unknown tiles each tile would reveal, counted over the window
+    revealed around an agent standing on it.
+    Args:
+        game_map: 2d array of MapTiles. Map as observed by the agent so far.
+        radius: int. Distance up to which tiles are revealed around the agent.
+    Returns: numpy.ndarray of int. Unknown tiles within the window of each tile.
+    """
+    unknown = np.asarray(game_map) == MapTiles.U
+    height, width = unknown.shape
+    padded = np.pad(unknown, radius, mode='constant', constant_values=False).astype(np.int32)
+    gain = np.zeros((height, width), dtype=np.int32)
+    for i in range(2 * radius + 1):
+        for j in range(2 * radius + 1):
+            gain += padded[i:i + height, j:j + width]
+    return gain
+
+
+def exploration_frontier(game_map, location=None, safe_mask=None, limit=20, radius=1):
+    """
+    Known passable tiles next to unknown ones, ranked by how many unknown
+    tiles they would reveal and then by distance to the agent.
+    Args:
+        game_map: 2d array of MapTiles. Map as observed by the agent so far.
+        location: tuple - (x,y). Location of the agent, left out of the frontier.
+        safe_mask: numpy.ndarray of bool. Tiles the frontier may contain, all if None.
+        limit: int. Largest number of tiles returned.
+        radius: int. Distance up to which tiles are revealed around the agent.
+    Returns: list of tuple - (x,y). The best frontier tiles first.
+    """
+    game_map = np.asarray(game_map)
+    gain = information_gain(game_map, radius)
+    candidates = (gain > 0) & (game_map != MapTiles.U) & (game_map != MapTiles.W)
+    if safe_mask is not None:
+        candidates &= safe_mask
+    if location is not None:
+        candidates[location[0], location[1]] = False
+
+    rows, cols = np.nonzero(candidates)
+    if len(rows) == 0:
+        return []
+    if location is not None:
+        distance = np.abs(rows - location[0]) + np.abs(cols - location[1])
+    else:
+        distance = np.zeros(len(rows), dtype=np.int64)
+    order = np.lexsort((distance, -gain[rows, cols]))[:limit]
+    return [(int(rows[i]), int(cols[i])) for i in order]
@@ -0,0 +1,365 @@
+# References:
+# 1. Adi Botea, Martin Müller and Jonathan Schaeffer, Near Optimal Hierarchical Path-Finding,
+#    Journal of Game Development, 1(1), 2004.
+import sys
+import weakref
+
+import numpy as np
+
+from a_star import a_star_search, cost_grid, grid_graph
+from base import Action, State
+from metrics import record_plan
+from utils import Directions
+
+# every border segment gets a transition at its cheapest crossing, segments at
+# least this long also get one transition at each end.
+ENTRANCE_SPLIT = 6
+
+
+class HierarchicalPlanner(object):
+    """
+    Hierarchical path planner (HPA*). The map is split into square clusters;
+    transitions between neighbouring clusters become the nodes of an abstract
+    graph whose intra-cluster edges are precomputed once per map. Queries search
+    the abstract graph and refine only the abstract edges on the chosen route.
+    """
+
+    def __init__(self, problem, cluster_size=32):
+        """
+        Constructor
+        Args:
+            problem: 2d array of MapTiles. Problem with terrain as map tiles.
+            cluster_size: int. Height and width of a cluster.
+        """
+        self.problem = problem
+        self.cluster_size = cluster_size
+        self.costs = cost_grid(problem)
+        self.height, self.width = self.costs.shape
+        self.cluster_rows = -(-self.height // cluster_size)
+        self.cluster_cols = -(-self.width // cluster_size)
+
+        # transitions per border, keyed by the pair of clusters it separates
+        self._borders = {}
+        # per cluster: (entrances, distances between entrances, predecessors, local index)
+        self._clusters = {}
+        # abstract graph edges (sources, targets, costs) per border and per cluster,
+        # abstract nodes are numbered by the flat index of their cell
+        self._edges = {}
+        self._graph = None
+
+        for cluster in np.ndindex(self.cluster_rows, self.cluster_cols):
+            for neighbour in self._next_clusters(cluster):
+                self._build_border(cluster, neighbour)
+        for cluster in np.ndindex(self.cluster_rows, self.cluster_cols):
+            self._build_cluster(cluster)
+
+    def update(self, cells):
+        """
+        Update the abstraction after the tiles of some cells changed (e.g. when they
+        were revealed). Only the clusters and borders touching those cells are rebuilt.
+        Args:
+            cells: iterable of tuple - (x,y). Cells whose tile changed in the problem.
+        """
+        dirty_borders, dirty_clusters = set(), set()
+        for x, y in cells:
+            self.costs[x, y] = cost_grid([[self.problem[x, y]]])[0, 0]
+            cluster = self._cluster_of((x, y))
+            dirty_clusters.add(cluster)
+            (x0, x1), (y0, y1) = self._bounds(cluster)
+            if x == x0 and cluster[0] > 0:
+                dirty_borders.add(((cluster[0] - 1, cluster[1]), cluster))
+            if x == x1 - 1 and cluster[0] < self.cluster_rows - 1:
+                dirty_borders.add((cluster, (cluster[0] + 1, cluster[1])))
+            if y == y0 and cluster[1] > 0:
+                dirty_borders.add(((cluster[0], cluster[1] - 1), cluster))
+            if y == y1 - 1 and cluster[1] < self.cluster_cols - 1:
+                dirty_borders.add((cluster, (cluster[0], cluster[1] + 1)))
+
+        for first, second in dirty_borders:
+            self._build_border(first, second)
+            dirty_clusters.update((first, second))
+        for cluster in dirty_clusters:
+            self._build_cluster(cluster)
+
+    def search(self, start, goal):
+        """
+        Find a near optimal path from the start state to the goal state.
+        Args:
+            start: tuple - (x,y). Start state of the agent.
+            goal: tuple - (x,y). Goal state to reach.
+        Returns: tuple(list of Action, int). Sequence of actions to take on start
+        state to reach the goal state and the cost of the path.
+        """
+        # nodes settled by the searches of the query, the abstract graph and the paths in the clusters
+        # are precomputed
+        expanded = [0]
+        try:
+            return self._search((int(start[0]), int(start[1])), (int(goal[0]), int(goal[1])), expanded)
+        finally:
+            record_plan('hpa-star', expanded[0])
+
+    def _search(self, start, goal, expanded):
+        if start == goal:
+            return [], 0
+        if not np.isfinite(self.costs[goal]):
+            return [], sys.maxsize
+
+        start_cluster, goal_cluster = self._cluster_of(start), self._cluster_of(goal)
+        start_cells, start_dist, start_pred = self._local_search(start_cluster, start, reverse=False)
+        goal_cells, goal_dist, goal_pred = self._local_search(goal_cluster, goal, reverse=True)
+        expanded[0] += int(np.isfinite(start_dist).sum() + np.isfinite(goal_dist).sum())
+
+        # connect the start and the goal to the entrances of their clusters, unless
+        # they are entrances themselves and hence already part of the abstract graph
+        query_edges = {}
+        start_entrances, goal_entrances = self._clusters[start_cluster][0], self._clusters[goal_cluster][0]
+        if start not in start_entrances:
+            for entrance in start_entrances:
+                query_edges[(start, entrance)] = start_dist[start_cells[entrance]]
+        if goal not in goal_entrances:
+            for entrance in goal_entrances:
+                query_edges[(entrance, goal)] = goal_dist[goal_cells[entrance]]
+        if start_cluster == goal_cluster and (start, goal) not in query_edges:
+            if start not in start_entrances or goal not in goal_entrances:
+                query_edges[(start, goal)] = start_dist[start_cells[goal]]
+
+        route = self._abstract_search(start, goal, query_edges, expanded)
+        if route is None:
+            return [], sys.maxsize
+
+        cells = [start]
+        for u, v in zip(route, route[1:]):
+            if self._cluster_of(u) != self._cluster_of(v):
+                segment = [v]
+            elif u == start:
+                segment = self._walk(start_pred, start_cells, v)[1:]
+            elif v == goal:
+                segment = self._walk(goal_pred, goal_cells, u)[-2::-1]
+            else:
+                entrances, _, predecessors, index = self._clusters[self._cluster_of(u)]
+                segment = self._walk(predecessors[entrances.index(u)], index, v)[1:]
+            cells.extend(segment)
+
+        return to_actions(cells), int(sum(self.costs[cell] for cell in cells[1:]))
+
+    def _abstract_search(self, start, goal, query_edges, expanded):
+        """
+        Search the abstract graph, extended with the edges of the query, from the start to the goal,
+        adding the number of abstract nodes settled to `expanded[0]`.
+        Returns: list of tuple - (x,y). Abstract nodes on the route or None if there is no route.
+        """
+        from scipy.sparse import csr_matrix
+        from scipy.sparse.csgraph import dijkstra
+
+        if self._graph is None:
+            sources, targets, costs = (np.concatenate(e) for e in zip(*self._edges.values()))
+            # number the abstract nodes compactly, keeping two spare ids for the start and the goal
+            nodes = np.unique(np.concatenate([sources, targets]))
+            size = len(nodes) + 2
+            graph = csr_matrix((costs, (np.searchsorted(nodes, sources), np.searchsorted(nodes, targets))),
+                               shape=(size, size))
+            self._graph = (nodes, graph)
+        nodes, graph = self._graph
+
+        def abstract_id(cell, spare):
+            position = np.searchsorted(nodes, self._node(cell))
+            if position < len(nodes) and nodes[position] == self._node(cell):
+                return position
+            return spare
+
+        ids = {start: abstract_id(start, len(nodes)), goal: abstract_id(goal, len(nodes) + 1)}
+        query = [(u, v, c) for (u, v), c in query_edges.items() if np.isfinite(c)]
+        if query:
+            for u, v, _ in query:
+                for cell in (u, v):
+                    if cell not in ids:
+                        ids[cell] = abstract_id(cell, None)
+            graph = graph + csr_matrix(([c for _, _, c in query],
+                                        ([ids[u] for u, _, _ in query], [ids[v] for _, v, _ in query])),
+                                       shape=graph.shape)
+
+        distances, predecessors = dijkstra(graph, directed=True, indices=ids[start], return_predecessors=True)
+        expanded[0] += int(np.isfinite(distances).sum())
+        if not np.isfinite(distances[ids[goal]]):
+            return None
+
+        cells = {index: cell for cell, index in ids.items()}
+        route = [ids[goal]]
+        while predecessors[route[-1]] >= 0:
+            route.append(predecessors[route[-1]])
+        return [cells[node] if node in cells else divmod(int(nodes[node]), self.width) for node in reversed(route)]
+
+    def _node(self, cell):
+        return cell[0] * self.width + cell[1]
+
+    def _local_search(self, cluster, cell, reverse):
+        """
+        Dijkstra from (or, when reversed, towards) a cell restricted to its cluster.
+        Returns: tuple(_ClusterIndex, numpy.ndarray, numpy.ndarray). Local index of the
+        cells of the cluster, distances and predecessors.
+        """
+        from scipy.sparse.csgraph import dijkstra
+
+        index, graph = self._cluster_graph(cluster)
+        distances, predecessors = dijkstra(graph.T if reverse else graph, directed=True,
+                                           indices=index[cell], return_predecessors=True)
+        return index, distances, predecessors
+
+    def _walk(self, predecessors, index, cell):
+        """
+        Follow the predecessors of a single source search back to its source.
+        Returns: list of tuple - (x,y). Cells from the source to the given cell.
+        """
+        cells = [cell]
+        current = predecessors[index[cell]]
+        while current >= 0:
+            cells.append(index.cell(current))
+            current = predecessors[current]
+        return cells[::-1]
+
+    def _bounds(self, cluster):
+        k = self.cluster_size
+        return ((cluster[0] * k, min((cluster[0] + 1) * k, self.height)),
+                (cluster[1] * k, min((cluster[1] + 1) * k, self.width)))
+
+    def _cluster_of(self, cell):
+        return cell[0] // self.cluster_size, cell[1] // self.cluster_size
+
+    def _next_clusters(self, cluster):
+        if cluster[0] + 1 < self.cluster_rows:
+            yield cluster[0] + 1, cluster[1]
+        if cluster[1] + 1 < self.cluster_cols:
+            yield cluster[0], cluster[1] + 1
+
+    def _build_border(self, first, second):
+        """
+        Find the transitions on the border between two neighbouring clusters.
+        """
+        (x0, x1), (y0, y1) = self._bounds(first)
+        if second[0] != first[0]:
+            pairs = [((x1 - 1, y), (x1, y)) for y in range(y0, y1)]
+        else:
+            pairs = [((x, y1 - 1), (x, y1)) for x in range(x0, x1)]
+
+        transitions, segment = [], []
+        for pair in pairs + [None]:
+            if pair is not None and np.isfinite(self.costs[pair[0]]) and np.isfinite(self.costs[pair[1]]):
+                segment.append(pair)
+                continue
+            if segment:
+                middle = len(segment) // 2
+                cheapest = min(range(len(segment)), key=lambda i: (
+                    self.costs[segment[i][0]] + self.costs[segment[i][1]], abs(i - middle)))
+                chosen = {0, cheapest, len(segment) - 1} if len(segment) >= ENTRANCE_SPLIT else {cheapest}
+                transitions.extend(segment[i] for i in sorted(chosen))
+            segment = []
+
+        self._borders[(first, second)] = transitions
+        self._edges[(first, second)] = (
+            np.array([self._node(c) for p, q in transitions for c in (p, q)], dtype=np.int64),
+            np.array([self._node(c) for p, q in transitions for c in (q, p)], dtype=np.int64),
+            np.array([self.costs[c] for p, q in transitions for c in (q, p)], dtype=np.float64))
+        self._graph = None
+
+    def _build_cluster(self, cluster):
+        """
+        Precompute the costs and paths between all entrances of a cluster.
+        """
+        from scipy.sparse.csgraph import dijkstra
+
+        entrances = set()
+        for other in [(cluster[0] - 1, cluster[1]), (cluster[0], cluster[1] - 1)]:
+            entrances.update(q for _, q in self._borders.get((other, cluster), []))
+        for other in self._next_clusters(cluster):
+            entrances.update(p for p, _ in self._borders.get((cluster, other), []))
+        entrances = sorted(entrances)
+
+        index, graph = self._cluster_graph(cluster)
+        local = [index[e] for e in entrances]
+        if local:
+            distances, predecessors = dijkstra(graph, directed=True, indices=local, return_predecessors=True)
+            distances = distances[:, local]
+            predecessors = predecessors.astype(np.int16 if graph.shape[0] < 2 ** 15 else np.int32)
+        else:
+            distances, predecessors = np.zeros((0, 0)), np.zeros((0, graph.shape[0]), dtype=np.int32)
+        self._clusters[cluster] = (entrances, distances, predecessors, index)
+
+        nodes = np.array([self._node(e) for e in entrances], dtype=np.int64)
+        reachable = np.isfinite(distances) & ~np.eye(len(entrances), dtype=bool)
+        sources, targets = np.nonzero(reachable)
+        self._edges[cluster] = (nodes[sources], nodes[targets], distances[reachable])
+        self._graph = None
+
+    def _cluster_graph(self, cluster):
+        """
+        Build the sparse graph of moves inside a cluster, weighted by the cost of the tile moved onto.
+        Returns: tuple(_ClusterIndex, scipy.sparse.csr_matrix). Local index of the cells and the graph.
+        """
+        (x0, x1), (y0, y1) = self._bounds(cluster)
+        return _ClusterIndex(x0, y0, y1 - y0), grid_graph(self.costs[x0:x1, y0:y1])
+
+
+class _ClusterIndex(object):
+    """
+    Map between cells of the problem and local node indices of a cluster graph.
+    """
+
+    def __init__(self, x0, y0, width):
+        self.x0, self.y0, self.width = x0, y0, width
+
+    def __getitem__(self, cell):
+        return (cell[0] - self.x0) * self.width + (cell[1] - self.y0)
+
+    def cell(self, node):
+        return self.x0 + int(node) // self.width, self.y0 + int(node) % self.width
+
+
+def to_actions(cells):
+    """
+    Convert a sequence of neighbouring cells into the actions moving along them.
+    Args:
+        cells: list of tuple - (x,y). Cells of the path, including the start cell.
+    Returns: list of Action. Actions to take on the first cell to follow the path.
+    """
+    moves = {(-1, 0): Directions.NORTH, (1, 0): Directions.SOUTH,
+             (0, -1): Directions.WEST, (0, 1): Directions.EAST}
+    return [Action(location=State(b), direction=moves[(b[0] - a[0], b[1] - a[1])])
+            for a, b in zip(cells, cells[1:])]
+
+
+# planners kept per problem array together with the version of the map they were built from
+_planners = {}
+
+
+def hpa_star_search(start, goal, problem, safe_states):
+    """
+    Find a near optimal path from the start state to the goal state using the
+    hierarchical planner of the problem, which is built on the first query and
+    updated locally with the tiles revealed afterwards, as told by an
+    ObservedMap. Other problems are taken as fixed.
+    Args:
+        start: tuple - (x,y). Start state of the agent.
+        goal: tuple - (x,y). Goal state to reach.
+        problem: 2d array of MapTiles. Problem with terrain as map tiles.
+        safe_states: set of State. States the path may go through, all if empty.
+    Returns: tuple(list of Action, int). Sequence of actions to take on start
+    state to reach the goal state and the cost of the path.
+    """
+    key = id(problem)
+    version = getattr(problem, 'version', 0)
+    if key in _planners and _planners[key][0]() is problem:
+        _, planner, built = _planners[key]
+        if version != built:
+            planner.update(problem.revealed_since(built))
+            _planners[key] = (_planners[key][0], planner, version)
+    else:
+        planner = HierarchicalPlanner(problem)
+        reference = weakref.ref(problem, lambda _: _planners.pop(key, None))
+        _planners[key] = (reference, planner, version)
+
+    goal = State(goal)
+    path, cost = planner.search((start[0], start[1]), (goal.x, goal.y))
+    # the abstraction does not know about unsafe states; search them out with plain A*
+    if len(safe_states) > 0 and any(a.location not in safe_states and a.location != goal for a in path):
+        return a_star_search(State(start), State(goal), problem, safe_states)
+    return path, cost
@@ -1,78 +1,78 @@
 # References:
 # 1. Algorithm Adapted from Artificial Intelligence: A Modern Approach, 3rd. Edition, Stuart J. Russell and Peter Norvig, p. 270. Prentice Hall, 2009.
 import sys
-from itertools import product
+import time
 
-from a_star import a_star_search
-from agent import BaseAgent
+from a_star import a_star_search, ara_star_search, bidirectional_a_star_search, satisficing_search
+from agent import BaseAgent, WorldModel
 from base import State
 from depth_limited import depth_limited_search
+from frontier import exploration_frontier
+from hpa_star import hpa_star_search
+from landmarks import landmark_heuristic
 from propositional_kb import PropositionalKB
+from tracing import tracer
 from utils import *
 
 
 class KBAgentRogue(BaseAgent):
 
+    observes_deltas = True
+
     def __init__(self, height, width, initial_strength, name='KB_agent_rogue'):
         super().__init__(height=height, width=width, initial_strength=initial_strength, name=name)
         # persistent: KB, a knowledge base, initially the atemporal “wumpus physics”
         self.kb = PropositionalKB()
+        # persistent: what the agent knows of the world, updated with the changes of each step
+        self.world = WorldModel(height, width)
 
-        self.visited = set()
-        self.unvisited = {State(x) for x in product(range(width), range(height))}
+        self.frontiers = []
 
-        self.len_of_map_objects = 0
+    @property
+    def visited(self):
+        return self.world.visited
 
-        self.frontiers = []
-        self.power_ups = set()
-        self.monsters = set()
-        self.boss = None
-        self.agents = set()
-
-    def on_change_map_objects(self, map_objects):
-        self.power_ups.clear()
-        self.monsters.clear()
-        self.boss = None
-        self.agents.clear()
-        self.frontiers.clear()
-
-        for loc in map_objects:
-            if isinstance(map_objects[loc], PowerUp):
-                self.power_ups.add(loc)
-            if isinstance(map_objects[loc], Boss):
-                self.boss = loc
-            elif isinstance(map_objects[loc], StaticMonster) or isinstance(map_objects[loc], DynamicMonster):
-                self.monsters.add(loc)
-            if isinstance(map_objects[loc], AgentPlaceholder):
-                self.agents.add(loc)
-
-        self.len_of_map_objects = len(map_objects)
+    @property
+    def unvisited(self):
+        return self.world.unvisited
+
+    @property
+    def power_ups(self):
+        return self.world.index['power_up']
+
+    @property
+    def monsters(self):
+        return self.world.index['monster']
+
+    @property
+    def boss(self):
+        return next(iter(self.world.index['boss']), None)
+
+    @property
+    def agents(self):
+        return self.world.index['agent']
+
+    def observe(self, delta):
+        self.world.observe(delta)
 
     def step(self, location, strength, game_map, map_objects):
+        delta = self.world.update(location, game_map, map_objects)
         location = State(location)
-        self.visited.add(location)
-        if location in self.unvisited:
-            self.unvisited.remove(location)
 
         # TELL(KB, MAKE-PERCEPT-SENTENCE(percept, t))
         # self.kb.tell(self.makeSentence(game_map, map_objects))
-        self.kb.tell_percepts(game_map, map_objects)
+        self.kb.tell_percepts(game_map, map_objects, delta)
 
         # TELL the KB the temporal “physics” sentences for time 't'
 
         # safe ← {[x, y] : ASK(KB, OK t x,y) = true}
         # query = Query("ok", getStates())
-        safe, unsafe = set(), set()
-        for x in [State(x) for x in product(range(self.width), range(self.height))]:
-            if self.kb.is_safe(x):
-                safe.add(x)
-            else:
-                unsafe.add(x)
+        safe = self.kb.safe_states()
 
         # # if ASK(KB, Glitter t) = true then
         # query = Query("fight", monster, strength)
-        if len(map_objects) != self.len_of_map_objects:
-            self.on_change_map_objects(map_objects)
+        if len(delta.added) > 0 or len(delta.removed) > 0:
+            self.frontiers.clear()
 
         while len(self.frontiers) == 0:
             # if self.kb.ask(query): ask strength to kb
@@ -83,7 +83,7 @@ class KBAgentRogue(BaseAgent):
             # ASK KB if the strength is greater than skeleton and the dynamic monster
             if len(self.monsters) > 0 and self.kb.has_enough_strength_for_monster(strength):
                 # then fight the monster
-                decision = plan(location, self.monsters, game_map, safe, algorithm='a-star')
+                decision = plan(location, self.monsters, game_map, safe, algorithm='a-star', deadline=self.deadline)
                 self.frontiers = decision[0]
 
             # if plan is empty and ASK(KB, HaveArrow t) = true then
@@ -91,18 +91,18 @@ class KBAgentRogue(BaseAgent):
             if len(self.frontiers) == 0 and self.kb.has_not_enough_strength(strength):
                 # possible wumpus ← {[x, y] : ASK(KB,¬ Wx,y) = false}
                 # plan ← PLAN-SHOT(current, possible wumpus, safe)
-                decision = plan(location, self.power_ups, game_map, safe, algorithm='a-star')
+                decision = plan(location, self.power_ups, game_map, safe, algorithm='a-star', deadline=self.deadline)
                 self.frontiers = decision[0]
             
             # if plan is empty and ASK(KB, agentNearMe) = true then
             if len(self.frontiers) == 0:
                 # possible wumpus ← {[x, y] : ASK(KB,¬ Wx,y) = false}
                 # plan ← PLAN-SHOT(current, possible wumpus, safe)
-                decision = plan(location, self.agents, game_map, safe, algorithm='a-star')
+                decision = plan(location, self.agents, game_map, safe, algorithm='a-star', deadline=self.deadline)
                 self.frontiers = decision[0]
 
             if len(self.frontiers) == 0 and self.boss is not None:
-                decision = plan(location, [self.boss, ], game_map, safe, algorithm='a-star')
+                decision = plan(location, [self.boss, ], game_map, safe, algorithm='a-star', deadline=self.deadline)
                 if self.kb.has_enough_strength_for_boss(strength - decision[1]):
                     self.frontiers = decision[0]
 
@@ -111,16 +111,26 @@ class KBAgentRogue(BaseAgent):
                 # unvisited ← {[x, y] : ASK(KB, Lt x,y  ) = false for all t ≤ t}
                 # query = Query("unknown", getStates())
                 # plan ← PLAN-ROUTE(current, unvisited ∩ safe, safe)
-                decision = plan(location, self.unvisited.intersection(safe), game_map, safe, algorithm='a-star')
+                # only the safe tiles bordering unknown ones are worth a visit, the most revealing first
+                targets = exploration_frontier(self.world.game_map, self.world.location, self.kb.safe_mask())
+                if len(targets) == 0:
+                    targets = {x for x in self.unvisited if x in safe}
+                decision = plan(location, targets, game_map, safe, algorithm='a-star', deadline=self.deadline)
                 self.frontiers = decision[0]
 
             # if plan is empty then // no choice but to take a risk
             if len(self.frontiers) == 0:
                 # not unsafe ← {[x, y] : ASK(KB,¬ OK t x,y) = false}
                 # plan ← PLAN-ROUTE(current, unvisited, safe)
-                decision = plan(location, self.unvisited, game_map, [], algorithm='depth-limited')
+                targets = exploration_frontier(self.world.game_map, self.world.location)
+                decision = plan(location, targets or self.unvisited, game_map, [], algorithm='depth-limited',
+                                deadline=self.deadline)
                 self.frontiers = decision[0]
 
+            # out of time without a plan, make the fallback move rather than search again
+            if len(self.frontiers) == 0 and self.expired():
+                return self.fallback(self.world.location, game_map)
+
             # # if plan is empty then
             # if len(actions) == 0:
             #     # plan ← PLAN-ROUTE(current,{[1, 1]}, safe) + [Climb]
@@ -132,26 +142,80 @@ class KBAgentRogue(BaseAgent):
         action = self.frontiers.pop(0)
         if game_map[action.location.x][action.location.y] == MapTiles.W:
             self.frontiers.clear()
+            if self.expired():
+                return self.fallback(self.world.location, game_map)
             return self.step(location, strength, game_map, map_objects)
         else:
             return action.direction
 
+def plan(start, goals, problem, states, algorithm='a-star', deadline=None):
+    trace = tracer()
+    if trace is None:
+        return plan_route(start, goals, problem, states, algorithm, deadline)
+
+    started = time.perf_counter()
+    path, cost = plan_route(start, goals, problem, states, algorithm, deadline)
+    trace.record('plan:' + algorithm, started, start=start, goals=len(goals) if goals is not None else 0,
+                 length=len(path), cost=cost, found=cost != sys.maxsize,
+                 timed_out=deadline is not None and time.time() >= deadline)
+    return path, cost
+
+
 # conditioning on the algorithm 
-def plan(start, goals, problem, states, algorithm='a-star'):
+def plan_route(start, goals, problem, states, algorithm='a-star', deadline=None):
     if goals is None or len(goals) == 0:
         return [], sys.maxsize
     # if a-star search is used 
     if algorithm == 'a-star':
-        results = [a_star_search(start, State(goal), problem, states) for goal in goals if goal is not None]
-        results = sorted(results, key=lambda x: x[1])
-        return results[0]
+        return cheapest(lambda goal: a_star_search(start, goal, problem, states, deadline=deadline), goals, deadline)
+    # if a-star with the landmark heuristic of the map is used
+    if algorithm == 'alt-a-star':
+        heuristic = landmark_heuristic(problem)
+        return cheapest(lambda goal: a_star_search(start, goal, problem, states, heuristic, deadline), goals, deadline)
+    # if any path within the satisficity (calories) is good enough
+    if algorithm == 'satisficing':
+        return cheapest(lambda goal: satisficing_search(start, goal, problem, states), goals, deadline)
+    # if anytime a-star is used, improving each path while its time limit allows
+    if algorithm == 'ara-star':
+        return cheapest(lambda goal: ara_star_search(start, goal, problem, states), goals, deadline)
+    # if bidirectional a-star is used
+    if algorithm == 'bidirectional-a-star':
+        return cheapest(lambda goal: bidirectional_a_star_search(start, goal, problem, states), goals, deadline)
+    # if hierarchical a-star is used
+    if algorithm == 'hpa-star':
+        return cheapest(lambda goal: hpa_star_search(start, goal, problem, states), goals, deadline)
     # if depth-limited is used
     if algorithm == 'depth-limited':
-        return depth_limited_search(start, goals, problem)
+        return depth_limited_search(start, [State(goal) for goal in goals if goal is not None], problem, deadline)
 
     raise ValueError
 
-    # agent = KBAgentRogue(10,10, 100)
+
+def cheapest(search, goals, deadline=None):
+    """
+    Cheapest of the paths found to each goal.
+    Args:
+        search: function(State). Search of a path to the goal, returning (path, cost).
+        goals: iterable of tuple - (x,y). Goals to search a path to, None entries are skipped.
+        deadline: float. Time (as of time.time()) after which the remaining goals are
+        left out, once at least one was searched.
+    Returns: tuple(list, int). The path and its cost, ([], sys.maxsize) without goals.
+    """
+    best = None
+    for goal in goals:
+        if goal is None:
+            continue
+        result = search(State(goal))
+        if best is None or result[1] < best[1]:
+            best = result
+        if deadline is not None and time.time() >= deadline:
+            break
+    if best is None:
+        return [], sys.maxsize
+    return best
+
+
+# agent = KBAgentRogue(10,10, 100)
 # agent.step((3,2), 100, [
 #     [MapTiles.U,MapTiles.U,MapTiles.U,MapTiles.U],
 #     [MapTiles.U,MapTiles.U,MapTiles.U,MapTiles.U],
@@ -0,0 +1,138 @@
+# References:
+# 1. Andrew V. Goldberg and Chris Harrelson, Computing the Shortest Path: A* Search Meets Graph Theory,
+#    Proceedings of the 16th ACM-SIAM Symposium on Discrete Algorithms, 2005.
+import weakref
+
+import numpy as np
+
+from a_star import cost_grid, grid_graph, heuristic_cost
+
+
+class LandmarkHeuristic(object):
+    """
+    ALT (A*, landmarks and triangle inequality) heuristic. Exact costs from and
+    to a few landmarks are computed once per version of the map; the cost from
+    a state v to a goal t is then bounded below by d(L, t) - d(L, v) and
+    d(v, L) - d(t, L) for every landmark L. Moving onto a tile costs its terrain
+    cost, so costs are not symmetric and both tables are kept. The bounds are
+    only computed for the states the search asks about.
+    """
+
+    def __init__(self, problem, num_landmarks=8):
+        """
+        Constructor
+        Args:
+            problem: 2d array of MapTiles. Problem with terrain as map tiles.
+            num_landmarks: int. Number of landmarks to choose.
+        """
+        self.problem = problem
+        self.num_landmarks = num_landmarks
+        self.landmarks = []
+        self._version = None
+        self._goal, self._goal_costs = None, None
+        self.refresh()
+
+    def refresh(self):
+        """
+        Recompute the landmark tables if tiles of the problem were revealed since they were
+        computed, as told by the version of an ObservedMap. Other problems are taken as fixed.
+        Returns: bool. Whether the tables were recomputed.
+        """
+        from scipy.sparse.csgraph import dijkstra
+
+        version = getattr(self.problem, 'version', 0)
+        if self._version == version:
+            return False
+        self._version = version
+
+        costs = cost_grid(self.problem)
+        graph = grid_graph(costs)
+        self.landmarks = self._choose_landmarks(graph, costs)
+        # costs from the landmarks, and to the landmarks (from the reversed graph), of each tile
+        # as one row, so a state reads its costs with a single lookup
+        self._from = dijkstra(graph, directed=True, indices=self.landmarks).T.reshape(*costs.shape, -1).copy()
+        self._to = dijkstra(graph.T, directed=True, indices=self.landmarks).T.reshape(*costs.shape, -1).copy()
+        self._goal, self._goal_costs = None, None
+        return True
+
+    def _choose_landmarks(self, graph, costs):
+        """
+        Farthest point selection: each landmark is the reachable tile farthest
+        from the landmarks chosen so far.
+        """
+        from scipy.sparse.csgraph import dijkstra
+
+        passable = np.flatnonzero(np.isfinite(costs))
+        if len(passable) == 0:
+            return []
+        # start from the tile farthest from the first passable tile
+        distances = dijkstra(graph, directed=True, indices=passable[0])
+        landmarks = []
+        closest = np.where(np.isfinite(distances), distances, -1)
+        while len(landmarks) < min(self.num_landmarks, len(passable)):
+            landmark = int(np.argmax(closest))
+            if landmark in landmarks:
+                break
+            landmarks.append(landmark)
+            distances = dijkstra(graph, directed=True, indices=landmark)
+            closest = np.minimum(closest, np.where(np.isfinite(distances), distances, -1))
+        return landmarks
+
+    def bound(self, state, goal):
+        """
+        Lower bound of the cost to reach the goal from the state given by the landmarks.
+        Args:
+            state: tuple(x,y). The current state.
+            goal: tuple(x,y). The goal state.
+        Returns: float. The largest bound of any landmark, 0 if none tells anything.
+        """
+        goal = (int(goal[0]), int(goal[1]))
+        if self._goal != goal:
+            self._goal_costs = list(zip(self._from[goal].tolist(), self._to[goal].tolist()))
+            self._goal = goal
+        best = 0.0
+        for (goal_from, goal_to), state_from, state_to in zip(self._goal_costs, self._from[state[0], state[1]].tolist(),
+                                                               self._to[state[0], state[1]].tolist()):
+            # inf - inf (both unreachable from a landmark) is nan and tells nothing about the goal
+            forward, backward = goal_from - state_from, state_to - goal_to
+            if forward > best:
+                best = forward
+            if backward > best:
+                best = backward
+        return best
+
+    def __call__(self, state, goal):
+        """
+        Estimate the cost to reach the goal from the state; never less than the Manhattan distance.
+        Args:
+            state: tuple(x,y). The current state.
+            goal: tuple(x,y). The goal state.
+        Returns: float. Estimated cost to reach the goal.
+        """
+        if not self.landmarks:
+            return heuristic_cost(state, goal)
+        return max(self.bound(state, goal), heuristic_cost(state, goal))
+
+
+# heuristics kept per problem array; they refresh themselves when tiles are revealed
+_heuristics = {}
+
+
+def landmark_heuristic(problem, num_landmarks=8):
+    """
+    Get the landmark heuristic of the problem, built on the first call and
+    recomputed only when tiles of the problem were revealed since the last call.
+    Args:
+        problem: 2d array of MapTiles. Problem with terrain as map tiles.
+        num_landmarks: int. Number of landmarks to choose.
+    Returns: LandmarkHeuristic. Heuristic to pass to `a_star_search`.
+    """
+    key = id(problem)
+    if key in _heuristics and _heuristics[key][0]() is problem:
+        heuristic = _heuristics[key][1]
+        heuristic.refresh()
+    else:
+        heuristic = LandmarkHeuristic(problem, num_landmarks)
+        reference = weakref.ref(problem, lambda _: _heuristics.pop(key, None))
+        _heuristics[key] = (reference, heuristic)
+    return heuristic
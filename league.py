@@ -0,0 +1,528 @@
+import contextlib
+import os
+import random
+import sqlite3
+import sys
+import time
+from argparse import ArgumentParser
+from functools import partial
+
+import numpy as np
+
+from agent import RandomAgent
+from driver import GameDriver, play_batch
+from knowledge_based_agent import KBAgentRogue
+from metrics import REGISTRY, FileExporter, start_http_server
+from problem_solving_agent import ProblemSolvingAgent
+from sequential import INTERVALS, SPRT, WinRateEstimate
+from utils import InvalidMapError
+import tracing
+
+AGENTS = {
+    'random': RandomAgent,
+    'kb': KBAgentRogue,
+    'problem-solving': ProblemSolvingAgent,
+}
+
+LEAGUE_GAMES = REGISTRY.counter('league_games_total', 'Games recorded by the league, by agent and outcome',
+                                ['agent', 'outcome'])
+LEAGUE_GAME_SECONDS = REGISTRY.histogram('league_game_seconds', 'Wall time of each game of the league', ['agent'],
+                                         buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0, 300.0))
+
+# rating of an agent before its first comparison, and the Elo K-factor
+INITIAL_RATING = 1500.0
+RATING_FACTOR = 16.0
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS games (
+    agent TEXT NOT NULL,
+    config TEXT NOT NULL,
+    seed INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    width INTEGER NOT NULL,
+    num_powerups INTEGER NOT NULL,
+    num_monsters INTEGER NOT NULL,
+    num_dynamic_monsters INTEGER NOT NULL,
+    initial_strength INTEGER NOT NULL,
+    outcome TEXT NOT NULL,
+    steps INTEGER,
+    duration REAL NOT NULL,
+    error TEXT,
+    finished_at REAL NOT NULL,
+    PRIMARY KEY (agent, config, seed)
+);
+CREATE INDEX IF NOT EXISTS games_by_map ON games (config, seed);
+
+CREATE TABLE IF NOT EXISTS standings (
+    agent TEXT NOT NULL,
+    config TEXT NOT NULL,
+    games INTEGER NOT NULL DEFAULT 0,
+    wins INTEGER NOT NULL DEFAULT 0,
+    errors INTEGER NOT NULL DEFAULT 0,
+    steps INTEGER NOT NULL DEFAULT 0,
+    duration REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (agent, config)
+);
+
+-- the standings are kept up to date with each recorded game, maps that could not be created do not count
+CREATE TRIGGER IF NOT EXISTS count_game AFTER INSERT ON games WHEN NEW.outcome != 'invalid'
+BEGIN
+    INSERT OR IGNORE INTO standings (agent, config) VALUES (NEW.agent, NEW.config);
+    UPDATE standings SET games = games + 1,
+                         wins = wins + (NEW.outcome = 'won'),
+                         errors = errors + (NEW.outcome = 'error'),
+                         steps = steps + COALESCE(NEW.steps, 0),
+                         duration = duration + NEW.duration
+    WHERE agent = NEW.agent AND config = NEW.config;
+END;
+
+CREATE TABLE IF NOT EXISTS ratings (
+    agent TEXT PRIMARY KEY,
+    rating REAL NOT NULL,
+    matches INTEGER NOT NULL DEFAULT 0
+);
+'''
+
+
+def config_name(config):
+    """
+    Name of a map configuration, as stored with its games. The step budget changes the outcomes,
+    so games played with different budgets are kept apart.
+    Args:
+        config: dict. Height, width, num_powerups, num_monsters, num_dynamic_monsters and
+            initial_strength of the games, and optionally the step_time of the agents in seconds.
+    Returns: str. For instance '10x10-p2-m1-d1-s100', or '10x10-p2-m1-d1-s100-t0.5' with a step budget.
+    """
+    name = '%dx%d-p%d-m%d-d%d-s%d' % (config['height'], config['width'], config['num_powerups'],
+                                      config['num_monsters'], config['num_dynamic_monsters'],
+                                      config['initial_strength'])
+    if config.get('step_time') is not None:
+        name += '-t%g' % config['step_time']
+    return name
+
+
+class ResultStore(object):
+    """
+    SQLite store of the finished games of a league.
+
+    Games are inserted in transactions of `batch_size` games, so a league
+    that is interrupted loses at most the games of the open transaction.
+    The win rates of each agent and configuration are maintained by a
+    trigger as games are inserted, and the Elo rating of each agent is
+    updated against the games already played on the same map, so neither
+    needs a scan of the games.
+    """
+
+    def __init__(self, path, batch_size=20):
+        """
+        Constructor
+        Args:
+            path: str. Path of the SQLite database, created if needed.
+            batch_size: int. Number of games recorded per transaction.
+        """
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        self.batch_size = batch_size
+        self._pending = 0
+
+    def done(self, config):
+        """
+        Returns: set of tuple(str, int). Agent and seed of the games already recorded for the configuration.
+        """
+        rows = self.connection.execute('SELECT agent, seed FROM games WHERE config = ?', (config_name(config),))
+        return set(rows)
+
+    def outcome(self, agent, config, seed):
+        """
+        Returns: str. Outcome of the game of the agent on the map, None if it was not played.
+        """
+        row = self.connection.execute('SELECT outcome FROM games WHERE agent = ? AND config = ? AND seed = ?',
+                                      (agent, config_name(config), seed)).fetchone()
+        return row[0] if row is not None else None
+
+    def record_of(self, agent, config):
+        """
+        Returns: tuple(int, int). Games played and won by the agent on the configuration.
+        """
+        row = self.connection.execute('SELECT games, wins FROM standings WHERE agent = ? AND config = ?',
+                                      (agent, config_name(config))).fetchone()
+        return row if row is not None else (0, 0)
+
+    def record(self, agent, config, seed, outcome, steps, duration, error=None):
+        """
+        Record a finished game, and commit once `batch_size` games are pending.
+        Args:
+            agent: str. Name of the agent in AGENTS.
+            config: dict. Map configuration of the game.
+            seed: int. Seed the map and the game were generated from.
+            outcome: str. One of 'won', 'died', 'error' and 'invalid'.
+            steps: int. Number of steps played, None if the game did not start.
+            duration: float. Wall time of the game in seconds.
+            error: str. Message of the exception that ended the game, if any.
+        """
+        name = config_name(config)
+        self.connection.execute(
+            'INSERT INTO games VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (agent, name, seed, config['height'], config['width'], config['num_powerups'],
+             config['num_monsters'], config['num_dynamic_monsters'], config['initial_strength'],
+             outcome, steps, duration, error, time.time()))
+        if outcome != 'invalid':
+            self._rate(agent, name, seed, outcome)
+
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self.commit()
+
+    def _rate(self, agent, config, seed, outcome):
+        # Elo update against every other agent that played the same map, a win beats anything else
+        opponents = self.connection.execute(
+            "SELECT agent, outcome FROM games WHERE config = ? AND seed = ? AND agent != ? AND outcome != 'invalid'",
+            (config, seed, agent)).fetchall()
+        if len(opponents) == 0:
+            return
+
+        rating = self.rating(agent)
+        for opponent, opponent_outcome in opponents:
+            opponent_rating = self.rating(opponent)
+            score = ((outcome == 'won') - (opponent_outcome == 'won') + 1) / 2.0
+            expected = 1.0 / (1.0 + 10 ** ((opponent_rating - rating) / 400.0))
+            change = RATING_FACTOR * (score - expected)
+            rating += change
+            self.connection.execute('UPDATE ratings SET rating = ?, matches = matches + 1 WHERE agent = ?',
+                                    (opponent_rating - change, opponent))
+        self.connection.execute('UPDATE ratings SET rating = ?, matches = matches + ? WHERE agent = ?',
+                                (rating, len(opponents), agent))
+
+    def rating(self, agent):
+        """
+        Returns: float. Elo rating of the agent, INITIAL_RATING before its first comparison.
+        """
+        self.connection.execute('INSERT OR IGNORE INTO ratings (agent, rating) VALUES (?, ?)', (agent, INITIAL_RATING))
+        return self.connection.execute('SELECT rating FROM ratings WHERE agent = ?', (agent,)).fetchone()[0]
+
+    def commit(self):
+        self.connection.commit()
+        self._pending = 0
+
+    def close(self):
+        self.commit()
+        self.connection.close()
+
+    def standings(self):
+        """
+        Returns: list of tuple(str, str, int, int, float, float, float). Agent, configuration,
+            games, wins, win rate, mean steps and mean duration of each pair.
+        """
+        return self.connection.execute(
+            'SELECT agent, config, games, wins, CAST(wins AS REAL) / games, CAST(steps AS REAL) / games, '
+            'duration / games FROM standings WHERE games > 0 ORDER BY config, agent').fetchall()
+
+    def ratings(self):
+        """
+        Returns: list of tuple(str, float, int). Agent, rating and number of comparisons, best first.
+        """
+        return self.connection.execute('SELECT agent, rating, matches FROM ratings ORDER BY rating DESC').fetchall()
+
+
+def play_game(agent, config, seed):
+    """
+    Play one game of an agent, with the map and the game seeded by `seed`.
+    Args:
+        agent: str. Name of the agent in AGENTS.
+        config: dict. Map configuration of the game, with the step budget of the agent if any.
+        seed: int. Seed of the map and of the game.
+    Returns: tuple(str, int, float, str). Outcome, steps, duration and error message.
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    player = AGENTS[agent](config['height'], config['width'], config['initial_strength'])
+
+    driver, outcome, error = None, None, None
+    started = time.time()
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            driver = GameDriver(height=config['height'], width=config['width'],
+                                num_powerups=config['num_powerups'], num_monsters=config['num_monsters'],
+                                num_dynamic_monsters=config['num_dynamic_monsters'], agents=[player],
+                                initial_strength=config['initial_strength'], show_map=False,
+                                map_type='ascii', step_time=config.get('step_time'))
+            driver.play()
+    except InvalidMapError:
+        outcome = 'invalid'
+    except StopIteration as e:
+        outcome = 'won' if 'won' in str(e) else 'died'
+    except Exception as e:
+        outcome, error = 'error', '%s: %s' % (type(e).__name__, e)
+    duration = time.time() - started
+
+    return outcome, driver.steps if driver is not None else None, duration, error
+
+
+def play_games(agent, config, seeds):
+    """
+    Play games of an agent in lockstep, one per seed, with the maps seeded as in `play_game`.
+    An agent implementing `step_batch` plays all the games with a single instance, and decides
+    its moves in all of them in one call. The games draw their randomness in turn, so their
+    outcomes differ from those of `play_game`.
+    Args:
+        agent: str. Name of the agent in AGENTS.
+        config: dict. Map configuration of the games, with the step budget of the agent if any.
+        seeds: list of int. Seeds of the maps.
+    Returns: list of tuple(str, int, float, str). Outcome, steps, duration and error message of each
+        game, the duration being an equal share of the time of all the games.
+    """
+    results, drivers, games = [None] * len(seeds), [], []
+    shared = None
+    started = time.time()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for n, seed in enumerate(seeds):
+            random.seed(seed)
+            np.random.seed(seed)
+            if AGENTS[agent].batches_natively():
+                if shared is None:
+                    shared = AGENTS[agent](config['height'], config['width'], config['initial_strength'])
+                player = shared
+            else:
+                player = AGENTS[agent](config['height'], config['width'], config['initial_strength'])
+            try:
+                drivers.append(GameDriver(height=config['height'], width=config['width'],
+                                          num_powerups=config['num_powerups'], num_monsters=config['num_monsters'],
+                                          num_dynamic_monsters=config['num_dynamic_monsters'], agents=[player],
+                                          initial_strength=config['initial_strength'], show_map=False,
+                                          map_type='ascii', step_time=config.get('step_time')))
+                games.append(n)
+            except InvalidMapError:
+                results[n] = ('invalid', None, None)
+            except Exception as e:
+                results[n] = ('error', None, '%s: %s' % (type(e).__name__, e))
+        ends = play_batch(drivers)
+    duration = (time.time() - started) / len(seeds)
+
+    for n, driver, end in zip(games, drivers, ends):
+        if isinstance(end, StopIteration):
+            results[n] = ('won' if 'won' in str(end) else 'died', driver.steps, None)
+        else:
+            results[n] = ('error', driver.steps, '%s: %s' % (type(end).__name__, end))
+    return [(outcome, steps, duration, error) for outcome, steps, error in results]
+
+
+def record_game(store, agent, config, seed, verbose=True):
+    """
+    Play and record a game, unless it was already recorded.
+    Returns: str. Outcome of the game.
+    """
+    outcome = store.outcome(agent, config, seed)
+    if outcome is not None:
+        return outcome
+    return store_game(store, agent, config, seed, play_game(agent, config, seed), verbose)
+
+
+def record_games(store, agent, config, seeds, verbose=True):
+    """
+    Play in lockstep and record the games of the seeds not recorded yet.
+    Returns: list of str. Outcome of the game of each seed.
+    """
+    outcomes = {seed: store.outcome(agent, config, seed) for seed in seeds}
+    missing = [seed for seed in seeds if outcomes[seed] is None]
+    if len(missing) > 0:
+        for seed, result in zip(missing, play_games(agent, config, missing)):
+            outcomes[seed] = store_game(store, agent, config, seed, result, verbose)
+    return [outcomes[seed] for seed in seeds]
+
+
+def store_game(store, agent, config, seed, result, verbose=True):
+    """
+    Record a game played.
+    Args:
+        result: tuple(str, int, float, str). Outcome, steps, duration and error message of the game.
+    Returns: str. Outcome of the game.
+    """
+    outcome, steps, duration, error = result
+    store.record(agent, config, seed, outcome, steps, duration, error)
+    LEAGUE_GAMES.labels(agent, outcome).inc()
+    LEAGUE_GAME_SECONDS.labels(agent).observe(duration)
+    if verbose:
+        print('%-16s %-20s seed=%-6d %-8s steps=%-6s time=%.2fs' % (
+            agent, config_name(config), seed, outcome, steps, duration))
+    return outcome
+
+
+def run_league(store, agents, configs, seeds, estimator=None, verbose=True, lockstep=1):
+    """
+    Play every agent on every configuration and seed, skipping the games already recorded.
+    Args:
+        store: ResultStore. Store of the finished games.
+        agents: list of str. Names of the agents in AGENTS.
+        configs: list of dict. Map configurations, with the step budget of the agents if any.
+        seeds: iterable of int. Seeds of the maps.
+        estimator: function(wins, games). WinRateEstimate of an agent from the games it already
+            played; an agent stops playing a configuration once its estimate is done. All the
+            seeds are played if None.
+        verbose: bool. Whether to print every game as it is recorded.
+        lockstep: int. Number of seeds whose games an agent plays at once with `play_games`. The
+            estimates are updated after each group of games.
+    Returns: int. Number of games played.
+    """
+    played = 0
+    seeds = list(seeds)
+    try:
+        for config in configs:
+            done = store.done(config)
+            estimates = {}
+            if estimator is not None:
+                for agent in agents:
+                    games, wins = store.record_of(agent, config)
+                    estimates[agent] = estimator(wins=wins, games=games)
+
+            for first in range(0, len(seeds), lockstep):
+                playing = [agent for agent in agents if agent not in estimates or not estimates[agent].done()]
+                if len(playing) == 0:
+                    break
+                for agent in playing:
+                    missing = [seed for seed in seeds[first:first + lockstep] if (agent, seed) not in done]
+                    if len(missing) == 0:
+                        continue
+                    if len(missing) == 1:
+                        outcomes = [record_game(store, agent, config, missing[0], verbose)]
+                    else:
+                        outcomes = record_games(store, agent, config, missing, verbose)
+                    played += len(missing)
+                    for outcome in outcomes:
+                        if agent in estimates and outcome != 'invalid':
+                            estimates[agent].update(outcome == 'won')
+    finally:
+        store.commit()
+    return played
+
+
+def run_sprt(store, agents, config, seeds, test, verbose=True):
+    """
+    Play two agents on the same maps until the sequential test decides whether the first one is better.
+    Args:
+        store: ResultStore. Store of the finished games, whose games are reused.
+        agents: tuple(str, str). Names of the agents A and B in AGENTS.
+        config: dict. Map configuration, with the step budget of the agents if any.
+        seeds: iterable of int. Seeds of the maps.
+        test: SPRT. Test of A against B.
+        verbose: bool. Whether to print every game as it is recorded.
+    Returns: str. 'H1' if A is better, 'H0' if it is not, None if the seeds ran out first.
+    """
+    try:
+        for seed in seeds:
+            outcomes = [record_game(store, agent, config, seed, verbose) for agent in agents]
+            if 'invalid' in outcomes:
+                continue
+            decision = test.update(outcomes[0] == 'won', outcomes[1] == 'won')
+            if decision is not None:
+                return decision
+    finally:
+        store.commit()
+    return None
+
+
+def main(args):
+    parser = ArgumentParser(description='Play a resumable league of the agents and record the games in SQLite')
+
+    parser.add_argument('--db', type=str, default='league.db',
+                        help='Path of the SQLite database of the games')
+    parser.add_argument('--agents', nargs='+', choices=list(AGENTS), default=list(AGENTS),
+                        help='Agents to play')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10],
+                        help='Sizes of the square maps')
+    parser.add_argument('--num-powerups', type=int, default=2,
+                        help='Number of powerups to put in the game map')
+    parser.add_argument('--num-monsters', type=int, default=1,
+                        help='Number of monsters to put in the game map')
+    parser.add_argument('--num-dynamic-monsters', type=int, default=1,
+                        help='Number of dynamic monsters to put in the game')
+    parser.add_argument('--initial-strength', type=int, default=100,
+                        help='Initial strength of each agent')
+    parser.add_argument('--games', type=int, default=100,
+                        help='Number of maps (seeds) per configuration')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='First seed of the maps')
+    parser.add_argument('--step-time', type=float,
+                        help='Time budget of each step of an agent in seconds')
+    parser.add_argument('--batch-size', type=int, default=20,
+                        help='Number of games recorded per transaction')
+    parser.add_argument('--lockstep', type=int, default=1,
+                        help='Number of games an agent plays at once, deciding its moves in all of them '
+                        'in one call if it implements step_batch; games played at once draw their '
+                        'randomness together, so their outcomes differ from those of games played alone')
+    parser.add_argument('--precision', type=float,
+                        help='Stop playing an agent once the confidence interval of its win rate is '
+                        'this narrow (half-width); every seed is played if not set')
+    parser.add_argument('--interval', choices=INTERVALS, default='wilson',
+                        help='Confidence interval of the win rates. Choices are {' + ', '.join(INTERVALS) + '}')
+    parser.add_argument('--confidence', type=float, default=0.95,
+                        help='Confidence level of the intervals')
+    parser.add_argument('--min-games', type=int, default=10,
+                        help='Number of games played before stopping early')
+    parser.add_argument('--sprt', nargs=2, choices=list(AGENTS), metavar='AGENT',
+                        help='Play two agents on the same maps until a sequential probability ratio test '
+                        'decides whether the first one is better')
+    parser.add_argument('--sprt-p1', type=float, default=0.65,
+                        help='Probability of the first agent winning a map only one of them wins, if it is better')
+    parser.add_argument('--sprt-error', type=float, default=0.05,
+                        help='Probability of each wrong decision of the test')
+    parser.add_argument('--metrics-port', type=int,
+                        help='Serve the metrics in the Prometheus text format on this local port')
+    parser.add_argument('--metrics-file', type=str,
+                        help='Path of a file to rewrite with the metrics in the Prometheus text format')
+    parser.add_argument('--metrics-interval', type=float, default=10.0,
+                        help='Seconds between two rewrites of the metrics file')
+    parser.add_argument('--trace', action='store_true',
+                        help='Record the planner calls and print their summary and the slowest of them')
+    parser.add_argument('--quiet', action='store_true',
+                        help='Only print the standings')
+
+    args = parser.parse_args(args)
+
+    configs = [{'height': size, 'width': size, 'num_powerups': args.num_powerups,
+                'num_monsters': args.num_monsters, 'num_dynamic_monsters': args.num_dynamic_monsters,
+                'initial_strength': args.initial_strength, 'step_time': args.step_time} for size in args.sizes]
+    seeds = range(args.seed, args.seed + args.games)
+
+    server = start_http_server(args.metrics_port) if args.metrics_port is not None else None
+    exporter = FileExporter(args.metrics_file, args.metrics_interval).start() if args.metrics_file else None
+
+    if args.trace:
+        tracing.enable()
+
+    store = ResultStore(args.db, batch_size=args.batch_size)
+    try:
+        if args.sprt:
+            for config in configs:
+                test = SPRT(p1=args.sprt_p1, alpha=args.sprt_error, beta=args.sprt_error)
+                decision = run_sprt(store, args.sprt, config, seeds, test, verbose=not args.quiet)
+                verdict = {'H1': 'is better than', 'H0': 'is not better than', None: 'is undecided against'}
+                print('%s %s %s on %s after %d maps (%d decisive, llr=%.3f)' % (
+                    args.sprt[0], verdict[decision], args.sprt[1], config_name(config), test.pairs,
+                    test.decisive, test.llr))
+        else:
+            estimator = None
+            if args.precision is not None:
+                estimator = partial(WinRateEstimate, method=args.interval, confidence=args.confidence,
+                                    precision=args.precision, min_games=args.min_games)
+            run_league(store, args.agents, configs, seeds, estimator=estimator, verbose=not args.quiet,
+                       lockstep=args.lockstep)
+
+        for agent, config, games, wins, win_rate, steps, duration in store.standings():
+            estimate = WinRateEstimate(args.interval, args.confidence, wins=wins, games=games)
+            print('%-16s %-20s games=%-6d wins=%-6d win rate=%.4f [%.4f, %.4f] steps=%.1f time=%.2fs' % (
+                (agent, config, games, wins, win_rate) + estimate.interval() + (steps, duration)))
+        for agent, rating, matches in store.ratings():
+            print('%-16s rating=%.1f comparisons=%d' % (agent, rating, matches))
+        if args.trace:
+            print(tracing.disable().report())
+    finally:
+        store.close()
+        if exporter is not None:
+            exporter.stop()
+        if server is not None:
+            server.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,274 @@
+import os
+import threading
+from bisect import bisect_left
+
+# upper bounds of the buckets of the latency histograms, in seconds
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+
+class _Child(object):
+    """
+    Values of a metric for one set of label values.
+
+    Each thread updates its own shard, a list of floats created the first
+    time it touches the metric, so updates take no lock; the shards are
+    summed when the metric is collected.
+    """
+
+    def __init__(self, size):
+        self._size = size
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = [0.0] * self._size
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def values(self):
+        with self._lock:
+            shards = list(self._shards)
+        totals = [0.0] * self._size
+        for shard in shards:
+            for i, value in enumerate(list(shard)):
+                totals[i] += value
+        return totals
+
+
+class CounterChild(_Child):
+
+    def __init__(self):
+        super().__init__(1)
+
+    def inc(self, amount=1):
+        self._shard()[0] += amount
+
+
+class HistogramChild(_Child):
+
+    def __init__(self, buckets):
+        # one count per bucket and one for +Inf, then the sum and the count of the observations
+        super().__init__(len(buckets) + 3)
+        self._buckets = buckets
+
+    def observe(self, value):
+        shard = self._shard()
+        shard[bisect_left(self._buckets, value)] += 1
+        shard[-2] += value
+        shard[-1] += 1
+
+
+class Metric(object):
+    """
+    Counter or histogram, with one child per set of label values.
+    """
+
+    def __init__(self, name, documentation, kind, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """
+        Returns: CounterChild or HistogramChild. Values of the metric for the label values,
+            which callers on a hot path can keep instead of looking them up again.
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError('%s takes the labels %s' % (self.name, ', '.join(self.labelnames)))
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = CounterChild() if self.kind == 'counter' else HistogramChild(self.buckets)
+                    self._children[values] = child
+        return child
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def exposition(self):
+        """
+        Returns: list of str. Lines of the metric in the Prometheus text format.
+        """
+        lines = ['# HELP %s %s' % (self.name, self.documentation.replace('\\', '\\\\').replace('\n', '\\n')),
+                 '# TYPE %s %s' % (self.name, self.kind)]
+        with self._lock:
+            children = sorted(self._children.items())
+        for values, child in children:
+            labels = list(zip(self.labelnames, values))
+            totals = child.values()
+            if self.kind == 'counter':
+                lines.append('%s%s %s' % (self.name, _format_labels(labels), _format_value(totals[0])))
+                continue
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float('inf'),), totals):
+                cumulative += count
+                lines.append('%s_bucket%s %s' % (self.name, _format_labels(labels + [('le', bound)]),
+                                                 _format_value(cumulative)))
+            lines.append('%s_sum%s %s' % (self.name, _format_labels(labels), _format_value(totals[-2])))
+            lines.append('%s_count%s %s' % (self.name, _format_labels(labels), _format_value(totals[-1])))
+        return lines
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(labels):
+    if len(labels) == 0:
+        return ''
+    pairs = []
+    for name, value in labels:
+        value = _format_value(value) if isinstance(value, float) else str(value)
+        value = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append('%s="%s"' % (name, value))
+    return '{%s}' % ','.join(pairs)
+
+
+class Registry(object):
+    """
+    Metrics of the process, exported together in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, name, documentation, kind, labelnames, buckets=LATENCY_BUCKETS):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = Metric(name, documentation, kind, labelnames, buckets)
+            elif metric.kind != kind or metric.labelnames != tuple(labelnames):
+                raise ValueError('Metric %s is already registered differently' % name)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(name, documentation, 'counter', labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(name, documentation, 'histogram', labelnames, buckets)
+
+    def exposition(self):
+        """
+        Returns: str. Every metric in the Prometheus text format.
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        lines = []
+        for _, metric in metrics:
+            lines.extend(metric.exposition())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# metrics of the game driver
+GAMES = REGISTRY.counter('games_total', 'Games that ended, by outcome', ['outcome'])
+GAME_STEPS = REGISTRY.counter('game_steps_total', 'Steps taken by the agents')
+AGENT_STEP_SECONDS = REGISTRY.histogram('agent_step_seconds', 'Time taken by each step of an agent', ['agent'])
+
+# metrics of the path planners
+PLANNER_CALLS = REGISTRY.counter('planner_calls_total', 'Calls of the path planners', ['planner'])
+PLANNER_EXPANSIONS = REGISTRY.counter('planner_nodes_expanded_total', 'Nodes expanded by the path planners',
+                                      ['planner'])
+
+
+def record_plan(planner, expanded):
+    """
+    Count a call of a path planner and the nodes it expanded.
+    """
+    PLANNER_CALLS.labels(planner).inc()
+    PLANNER_EXPANSIONS.labels(planner).inc(expanded)
+
+
+def start_http_server(port, host='127.0.0.1', registry=REGISTRY):
+    """
+    Serve the metrics over HTTP from a daemon thread.
+    Args:
+        port: int. Port to listen on, any free port if 0.
+        host: str. Address to listen on, local only by default.
+        registry: Registry. Metrics to serve.
+    Returns: ThreadingHTTPServer. The server, whose `shutdown` stops it.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = registry.exposition().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True)
+    thread.start()
+    return server
+
+
+class FileExporter(object):
+    """
+    Rewrite the metrics to a file periodically from a daemon thread, for
+    instance for the textfile collector of the Prometheus node exporter.
+    The file is replaced atomically, so readers never see it half written.
+    """
+
+    def __init__(self, path, interval=10.0, registry=REGISTRY):
+        """
+        Constructor
+        Args:
+            path: str. Path of the file.
+            interval: float. Seconds between two rewrites.
+            registry: Registry. Metrics to write.
+        """
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def write(self):
+        temporary = '%s.%d.tmp' % (self.path, os.getpid())
+        with open(temporary, 'w') as f:
+            f.write(self.registry.exposition())
+        os.replace(temporary, self.path)
+
+    def start(self):
+        def run():
+            while not self._stopped.wait(self.interval):
+                self.write()
+
+        self._thread = threading.Thread(target=run, name='metrics-file', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop the thread and write the metrics a last time.
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.write()
@@ -0,0 +1,51 @@
+import time
+
+import numpy as np
+
+from agent import BaseAgent
+from rollout import DIRECTIONS, RolloutEngine
+
+
+class MCAgent(BaseAgent):
+    """
+    Monte Carlo agent: moves in the direction whose random playouts, simulated
+    from what the agent knows of the map, have the highest average value
+
+    Parameters
+    ----------
+    height: int
+        Height of the game map
+    width: int
+        Width of the game map
+    initial_strength: int
+        Initial strength of the agent
+    name: str
+        Name of the agent
+    num_playouts: int
+        Number of playouts of each direction per batch
+    horizon: int
+        Number of steps of each playout
+    """
+
+    def __init__(self, height, width, initial_strength, name='mc_agent', num_playouts=1000, horizon=20):
+        super().__init__(height=height, width=width, initial_strength=initial_strength, name=name)
+        self.num_playouts = num_playouts
+        self.horizon = horizon
+        # strength the agent is restored to after beating a monster, the highest seen so far
+        self.max_strength = initial_strength
+
+    def step(self, location, strength, game_map, map_objects):
+        self.max_strength = max(self.max_strength, strength)
+        engine = RolloutEngine(game_map, map_objects, strength, self.max_strength)
+
+        # one batch, and more while another one fits before the deadline of the step
+        started = time.time()
+        totals = engine.evaluate(location, self.num_playouts, self.horizon)
+        batches, duration = 1, time.time() - started
+        while self.deadline is not None and time.time() + duration < self.deadline:
+            totals = totals + engine.evaluate(location, self.num_playouts, self.horizon)
+            batches += 1
+
+        values = totals / batches
+        best = np.flatnonzero(values == values.max())
+        return DIRECTIONS[np.random.choice(best)]
@@ -0,0 +1,229 @@
+from array import array
+
+import numpy as np
+
+from utils import MapTiles
+
+
+class RevealMask(object):
+    """
+    Tiles of the map revealed to an agent, one bit per tile packed eight to a
+    byte in the layout of numpy.packbits: 64 times smaller than a map of
+    MapTiles references.
+    """
+
+    def __init__(self, height, width):
+        self.height = height
+        self.width = width
+        self.bits = np.zeros((height * width + 7) // 8, dtype=np.uint8)
+        # flat indices of the tiles in the order they were revealed
+        self._log = array('q')
+
+    @property
+    def version(self):
+        """
+        Returns: int. Number of tiles revealed so far, for the views to know when their copy of the
+            map is stale.
+        """
+        return len(self._log)
+
+    def reveal(self, row, col):
+        """
+        Returns: bool. Whether the tile was revealed by this call.
+        """
+        index = row * self.width + col
+        bit = 0x80 >> (index & 7)
+        if self.bits[index >> 3] & bit:
+            return False
+        self.bits[index >> 3] |= bit
+        self._log.append(index)
+        return True
+
+    def reveal_all(self, mask):
+        """
+        Reveal every tile set in a boolean mask of the map at once.
+        """
+        bits = np.packbits(np.asarray(mask, dtype=bool).ravel())
+        self._log.extend(np.flatnonzero(np.unpackbits(bits & ~self.bits, count=self.height * self.width)).tolist())
+        self.bits |= bits
+
+    def indices_since(self, version):
+        """
+        Returns: numpy.ndarray of int. Flat indices of the tiles revealed after the mask was at the
+            given version.
+        """
+        return np.frombuffer(self._log, dtype=np.int64)[version:].copy() if len(self._log) > version else \
+            np.zeros(0, dtype=np.int64)
+
+    def revealed_since(self, version):
+        """
+        Returns: list of tuple - (row, col). Tiles revealed after the mask was at the given version.
+        """
+        return [divmod(index, self.width) for index in self._log[version:]]
+
+    def is_revealed(self, row, col):
+        index = row * self.width + col
+        return bool(self.bits[index >> 3] & (0x80 >> (index & 7)))
+
+    def window(self, rows, cols):
+        """
+        Args:
+            rows: numpy.ndarray of int. Rows of the window.
+            cols: numpy.ndarray of int. Columns of the window.
+        Returns: numpy.ndarray of bool. Whether each tile of the window is revealed, read from the
+            packed bits of the window only.
+        """
+        index = rows[:, None] * self.width + cols[None, :]
+        return (self.bits[index >> 3] & (0x80 >> (index & 7))).astype(bool)
+
+    def array(self):
+        """
+        Returns: numpy.ndarray of bool. The mask unpacked to the shape of the map.
+        """
+        return np.unpackbits(self.bits, count=self.height * self.width).reshape(self.height, self.width).view(bool)
+
+    def count(self):
+        return int(np.unpackbits(self.bits).sum())
+
+
+class ObservedMap(object):
+    """
+    Read-only map of the game as observed by an agent: the truth map shared by
+    every agent, seen through the reveal mask of the agent, with unknown tiles
+    everywhere else.
+
+    Single tiles and windows of rows and columns (integers or slices) are read
+    straight from the truth map and the bits of the mask in the window. Any
+    other access materialises the observed map as an array of MapTiles, so an
+    agent can read it as it read the array the driver used to hand it. The
+    array is built once and then only updated with the tiles revealed since,
+    until `release` drops it.
+    """
+
+    def __init__(self, truth, mask):
+        """
+        Constructor
+        Args:
+            truth: numpy.ndarray of MapTiles or ChunkedWorld. Map of the game, shared and never
+                written.
+            mask: RevealMask. Tiles revealed to the agent.
+        """
+        self._truth = truth
+        self.mask = mask
+        self._cache = None
+        self._version = None
+
+    @property
+    def shape(self):
+        return self._truth.shape
+
+    @property
+    def size(self):
+        return self._truth.size
+
+    @property
+    def ndim(self):
+        return 2
+
+    @property
+    def dtype(self):
+        return self._truth.dtype
+
+    @property
+    def version(self):
+        """
+        Returns: int. Version of the mask, for planners to know when what they derived from the map is stale.
+        """
+        return self.mask.version
+
+    def revealed_since(self, version):
+        """
+        Returns: list of tuple - (row, col). Tiles revealed after the map was at the given version.
+        """
+        return self.mask.revealed_since(version)
+
+    def __len__(self):
+        return self._truth.shape[0]
+
+    def materialize(self):
+        """
+        Returns: numpy.ndarray of MapTiles. The observed map, read-only.
+        """
+        if self._cache is None:
+            if isinstance(self._truth, np.ndarray):
+                self._cache = np.where(self.mask.array(), self._truth, MapTiles.U)
+            else:
+                # chunked worlds are only read where the agent sees
+                self._cache = np.full(self._truth.shape, MapTiles.U)
+                rows, cols = np.nonzero(self.mask.array())
+                self._cache[rows, cols] = self._truth.take(rows, cols)
+            self._cache.flags.writeable = False
+            self._version = self.mask.version
+        elif self._version != self.mask.version:
+            rows, cols = np.divmod(self.mask.indices_since(self._version), self.mask.width)
+            self._cache.flags.writeable = True
+            self._cache[rows, cols] = self._truth.take(rows, cols) if not isinstance(self._truth, np.ndarray) \
+                else self._truth[rows, cols]
+            self._cache.flags.writeable = False
+            self._version = self.mask.version
+        return self._cache
+
+    def release(self):
+        """
+        Drop the materialised map, leaving only the mask.
+        """
+        self._cache = None
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple) and len(key) == 2 and \
+                isinstance(key[0], (int, np.integer, slice)) and isinstance(key[1], (int, np.integer, slice)):
+            if isinstance(key[0], slice) or isinstance(key[1], slice):
+                return self._window(key)
+            row, col = key
+            if row < 0:
+                row += self._truth.shape[0]
+            if col < 0:
+                col += self._truth.shape[1]
+            if not (0 <= row < self._truth.shape[0] and 0 <= col < self._truth.shape[1]):
+                raise IndexError('index %s is out of bounds for a map of shape %s' % (key, self._truth.shape))
+            return self._truth[row, col] if self.mask.is_revealed(row, col) else MapTiles.U
+        return self.materialize()[key]
+
+    def _window(self, key):
+        """
+        Returns: numpy.ndarray of MapTiles. Tiles of a window of rows and columns, integers or
+            slices, read from the truth map and the mask of the window only.
+        """
+        indices = []
+        for k, length in zip(key, self._truth.shape):
+            if isinstance(k, slice):
+                indices.append(np.arange(*k.indices(length)))
+            elif -length <= k < length:
+                indices.append(np.array([k % length]))
+            else:
+                raise IndexError('index %s is out of bounds for a map of shape %s' % (key, self._truth.shape))
+        tiles = np.asarray(self._truth[key])
+        return np.where(self.mask.window(*indices).reshape(tiles.shape), tiles, MapTiles.U)
+
+    def __array__(self, dtype=None, copy=None):
+        array = self.materialize()
+        if dtype is not None and dtype != array.dtype:
+            return array.astype(dtype)
+        return array.copy() if copy else array
+
+    def __iter__(self):
+        return iter(self.materialize())
+
+    def __eq__(self, other):
+        return self.materialize() == other
+
+    def __ne__(self, other):
+        return self.materialize() != other
+
+    __hash__ = object.__hash__
+
+    def copy(self):
+        return self.materialize().copy()
+
+    def __repr__(self):
+        return 'ObservedMap(%r)' % self.materialize()
@@ -0,0 +1,169 @@
+import atexit
+import sys
+import threading
+from queue import Queue
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVELS = {'debug': DEBUG, 'info': INFO, 'warning': WARNING, 'error': ERROR}
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def default_writer():
+    """
+    Returns: OutputWriter. The writer shared by the game drivers given none, started the first
+        time it is used and closed at exit.
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = OutputWriter()
+            atexit.register(_writer.close)
+    return _writer
+
+
+def _format_message(message, args):
+    return (message % args if args else message) + '\n'
+
+
+def _format_frame(rows):
+    return ''.join(' '.join(row) + '\n' for row in rows) + '\n'
+
+
+class OutputWriter(object):
+    """
+    Writes the messages and the maps of the games from a background thread,
+    so that games do not wait for the terminal or the pipe they print to.
+
+    Messages below the level are dropped before they are formatted, the
+    others wait in a bounded queue: a game only blocks when the writer is
+    that far behind. Maps are rendered every `render_every` steps, and with
+    `latest_only` a map still waiting when a newer map of the same agent comes
+    is replaced by it.
+
+    Each message is written to the sys.stdout of the moment it was queued,
+    so redirecting stdout keeps working. `flush` waits until everything
+    queued is written.
+    """
+
+    def __init__(self, level=DEBUG, queue_size=1024, render_every=1, latest_only=False):
+        """
+        Constructor
+        Args:
+            level: int. Level below which the messages are dropped, one of LEVELS.
+            queue_size: int. Number of messages and maps waiting to be written at most.
+            render_every: int. Number of steps between two maps rendered.
+            latest_only: bool. Whether to only render the latest map of each agent waiting.
+        """
+        self.level = level
+        self.render_every = render_every
+        self.latest_only = latest_only
+        # maps replaced by a newer one before they were written
+        self.frames_dropped = 0
+        self._queue = Queue(queue_size)
+        self._frames = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+    def enabled(self, level):
+        return level >= self.level
+
+    def log(self, level, message, *args):
+        """
+        Queue a message, formatted as `message % args` by the writer thread.
+        """
+        if level >= self.level:
+            self._put((sys.stdout, _format_message, (message, args)))
+
+    def debug(self, message, *args):
+        self.log(DEBUG, message, *args)
+
+    def info(self, message, *args):
+        self.log(INFO, message, *args)
+
+    def warning(self, message, *args):
+        self.log(WARNING, message, *args)
+
+    def error(self, message, *args):
+        self.log(ERROR, message, *args)
+
+    def wants_frame(self, step):
+        """
+        Returns: bool. Whether the maps of the step are rendered, so games can skip building the
+            others.
+        """
+        return step % self.render_every == 0
+
+    def frame(self, key, rows):
+        """
+        Queue a map.
+        Args:
+            key: Whose map it is, such as the index of the agent.
+            rows: Rows of printable tiles, such as a 2-d numpy.ndarray of str, not modified after.
+        """
+        if not self.latest_only:
+            self._put((sys.stdout, _format_frame, (rows,)))
+            return
+        with self._lock:
+            waiting = key in self._frames
+            if waiting:
+                self.frames_dropped += 1
+            self._frames[key] = rows
+        if not waiting:
+            self._put((sys.stdout, self._latest_frame, (key,)))
+
+    def _latest_frame(self, key):
+        with self._lock:
+            rows = self._frames.pop(key)
+        return _format_frame(rows)
+
+    def _put(self, item):
+        if self._closed:
+            self._write(item)
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='output-writer', daemon=True)
+                    self._thread.start()
+        self._queue.put(item)
+
+    def _write(self, item):
+        stream, render, args = item
+        try:
+            stream.write(render(*args))
+            if self._queue.empty():
+                stream.flush()
+        except (OSError, ValueError):
+            # the stream was closed in the meantime, the message has nowhere to go
+            pass
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._write(item)
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """
+        Wait until every message and map queued is written.
+        """
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        """
+        Write what is queued and stop the thread. Messages queued after are written right away.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
@@ -5,7 +5,9 @@ from argparse import ArgumentParser
 from agent import RandomAgent
 from agent import HumanAgent
 from driver import GameDriver
+from output import LEVELS, OutputWriter
 from utils import InvalidMapError
+import tracing
 
 MAP_TYPES = ['ascii', 'emoji']
 
@@ -39,9 +41,33 @@ def main(args):
                         ', '.join(MAP_TYPES) + '}')
     parser.add_argument('--verbose', action='store_true',
                         help='Whether to be verbose when playing game')
+    parser.add_argument('--step-time', type=float,
+                        help='Time budget of each step of an agent in seconds')
+    parser.add_argument('--trace', action='store_true',
+                        help='Record the planner calls and print their summary and the '
+                        'slowest of them at the end of the game')
+    parser.add_argument('--log-level', choices=list(LEVELS), default='debug',
+                        help='Level of the least important messages printed')
+    parser.add_argument('--render-every', type=int, default=1,
+                        help='Number of steps between two maps displayed')
+    parser.add_argument('--latest-map-only', action='store_true',
+                        help='Only display the latest map of an agent when '
+                        'the terminal falls behind')
+    parser.add_argument('--chunk-size', type=int,
+                        help='Generate the map chunk by chunk as the game '
+                        'reaches it, in a memory-mapped file, for maps too '
+                        'large to hold in memory')
+    parser.add_argument('--world-seed', type=int,
+                        help='Seed of the chunked map')
+    parser.add_argument('--world-file', type=str,
+                        help='File of the chunked map, temporary by default')
 
     args = parser.parse_args(args)
 
+    output = OutputWriter(level=LEVELS[args.log_level],
+                          render_every=args.render_every,
+                          latest_only=args.latest_map_only)
+
     # TODO: Change how agents are populated
     agent = RandomAgent(args.height, args.width, args.initial_strength)
 
@@ -59,18 +85,30 @@ def main(args):
             agents=agents,
             initial_strength=args.initial_strength,
             show_map=args.show_map, map_type=args.map_type,
-            save_dir=args.save_dir, map_file=args.map_file)
+            save_dir=args.save_dir, map_file=args.map_file,
+            step_time=args.step_time, chunk_size=args.chunk_size,
+            world_seed=args.world_seed, world_file=args.world_file,
+            output=output)
     except InvalidMapError as e:
-        print('The game map could not be created!')
-        print(e)
-        print('Restart the game')
+        output.error('The game map could not be created!')
+        output.error('%s', e)
+        output.error('Restart the game')
+        output.close()
+        return
+
+    if args.trace:
+        tracing.enable()
 
-    print('Starting game')
+    output.info('Starting game')
     try:
         game_driver.play(verbose=args.verbose)
     except StopIteration as e:
-        print(e)
+        output.info('%s', e)
         return
+    finally:
+        if args.trace:
+            output.info('%s', tracing.disable().report())
+        output.close()
 
 
 if __name__ == '__main__':
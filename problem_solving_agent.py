@@ -1,10 +1,13 @@
-import copy
 import math
 import random
+import time
 
 import numpy as np
 
-from agent import BaseAgent
+from agent import BaseAgent, WorldModel
+from belief import GoalBelief
+from metrics import record_plan
+from tracing import tracer
 from utils import Directions, MapTiles, tile_cost
 
 
@@ -81,6 +84,13 @@ class GameMap(object):
         self._agent = agent
         self._map_objects = {Location(x): obj for x, obj in map_objects.items()}
 
+        self.reset_goal()
+
+    def reset_goal(self):
+        """
+        Picks a random goal anywhere on the map.
+        """
+
         shape = self._game_map.shape
         self._tmp_goal = Location(random.randint(0, shape[1] - 1), random.randint(0, shape[0] - 1))
 
@@ -97,7 +107,7 @@ class GameMap(object):
                 return None
             return self._game_map[loc.y][loc.x]
 
-    def update_goal(self, location, probs):
+    def update_goal(self, location, belief):
         """
         Updates the goal in priority order; 'medkit', 'skeleton', 'boss', and unexplored tile.
         """
@@ -115,9 +125,21 @@ class GameMap(object):
                 self._tmp_goal = location
                 return
 
-        shape = self._game_map.shape
-        while self._tmp_goal is None or location == self._tmp_goal or probs[self._tmp_goal.y][self._tmp_goal.x] == 0.0:
-            self._tmp_goal = Location(random.randint(0, shape[1] - 1), random.randint(0, shape[0] - 1))
+        if self._tmp_goal is None or location == self._tmp_goal or \
+                belief.probability(self._tmp_goal.y, self._tmp_goal.x) == 0.0:
+            tile = belief.sample()
+            if tile is not None:
+                self._tmp_goal = Location(tile)
+
+    def apply(self, delta):
+        """
+        Applies the objects that appeared or left since the previous step.
+        """
+
+        for location in delta.removed:
+            self._map_objects.pop(Location(location), None)
+        for location, obj in delta.added.items():
+            self._map_objects[Location(location)] = obj
 
     def size(self):
         shape = self._game_map.shape
@@ -126,6 +148,9 @@ class GameMap(object):
     def goal(self):
         return self._tmp_goal
 
+    def set_goal(self, location):
+        self._tmp_goal = location
+
     def available_directions(self, location):
         north = self._game_map[location.north()]
         south = self._game_map[location.south()]
@@ -140,70 +165,96 @@ class GameMap(object):
 
 class Path(object):
     """
-    Path object.
+    Immutable path object, linked to the path it extends.
+
+    Extending a path shares every step of the parent instead of copying them,
+    so `append` takes constant time and memory, and each path carries its
+    cumulative cost. `has` walks the parent chain, in time linear in the
+    length of the path; searchers growing paths depth first keep the
+    locations of the current path themselves instead.
     """
 
     def __init__(self, *args):
         if len(args) == 1:
             if isinstance(args[0], Path):
-                self._start = copy.deepcopy(args[0]._start)
-                self._directions = copy.deepcopy(args[0]._directions)
-                self._locations = copy.deepcopy(args[0]._locations)
-                self._tiles = copy.deepcopy(args[0]._tiles)
+                # nothing of an immutable path needs copying
+                self.__dict__.update(args[0].__dict__)
             else:
                 self._start = args[0]
-                self._directions = []
-                self._locations = []
-                self._tiles = []
+                self._parent = None
+                self._direction, self._location, self._tile = None, None, None
+                self._length, self._cost = 0, 0
 
     def append(self, direction, location, tile):
-        copy = Path(self)
-
-        copy._directions.append(direction)
-        copy._locations.append(location)
-        copy._tiles.append(tile)
-
-        return copy
+        path = Path.__new__(Path)
+        path._start, path._parent = self._start, self
+        path._direction, path._location, path._tile = direction, location, tile
+        path._length = self._length + 1
+        path._cost = self._cost + (tile_cost[tile] if tile is not MapTiles.U else 0)
+        return path
 
     def has(self, location):
-        return location == self._start or location in self._locations
+        path = self
+        while path._parent is not None:
+            if path._location == location:
+                return True
+            path = path._parent
+        return path._start == location
 
     def cost(self, game_map):
-        _cost = 0
-        for location, tile in zip(self._locations, self._tiles):
-            if tile is not MapTiles.U:
-                _cost = _cost + tile_cost[tile]
-        return _cost
+        return self._cost
+
+    def __len__(self):
+        return self._length
 
     def __iter__(self):
-        for (direction, location) in zip(self._directions, self._locations):
-            yield direction, location
+        steps = []
+        path = self
+        while path._parent is not None:
+            steps.append((path._direction, path._location))
+            path = path._parent
+        return reversed(steps)
 
 
 class DepthLimitedPathSearcher(object):
     """
     Path Searcher using depth-limited search for the performance.
+
+    Given a deadline, paths stop growing once it passed and the search returns
+    the cheapest of the paths it reached.
     """
 
-    def __init__(self, agent, game_map, depth_limit=None):
+    def __init__(self, agent, game_map, depth_limit=None, deadline=None):
         self._agent = agent
         self._game_map = game_map
         self._depth_limit = depth_limit if depth_limit else math.sqrt(game_map.size()) / 2
+        self._deadline = deadline
+        # number of locations expanded so far, and the deepest of them
+        self.expanded = 0
+        self.depth_reached = 0
+        # locations of the path being grown, for constant-time cycle checks
+        self._on_path = set()
 
     def search(self, location, path=None, depth=0):
         if path is None:
             path = Path(location)
+            self._on_path = {location}
+        self.expanded += 1
+        if depth > self.depth_reached:
+            self.depth_reached = depth
 
         paths = []
         goal = self._game_map.goal()
         for (direction, next_location, tile) in self.expand(location):
-            if path.has(next_location):
+            if next_location in self._on_path:
                 continue
 
             tile = self._game_map[next_location]
             p = path.append(direction, next_location, tile)
-            if tile != MapTiles.U and depth < self._depth_limit:
+            if tile != MapTiles.U and depth < self._depth_limit and not self.expired():
+                self._on_path.add(next_location)
                 p = self.search(next_location, p, depth + 1)
+                self._on_path.discard(next_location)
 
             if p is not None:
                 if next_location == goal:
@@ -219,6 +270,9 @@ class DepthLimitedPathSearcher(object):
         lowest_cost_path = sorted(paths, key=lambda x: x.cost(self._game_map))[0] if len(paths) > 1 else paths[0]
         return lowest_cost_path
 
+    def expired(self):
+        return self._deadline is not None and time.time() >= self._deadline
+
     def expand(self, location):
         directions = [(Directions.NORTH, location.north(), self._game_map[location.north()]),
                       (Directions.SOUTH, location.south(), self._game_map[location.south()]),
@@ -230,17 +284,27 @@ class DepthLimitedPathSearcher(object):
 
 class ProblemSolvingAgent(BaseAgent):
 
+    observes_deltas = True
+
     def __init__(self, height, width, initial_strength, name='rogue_agent'):
         super().__init__(height=height, width=width,
                          initial_strength=initial_strength, name=name)
 
-        self._probs = np.ones(shape=(width, height))
+        self._world = WorldModel(height, width)
+        self._game_map = GameMap(self, self._world.game_map, {})
+        self._belief = GoalBelief(height, width)
         self._frontiers = []
-        self._map_objects_size = 0
+
+    def observe(self, delta):
+        self._world.observe(delta)
 
     def step(self, location, strength, game_map, map_objects):
-        location, game_map = Location(location), GameMap(self, game_map, map_objects)
-        self.update(location, strength, game_map, map_objects)
+        delta = self._world.update(location, game_map, map_objects)
+        location, game_map = Location(location), self._game_map
+        # a random goal each step until the objects change, as when the map was rebuilt every step
+        game_map.reset_goal()
+        game_map.apply(delta)
+        self.update(location, strength, game_map, delta)
 
         if len(self._frontiers) == 0:
             path = self.best_path(location, game_map)
@@ -253,23 +317,25 @@ class ProblemSolvingAgent(BaseAgent):
         return self._frontiers.pop(0)
 
     def best_path(self, location, game_map):
-        path_searcher = DepthLimitedPathSearcher(self, game_map)
-        return path_searcher.search(location)
-
-    def update(self, location, strength, game_map, map_objects):
-        if self._map_objects_size != len(map_objects):
-            self._map_objects_size = len(map_objects)
-
-            self._probs[location.y][location.x] = 0.0
-
-            for (loc, tile) in game_map:
-                if tile == MapTiles.W:
-                    self._probs[loc.y][loc.x] = 0.0
-
-            p = 1.0 / np.count_nonzero(self._probs)
-            self._probs[np.where(self._probs != 0.0)] = p
-
-            game_map.update_goal(location, self._probs)
+        trace = tracer()
+        started = time.perf_counter() if trace is not None else None
+        path_searcher, path = DepthLimitedPathSearcher(self, game_map, deadline=self.deadline), None
+        try:
+            path = path_searcher.search(location)
+            return path
+        finally:
+            record_plan('depth-limited-path-searcher', path_searcher.expanded)
+            if trace is not None:
+                trace.record('depth-limited-path-searcher', started, start=location, goal=game_map.goal(),
+                             expanded=path_searcher.expanded, depth_limit=path_searcher._depth_limit,
+                             depth_reached=path_searcher.depth_reached, found=path is not None,
+                             length=len(path) if path is not None else 0, timed_out=path_searcher.expired())
+
+    def update(self, location, strength, game_map, delta):
+        self._belief.update(location.y, location.x, game_map._game_map)
+
+        if len(delta.added) > 0 or len(delta.removed) > 0:
+            game_map.update_goal(location, self._belief)
             self._frontiers.clear()
 
 
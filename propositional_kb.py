@@ -1,47 +1,250 @@
-from itertools import chain
-
-from sympy import *
-from sympy.logic.boolalg import conjuncts, to_cnf
+import numpy as np
 
+from sat import SatSolver
 from utils import *
 
 
+# kinds of objects an agent cannot safely walk into
+UNSAFE_KINDS = ('monster', 'boss', 'agent')
+
+
+class SafeStates(object):
+    """
+    Set-like view of the safe states of a knowledge base, backed by its
+    boolean mask of safe tiles; membership and size are O(1).
+    """
+
+    def __init__(self, mask, count):
+        self._mask = mask
+        self._count = count
+
+    def __contains__(self, state):
+        row, col = state[0], state[1]
+        if row < 0 or col < 0 or row >= self._mask.shape[0] or col >= self._mask.shape[1]:
+            return False
+        return bool(self._mask[row, col])
+
+    def __len__(self):
+        return self._count
+
+
 class PropositionalKB:
 
     def __init__(self, sentence=None):
         self.game_map = None
         self.map_objects = None
 
+        # locations of the objects by kind, the kind of object at each location,
+        # and whether each tile is safe
+        self.index = {kind: set() for kind in ['power_up', 'boss', 'monster', 'agent']}
+        self._kinds = {}
+        self._safe = None
+        self._safe_count = 0
+
+        # clauses told so far as lists of integer literals, and the solver holding them with
+        # the definitions of the Tseitin variables of compound sentences
         self.clauses = []
+        self.solver = SatSolver()
+        self.symbols = {}
+        self.names = [None]
+        self._true = None
         if sentence:
             self.tell(sentence)
 
+    def variable(self, name):
+        """
+        Variable of a proposition, created on its first use.
+        Args:
+            name: str. Name of the proposition.
+        Returns: int. The variable, as its positive literal.
+        """
+        name = str(name)
+        if name not in self.symbols:
+            self.symbols[name] = self.solver.new_var()
+            self.names.append(name)
+        return self.symbols[name]
+
+    def literal(self, atom):
+        """
+        Literal of an atom: an integer literal, a proposition name, negated with a
+        leading '~', or any sympy sentence (encoded with an auxiliary variable when
+        it is not a literal).
+        """
+        if isinstance(atom, (int, np.integer)):
+            return int(atom)
+        if isinstance(atom, str):
+            atom = atom.strip()
+            if atom.startswith('~'):
+                return -self.literal(atom[1:])
+            return self.variable(atom)
+        return self._encode(atom)
+
     def tell(self, sentence):
-        self.clauses.extend(conjuncts(to_cnf(sentence)))
+        """
+        Add a sentence to the KB.
+        Args:
+            sentence: A sympy sentence, a literal as accepted by `literal`, or a list of
+                literals standing for their disjunction.
+        """
+        for clause in self._clauses(sentence):
+            self.clauses.append(clause)
+            self.solver.add_clause(clause)
 
-    def tell_percepts(self, game_map, map_objects):
+    def tell_percepts(self, game_map, map_objects, delta=None):
+        """
+        Tell the KB what the agent perceives, updating the object index and the
+        safe tiles with what changed only.
+        Args:
+            game_map: 2d array of MapTiles. Map as observed by the agent so far.
+            map_objects: dict. Objects discovered by the agent so far, by location.
+            delta: WorldDelta. Objects that appeared or left since the previous percepts, if known.
+        """
         self.game_map = game_map
         self.map_objects = map_objects
 
-    def entails(self, clauses, query, all_models):
-        if len(clauses) > 0:
-            first = clauses[0]
-            rest = clauses[1:]
-            models = chain(satisfiable(first & query, all_models=True))
-            return chain(models, self.entails(rest, query, all_models))
+        shape = np.shape(game_map)
+        if self._safe is None or self._safe.shape != shape:
+            self.index = {kind: set() for kind in self.index}
+            self._kinds = {}
+            self._safe = np.ones(shape, dtype=bool)
+            self._safe_count = self._safe.size
+            delta = None
+
+        if delta is None:
+            # compare the objects location by location
+            kinds = {}
+            for loc, map_object in map_objects.items():
+                kind = object_kind(map_object)
+                if kind is not None:
+                    kinds[(loc[0], loc[1])] = kind
+            removed = [loc for loc, kind in self._kinds.items() if kinds.get(loc) != kind]
+            added = [(loc, kind) for loc, kind in kinds.items() if self._kinds.get(loc) != kind]
+        else:
+            removed = [(loc[0], loc[1]) for loc in delta.removed]
+            added = [((loc[0], loc[1]), object_kind(map_object)) for loc, map_object in delta.added.items()]
+
+        for loc in removed:
+            self._forget(loc)
+        for loc, kind in added:
+            self._forget(loc)
+            if kind is None:
+                continue
+            self._kinds[loc] = kind
+            self.index[kind].add(loc)
+            if kind in UNSAFE_KINDS and self._safe[loc]:
+                self._safe[loc] = False
+                self._safe_count -= 1
+
+    def _forget(self, loc):
+        kind = self._kinds.pop(loc, None)
+        if kind is None:
+            return
+        self.index[kind].discard(loc)
+        if kind in UNSAFE_KINDS:
+            self._safe[loc] = True
+            self._safe_count += 1
 
     def ask(self, query):
-        models = self.entails(self.clauses, query, all_models=True)
-        return models
+        """
+        Whether the KB entails the query: the KB and the negated query are unsatisfiable.
+        Args:
+            query: A sentence, as accepted by `tell`.
+        Returns: bool. True if the query holds in every model of the KB.
+        """
+        clause = self._as_clause(query)
+        if clause is None:
+            clause = [self._encode(query)]
+        return not self.solver.solve([-literal for literal in clause])
+
+    def entails(self, query):
+        return self.ask(query)
+
+    def satisfiable(self, assumptions=()):
+        """
+        Whether the KB has a model in which the assumptions hold.
+        Args:
+            assumptions: list of literals, as accepted by `literal`.
+        Returns: dict of str to bool. A model of the named propositions, or None.
+        """
+        if not self.solver.solve([self.literal(atom) for atom in assumptions]):
+            return None
+        return {name: self.solver.model[var] for name, var in self.symbols.items()}
+
+    def _clauses(self, sentence):
+        clause = self._as_clause(sentence)
+        if clause is not None:
+            return [clause]
+        if type(sentence).__name__ == 'And':
+            return [clause for arg in sentence.args for clause in self._clauses(arg)]
+        return [[self._encode(sentence)]]
+
+    def _as_clause(self, sentence):
+        # the literals of a sentence that is a disjunction of literals, or None
+        if isinstance(sentence, (list, tuple, set)):
+            return [self.literal(atom) for atom in sentence]
+        if isinstance(sentence, (int, np.integer, str)):
+            return [self.literal(sentence)]
+        args = sentence.args if type(sentence).__name__ == 'Or' else [sentence]
+        if all(type(arg).__name__ == 'Symbol' or
+               (type(arg).__name__ == 'Not' and type(arg.args[0]).__name__ == 'Symbol') for arg in args):
+            return [self._encode(arg) for arg in args]
+        return None
+
+    def _encode(self, sentence):
+        """
+        Tseitin encoding of a sympy sentence: a literal equivalent to the sentence,
+        defined by clauses over the literals of its arguments. sympy is only needed
+        for sentences given as sympy expressions.
+        """
+        from sympy import Symbol
+        from sympy.logic.boolalg import And, BooleanFalse, BooleanTrue, Equivalent, Implies, Not, Or
+
+        if isinstance(sentence, Symbol):
+            return self.variable(sentence.name)
+        if isinstance(sentence, Not):
+            return -self._encode(sentence.args[0])
+        if isinstance(sentence, (BooleanTrue, BooleanFalse)):
+            if self._true is None:
+                self._true = self.solver.new_var()
+                self.solver.add_clause([self._true])
+            return self._true if isinstance(sentence, BooleanTrue) else -self._true
+        if isinstance(sentence, Implies):
+            args = [-self._encode(sentence.args[0]), self._encode(sentence.args[1])]
+            sentence = Or
+        elif isinstance(sentence, (And, Or, Equivalent)):
+            args = [self._encode(arg) for arg in sentence.args]
+            sentence = type(sentence)
+        else:
+            raise ValueError('Unsupported sentence: %s' % sentence)
+
+        literal = self.solver.new_var()
+        if sentence is And:
+            for arg in args:
+                self.solver.add_clause([-literal, arg])
+            self.solver.add_clause([literal] + [-arg for arg in args])
+        elif sentence is Or:
+            for arg in args:
+                self.solver.add_clause([literal, -arg])
+            self.solver.add_clause([-literal] + args)
+        else:
+            # all the arguments are equal
+            for a, b in zip(args, args[1:] + args[:1]):
+                self.solver.add_clause([-literal, -a, b])
+            self.solver.add_clause([literal] + args)
+            self.solver.add_clause([literal] + [-arg for arg in args])
+        return literal
 
     def is_monster(self, state):
-        return self.is_something(state, StaticMonster) or self.is_something(state, DynamicMonster)
+        return self.kind_of(state) in ('monster', 'boss')
 
     def is_boss(self, state):
-        return self.is_something(state, Boss)
+        return self.kind_of(state) == 'boss'
 
     def is_agent(self, state):
-        return self.is_something(state, AgentPlaceholder)
+        return self.kind_of(state) == 'agent'
+
+    def kind_of(self, state):
+        return self._kinds.get((state[0], state[1]))
 
     def is_something(self, state, clazz):
         if (state.x, state.y) in self.map_objects:
@@ -50,10 +253,22 @@ class PropositionalKB:
         return False
 
     def is_power_up(self, state):
-        return isinstance(self.map_objects[state], PowerUp)
+        return self.kind_of(state) == 'power_up'
 
     def is_safe(self, state):
-        return not (self.is_monster(state) or self.is_agent(state))
+        return self._safe is None or bool(self._safe[state[0], state[1]])
+
+    def safe_mask(self):
+        """
+        Returns: numpy.ndarray of bool. Whether each tile is safe, as of the last percepts.
+        """
+        return self._safe
+
+    def safe_states(self):
+        """
+        Returns: SafeStates. Set-like view of the safe states, as of the last percepts.
+        """
+        return SafeStates(self._safe, self._safe_count)
 
     def has_enough_strength_for_boss(self, strength):
         return strength >= 90
@@ -67,11 +282,6 @@ class PropositionalKB:
     def get_KB(self):
         return self.clauses
 
-    # def ask(self, query):
-    #     checkClause = KBentailsAlpha(self.clauses, query)
-    #     if (checkClause == {}): return True
-    #     else: return False
-
 # propkb = PropsitionalKB()
 # a,b = symbols('a,b')
 # propkb.tell(Implies(a,b))
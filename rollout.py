@@ -0,0 +1,171 @@
+import numpy as np
+
+from utils import Boss, Directions, MapTiles, object_kind, tile_cost
+
+# moves in the order of list(Directions), as (row, column) offsets
+DIRECTIONS = list(Directions)
+ROW_OFFSETS = np.array([{Directions.NORTH: -1, Directions.SOUTH: 1}.get(d, 0) for d in DIRECTIONS])
+COL_OFFSETS = np.array([{Directions.WEST: -1, Directions.EAST: 1}.get(d, 0) for d in DIRECTIONS])
+
+# kinds of the objects met by a playout
+POWER_UP, MONSTER, BOSS, AGENT = 0, 1, 2, 3
+KIND_CODES = {'power_up': POWER_UP, 'monster': MONSTER, 'boss': BOSS, 'agent': AGENT}
+
+
+class RolloutEngine(object):
+    """
+    Random playouts of a single agent, simulated all at once as NumPy arrays
+    of positions, strengths and remaining objects, one entry per playout.
+
+    Each step of every playout follows the rules of `GameDriver.play`: a move
+    costs the cost of the tile entered, and a move out of the map, into a
+    wall or onto a tile the agent cannot afford costs 1 and leaves the agent
+    in place. Power-ups add their strength; fights with monsters, the boss
+    and other agents are won with probability strength / (strength + opponent
+    strength), the loser dropping to 0. Beating a monster raises the maximum
+    strength by its strength and restores the agent to it, beating an agent
+    takes its strength, and beating the boss wins the game.
+
+    Only what the agent knows is simulated: unknown tiles are passable at the
+    average cost of the known passable tiles, and moving objects stay where
+    they were last seen.
+    """
+
+    def __init__(self, game_map, map_objects, strength, max_strength=None, exploration=0.01):
+        """
+        Constructor
+        Args:
+            game_map: 2d array of MapTiles. Map as observed by the agent so far.
+            map_objects: dict. Objects known to the agent, by (row, column).
+            strength: int. Current strength of the agent.
+            max_strength: int. Strength the agent is restored to after beating a monster,
+                `strength` if None.
+            exploration: float. Value of each unknown tile entered by a playout that ends
+                neither won nor lost.
+        """
+        game_map = np.asarray(game_map)
+        self.height, self.width = game_map.shape
+        self.strength = strength
+        self.max_strength = max(strength, max_strength if max_strength is not None else strength)
+        self.exploration = exploration
+
+        # cost of entering each tile, infinite for the walls
+        self.costs = np.full(game_map.shape, np.inf)
+        for tile, cost in tile_cost.items():
+            self.costs[game_map == tile] = cost
+        unknown = game_map == MapTiles.U
+        known = np.isfinite(self.costs)
+        self.costs[unknown] = self.costs[known].mean() if known.any() else tile_cost[MapTiles.SAND]
+        self.unknown = unknown.ravel()
+
+        # objects by index, and the index of the object on each tile, -1 if none
+        self.object_at = np.full(game_map.shape, -1, dtype=np.int64)
+        kinds, strengths, deltas = [], [], []
+        self.boss_strength = Boss().strength
+        for (row, col), map_object in map_objects.items():
+            kind = object_kind(map_object)
+            if kind is None:
+                continue
+            self.object_at[row, col] = len(kinds)
+            kinds.append(KIND_CODES[kind])
+            strengths.append(map_object.strength)
+            deltas.append(map_object.delta)
+            if kind == 'boss':
+                self.boss_strength = map_object.strength
+        self.kinds = np.array(kinds, dtype=np.int64)
+        self.object_strengths = np.array(strengths, dtype=np.float64)
+        self.deltas = np.array(deltas, dtype=np.float64)
+
+    def simulate(self, location, first_moves, horizon):
+        """
+        Play one random playout per first move.
+        Args:
+            location: tuple - (row, column). Location of the agent.
+            first_moves: numpy.ndarray of int. First move of each playout, as an index in
+                `DIRECTIONS`; the following moves are uniformly random.
+            horizon: int. Number of steps of each playout.
+        Returns: numpy.ndarray of float. Value of each playout: 1 if it beat the boss, 0 if
+            the agent died, otherwise its chance of beating the boss with the strength left,
+            plus `exploration` for each unknown tile it entered.
+        """
+        count = len(first_moves)
+        playouts = np.arange(count)
+        rows = np.full(count, location[0], dtype=np.int64)
+        cols = np.full(count, location[1], dtype=np.int64)
+        strength = np.full(count, self.strength, dtype=np.float64)
+        max_strength = np.full(count, self.max_strength, dtype=np.float64)
+        present = np.ones((count, len(self.kinds)), dtype=bool)
+        alive = np.ones(count, dtype=bool)
+        won = np.zeros(count, dtype=bool)
+        # unknown tiles first entered by each playout at each step, as flat indices, -1 if none
+        entered_tiles = np.full((count, horizon), -1, dtype=np.int64)
+        novelty = np.zeros(count, dtype=np.int64)
+
+        moves = np.asarray(first_moves)
+        for step in range(horizon):
+            active = alive & ~won
+            if not active.any():
+                break
+            if step > 0:
+                moves = np.random.randint(len(DIRECTIONS), size=count)
+
+            next_rows, next_cols = rows + ROW_OFFSETS[moves], cols + COL_OFFSETS[moves]
+            inside = (next_rows >= 0) & (next_rows < self.height) & (next_cols >= 0) & (next_cols < self.width)
+            next_rows, next_cols = np.where(inside, next_rows, rows), np.where(inside, next_cols, cols)
+            cost = self.costs[next_rows, next_cols]
+            # the cost is infinite for walls, which therefore can never be afforded
+            moved = active & inside & (strength >= cost)
+            strength -= np.where(moved, cost, 1.0) * active
+            rows, cols = np.where(moved, next_rows, rows), np.where(moved, next_cols, cols)
+
+            tiles = rows * self.width + cols
+            entered = moved & self.unknown[tiles]
+            if step > 0 and entered.any():
+                entered[entered] = ~(entered_tiles[entered, :step] == tiles[entered, None]).any(axis=1)
+            entered_tiles[:, step] = np.where(entered, tiles, -1)
+            novelty += entered
+
+            if len(self.kinds) > 0:
+                objects = self.object_at[rows, cols]
+                met = active & (objects >= 0) & (strength > 0)
+                met[met] = present[playouts[met], objects[met]]
+                if met.any():
+                    self._meet(np.nonzero(met)[0], objects[met], strength, max_strength, present, won)
+            alive &= strength > 0
+
+        value = strength / (strength + self.boss_strength) + self.exploration * novelty
+        return np.where(won, 1.0, np.where(alive, value, 0.0))
+
+    def _meet(self, playouts, objects, strength, max_strength, present, won):
+        # the object leaves the playout whatever the outcome, a lost fight ends it anyway
+        present[playouts, objects] = False
+        kinds = self.kinds[objects]
+        opponent = self.object_strengths[objects]
+
+        power_up = kinds == POWER_UP
+        strength[playouts[power_up]] += self.deltas[objects[power_up]]
+
+        fights = ~power_up
+        playouts, kinds, opponent = playouts[fights], kinds[fights], opponent[fights]
+        current = strength[playouts]
+        wins = np.random.random(len(playouts)) < current / (current + opponent)
+
+        monsters = wins & (kinds != AGENT)
+        max_strength[playouts[monsters]] += opponent[monsters]
+        strength[playouts[monsters]] = max_strength[playouts[monsters]]
+        strength[playouts[wins & (kinds == AGENT)]] += opponent[wins & (kinds == AGENT)]
+        strength[playouts[~wins]] = 0
+        won[playouts[wins & (kinds == BOSS)]] = True
+
+    def evaluate(self, location, num_playouts, horizon):
+        """
+        Average value of the playouts starting with each move.
+        Args:
+            location: tuple - (row, column). Location of the agent.
+            num_playouts: int. Number of playouts of each move.
+            horizon: int. Number of steps of each playout.
+        Returns: numpy.ndarray of float. Mean value of the playouts of each move of `DIRECTIONS`.
+        """
+        first_moves = np.repeat(np.arange(len(DIRECTIONS)), num_playouts)
+        values = self.simulate(location, first_moves, horizon)
+        return values.reshape(len(DIRECTIONS), num_playouts).mean(axis=1)
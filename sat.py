@@ -0,0 +1,287 @@
+# References:
+# 1. Niklas Eén and Niklas Sörensson, An Extensible SAT-solver, Theory and Applications of Satisfiability
+#    Testing (SAT 2003), LNCS 2919, 2004.
+# 2. Matthew W. Moskewicz, Conor F. Madigan, Ying Zhao, Lintao Zhang and Sharad Malik, Chaff: Engineering an
+#    Efficient SAT Solver, Proceedings of the 38th Design Automation Conference, 2001.
+import heapq
+
+
+class SatSolver(object):
+    """
+    Incremental CDCL SAT solver over integer literals: variables are numbered
+    from 1 and a negative literal is the negation of its variable, as in the
+    DIMACS format.
+
+    Clauses are watched by two of their literals, so unit propagation only
+    visits the clauses whose watch became false. Conflicts are analysed down
+    to their first unique implication point, the learnt clause is kept and
+    the search jumps back to the level where it becomes unit. Variables are
+    chosen by activity (VSIDS) with phase saving, and the search restarts
+    geometrically often.
+
+    Clauses can be added between calls to `solve`, and each call can be given
+    assumptions, literals that hold for that call only; learnt clauses stay
+    valid across calls.
+    """
+
+    def __init__(self):
+        self.num_vars = 0
+        self.clauses = []
+        self.model = None
+        # False once the clauses are known to be unsatisfiable without any assumption
+        self.ok = True
+
+        # per variable, index 0 unused: value (1 true, -1 false, 0 unassigned), decision level,
+        # index of the clause that implied it, activity and saved phase
+        self._values = [0]
+        self._levels = [0]
+        self._reasons = [None]
+        self._activity = [0.0]
+        self._phases = [False]
+        # per literal: indices of the clauses watching it
+        self._watches = {}
+
+        self._trail = []
+        self._trail_limits = []
+        self._queue_head = 0
+        self._order = []
+        self._increment = 1.0
+
+    def new_var(self):
+        """
+        Add a variable.
+        Returns: int. The variable, as its positive literal.
+        """
+        self.num_vars += 1
+        var = self.num_vars
+        self._values.append(0)
+        self._levels.append(0)
+        self._reasons.append(None)
+        self._activity.append(0.0)
+        self._phases.append(False)
+        self._watches[var] = []
+        self._watches[-var] = []
+        heapq.heappush(self._order, (0.0, var))
+        return var
+
+    def add_clause(self, literals):
+        """
+        Add a clause, a disjunction of literals, creating its variables if needed.
+        Args:
+            literals: iterable of int. Literals of the clause.
+        Returns: bool. False if the clauses became unsatisfiable.
+        """
+        if not self.ok:
+            return False
+        self._cancel_until(0)
+
+        clause = []
+        for literal in literals:
+            while abs(literal) > self.num_vars:
+                self.new_var()
+            value = self._value(literal)
+            if value == 1 or -literal in clause:
+                # already satisfied, or a tautology
+                return True
+            if value == 0 and literal not in clause:
+                clause.append(literal)
+
+        if len(clause) == 0:
+            self.ok = False
+        elif len(clause) == 1:
+            self._assign(clause[0], None)
+            self.ok = self._propagate() is None
+        else:
+            self._attach(clause)
+        return self.ok
+
+    def solve(self, assumptions=()):
+        """
+        Search for a model of the clauses in which the assumptions hold.
+        Args:
+            assumptions: iterable of int. Literals that must hold for this call only.
+        Returns: bool. Whether a model exists; if so it is kept in `model`, the value of
+            each variable indexed by the variable.
+        """
+        self.model = None
+        if not self.ok:
+            return False
+        assumptions = list(assumptions)
+        for literal in assumptions:
+            while abs(literal) > self.num_vars:
+                self.new_var()
+
+        self._cancel_until(0)
+        conflicts, restart_limit = 0, 100
+        while True:
+            conflict = self._propagate()
+            if conflict is not None:
+                if len(self._trail_limits) == 0:
+                    self.ok = False
+                    return False
+                learnt, level = self._analyze(conflict)
+                self._cancel_until(level)
+                if len(learnt) == 1:
+                    self._assign(learnt[0], None)
+                else:
+                    self._assign(learnt[0], self._attach(learnt))
+                self._increment /= 0.95
+                conflicts += 1
+                continue
+
+            if conflicts >= restart_limit:
+                conflicts, restart_limit = 0, int(restart_limit * 1.5)
+                self._cancel_until(0)
+                continue
+
+            level = len(self._trail_limits)
+            if level < len(assumptions):
+                literal = assumptions[level]
+                value = self._value(literal)
+                if value == -1:
+                    # the assumptions contradict the clauses
+                    self._cancel_until(0)
+                    return False
+                self._trail_limits.append(len(self._trail))
+                if value == 0:
+                    self._assign(literal, None)
+                continue
+
+            var = self._pick_branching_var()
+            if var is None:
+                self.model = [None] + [value == 1 for value in self._values[1:]]
+                self._cancel_until(0)
+                return True
+            self._trail_limits.append(len(self._trail))
+            self._assign(var if self._phases[var] else -var, None)
+
+    def _value(self, literal):
+        value = self._values[abs(literal)]
+        return value if literal > 0 else -value
+
+    def _assign(self, literal, reason):
+        var = abs(literal)
+        self._values[var] = 1 if literal > 0 else -1
+        self._levels[var] = len(self._trail_limits)
+        self._reasons[var] = reason
+        self._trail.append(literal)
+
+    def _attach(self, clause):
+        index = len(self.clauses)
+        self.clauses.append(clause)
+        self._watches[clause[0]].append(index)
+        self._watches[clause[1]].append(index)
+        return index
+
+    def _propagate(self):
+        """
+        Unit propagation of the literals assigned since the last call.
+        Returns: int. Index of a clause whose literals are all false, or None.
+        """
+        trail, clauses, values, watches = self._trail, self.clauses, self._values, self._watches
+        while self._queue_head < len(trail):
+            false_literal = -trail[self._queue_head]
+            self._queue_head += 1
+
+            watching, kept = watches[false_literal], []
+            for position, index in enumerate(watching):
+                clause = clauses[index]
+                # keep the false watch second
+                if clause[0] == false_literal:
+                    clause[0], clause[1] = clause[1], false_literal
+                first = clause[0]
+                if (values[first] if first > 0 else -values[-first]) == 1:
+                    kept.append(index)
+                    continue
+
+                for other in range(2, len(clause)):
+                    literal = clause[other]
+                    if (values[literal] if literal > 0 else -values[-literal]) != -1:
+                        clause[1], clause[other] = literal, false_literal
+                        watches[literal].append(index)
+                        break
+                else:
+                    kept.append(index)
+                    if (values[first] if first > 0 else -values[-first]) == -1:
+                        kept.extend(watching[position + 1:])
+                        watches[false_literal] = kept
+                        self._queue_head = len(trail)
+                        return index
+                    self._assign(first, index)
+            watches[false_literal] = kept
+        return None
+
+    def _analyze(self, conflict):
+        """
+        First UIP conflict analysis.
+        Returns: tuple(list of int, int). The learnt clause, with its asserting literal
+            first and a literal of the highest remaining level second, and the level to
+            jump back to.
+        """
+        level = len(self._trail_limits)
+        learnt, seen = [None], set()
+        pending, literal, position = 0, None, len(self._trail) - 1
+        clause = self.clauses[conflict]
+        while True:
+            for other in (clause if literal is None else clause[1:]):
+                var = abs(other)
+                if var not in seen and self._levels[var] > 0:
+                    seen.add(var)
+                    self._bump(var)
+                    if self._levels[var] == level:
+                        pending += 1
+                    else:
+                        learnt.append(other)
+            # the most recent literal of the current level involved in the conflict
+            while abs(self._trail[position]) not in seen:
+                position -= 1
+            literal = self._trail[position]
+            position -= 1
+            seen.discard(abs(literal))
+            pending -= 1
+            if pending == 0:
+                break
+            clause = self.clauses[self._reasons[abs(literal)]]
+        learnt[0] = -literal
+
+        if len(learnt) == 1:
+            return learnt, 0
+        highest = max(range(1, len(learnt)), key=lambda i: self._levels[abs(learnt[i])])
+        learnt[1], learnt[highest] = learnt[highest], learnt[1]
+        return learnt, self._levels[abs(learnt[1])]
+
+    def _bump(self, var):
+        self._activity[var] += self._increment
+        if self._activity[var] > 1e100:
+            self._activity = [activity * 1e-100 for activity in self._activity]
+            self._increment *= 1e-100
+            self._order = [(-self._activity[v], v) for v in range(1, self.num_vars + 1) if self._values[v] == 0]
+            heapq.heapify(self._order)
+        elif self._values[var] == 0:
+            heapq.heappush(self._order, (-self._activity[var], var))
+
+    def _pick_branching_var(self):
+        # the heap holds stale entries, skip the assigned variables and outdated activities
+        while len(self._order) > 0:
+            activity, var = heapq.heappop(self._order)
+            if self._values[var] == 0 and -activity == self._activity[var]:
+                return var
+        # every variable may still be unassigned with a stale entry only
+        for var in range(1, self.num_vars + 1):
+            if self._values[var] == 0:
+                return var
+        return None
+
+    def _cancel_until(self, level):
+        if len(self._trail_limits) <= level:
+            return
+        limit = self._trail_limits[level]
+        for literal in self._trail[limit:]:
+            var = abs(literal)
+            self._phases[var] = literal > 0
+            self._values[var] = 0
+            self._reasons[var] = None
+            heapq.heappush(self._order, (-self._activity[var], var))
+        del self._trail[limit:]
+        del self._trail_limits[level:]
+        self._queue_head = min(self._queue_head, limit)
@@ -0,0 +1,138 @@
+import math
+from statistics import NormalDist
+
+INTERVALS = ['wilson', 'bayes']
+
+
+def wilson_interval(wins, games, confidence=0.95):
+    """
+    Wilson score interval of a win rate.
+    Args:
+        wins: int. Number of games won.
+        games: int. Number of games played.
+        confidence: float. Confidence level of the interval.
+    Returns: tuple(float, float). Lower and upper bounds, (0, 1) before any game.
+    """
+    if games == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2.0)
+    rate = wins / float(games)
+    center = (rate + z * z / (2.0 * games)) / (1.0 + z * z / games)
+    half_width = z * math.sqrt(rate * (1.0 - rate) / games + z * z / (4.0 * games * games)) / (1.0 + z * z / games)
+    return max(center - half_width, 0.0), min(center + half_width, 1.0)
+
+
+def bayes_interval(wins, games, confidence=0.95, prior=(1.0, 1.0)):
+    """
+    Equal-tailed credible interval of a win rate, under a beta prior.
+    Args:
+        wins: int. Number of games won.
+        games: int. Number of games played.
+        confidence: float. Probability of the win rate being in the interval.
+        prior: tuple(float, float). Parameters of the beta prior, uniform by default.
+    Returns: tuple(float, float). Lower and upper bounds.
+    """
+    from scipy.stats import beta
+
+    posterior = beta(prior[0] + wins, prior[1] + games - wins)
+    return float(posterior.ppf((1.0 - confidence) / 2.0)), float(posterior.ppf((1.0 + confidence) / 2.0))
+
+
+class WinRateEstimate(object):
+    """
+    Win rate of an agent, with a confidence interval updated after each game.
+    Play can stop once the interval is narrower than twice the precision.
+    """
+
+    def __init__(self, method='wilson', confidence=0.95, precision=0.05, min_games=10, wins=0, games=0):
+        """
+        Constructor
+        Args:
+            method: str. Interval of the win rate, one of INTERVALS.
+            confidence: float. Confidence level of the interval.
+            precision: float. Half-width of the interval at which the estimate is done.
+            min_games: int. Number of games played before the estimate can be done.
+            wins: int. Number of games already won.
+            games: int. Number of games already played.
+        """
+        if method not in INTERVALS:
+            raise ValueError('Unknown interval %s' % method)
+        self.method = method
+        self.confidence = confidence
+        self.precision = precision
+        self.min_games = min_games
+        self.wins = wins
+        self.games = games
+
+    def update(self, won):
+        """
+        Count a finished game.
+        Returns: bool. Whether the estimate is done.
+        """
+        self.wins += int(bool(won))
+        self.games += 1
+        return self.done()
+
+    @property
+    def rate(self):
+        return self.wins / float(self.games) if self.games > 0 else 0.0
+
+    def interval(self):
+        if self.method == 'bayes':
+            return bayes_interval(self.wins, self.games, self.confidence)
+        return wilson_interval(self.wins, self.games, self.confidence)
+
+    def done(self):
+        if self.games < self.min_games:
+            return False
+        low, high = self.interval()
+        return (high - low) / 2.0 <= self.precision
+
+
+class SPRT(object):
+    """
+    Sequential probability ratio test of whether agent A beats agent B.
+
+    Both agents play the same maps, and only the maps that exactly one of
+    them wins are informative: each is a Bernoulli trial that A wins with
+    probability p. The test weighs H0: p = p0 against H1: p = p1 after every
+    such map and stops as soon as the log-likelihood ratio leaves the bounds
+    set by the error rates.
+    """
+
+    def __init__(self, p0=0.5, p1=0.65, alpha=0.05, beta=0.05):
+        """
+        Constructor
+        Args:
+            p0: float. Probability of A winning a decisive map under H0.
+            p1: float. Probability of A winning a decisive map under H1.
+            alpha: float. Probability of accepting H1 when H0 holds.
+            beta: float. Probability of accepting H0 when H1 holds.
+        """
+        self.p0, self.p1 = p0, p1
+        self.llr = 0.0
+        self.lower = math.log(beta / (1.0 - alpha))
+        self.upper = math.log((1.0 - beta) / alpha)
+        self.decisive = 0
+        self.pairs = 0
+
+    def update(self, a_won, b_won):
+        """
+        Count a map played by both agents.
+        Returns: str. 'H1' if A is better, 'H0' if it is not, None while undecided.
+        """
+        self.pairs += 1
+        if bool(a_won) != bool(b_won):
+            self.decisive += 1
+            if a_won:
+                self.llr += math.log(self.p1 / self.p0)
+            else:
+                self.llr += math.log((1.0 - self.p1) / (1.0 - self.p0))
+        return self.decision()
+
+    def decision(self):
+        if self.llr >= self.upper:
+            return 'H1'
+        if self.llr <= self.lower:
+            return 'H0'
+        return None
@@ -1,5 +1,6 @@
 from driver import GameDriver
 from knowledge_based_agent import KBAgentRogue
+from sequential import WinRateEstimate
 from utils import InvalidMapError
 
 if __name__ == '__main__':
@@ -13,9 +14,13 @@ if __name__ == '__main__':
     map_file = None
     show_map = False
     verbose = False
+    # stop once the 95% interval of the win rate is within 10 points, which takes about 80 games at
+    # a win rate of 0.3 (5 points would take about 320), or after 100 games
+    max_games = 100
+    estimate = WinRateEstimate(method='wilson', confidence=0.95, precision=0.1)
 
     results = []
-    for _ in range(100):
+    for _ in range(max_games):
         agent = KBAgentRogue(height, width, initial_strength)
         agents = [agent, ]
 
@@ -39,8 +44,12 @@ if __name__ == '__main__':
                 results.append(True)
             else:
                 results.append(False)
+            if estimate.update(results[-1]):
+                break
 
     won_count = sum([1 for x in results if x == True])
     die_count = sum([1 for x in results if x == False])
 
     print('Winning props: %.8f' % (won_count / float(won_count + die_count)))
+    print('%d%% interval: [%.4f, %.4f] after %d games' % ((estimate.confidence * 100,) + estimate.interval() +
+                                                          (estimate.games,)))
@@ -0,0 +1,126 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+
+_tracer = None
+
+
+def tracer():
+    """
+    Returns: Tracer. The tracer recording the planner calls, None while tracing is off.
+    """
+    return _tracer
+
+
+def enable(capacity=4096):
+    """
+    Start recording the planner calls, replacing the current tracer if any.
+    Args:
+        capacity: int. Number of calls kept, the oldest are dropped first.
+    Returns: Tracer. The new tracer.
+    """
+    global _tracer
+    _tracer = Tracer(capacity)
+    return _tracer
+
+
+def disable():
+    """
+    Stop recording the planner calls.
+    Returns: Tracer. The tracer that was recording, None if tracing was off.
+    """
+    global _tracer
+    previous, _tracer = _tracer, None
+    return previous
+
+
+@contextmanager
+def traced(capacity=4096):
+    """
+    Record the planner calls made while the context is active.
+    """
+    global _tracer
+    previous = _tracer
+    try:
+        yield enable(capacity)
+    finally:
+        _tracer = previous
+
+
+class Tracer(object):
+    """
+    Ring buffer of the statistics of the last planner calls.
+
+    Planners look the tracer up once per call and only gather the statistics
+    that cost anything to keep (frontier peaks and the like) when one is
+    recording, so tracing costs nothing while it is off.
+    """
+
+    def __init__(self, capacity=4096):
+        self.records = deque(maxlen=capacity)
+        # number of calls recorded, including those dropped from the buffer
+        self.calls = 0
+        # what the planners are called for, set by the game driver before each step of an agent
+        self.context = None
+
+    def record(self, planner, started, **stats):
+        """
+        Record a finished call.
+        Args:
+            planner: str. Name of the planner.
+            started: float. time.perf_counter() at the start of the call.
+            stats: Statistics of the call, such as the nodes it expanded.
+        """
+        stats['planner'] = planner
+        stats['duration'] = time.perf_counter() - started
+        stats['context'] = self.context
+        self.records.append(stats)
+        self.calls += 1
+
+    def summary(self):
+        """
+        Returns: dict. Per planner, the number of calls in the buffer, the number of them for
+            which each flag held, and the mean and largest value of each other statistic, the
+            duration included. Path costs are left out, they only mean something per call.
+        """
+        values = {}
+        for record in self.records:
+            entry = values.setdefault(record['planner'], {})
+            for name, value in record.items():
+                if isinstance(value, (bool, int, float)) and name != 'cost':
+                    entry.setdefault(name, []).append(value)
+
+        summary = {}
+        for planner, entry in values.items():
+            stats = summary[planner] = {'calls': len(entry['duration'])}
+            for name, series in entry.items():
+                if all(isinstance(value, bool) for value in series):
+                    stats[name] = sum(series)
+                else:
+                    stats['mean_' + name] = sum(series) / float(len(series))
+                    stats['max_' + name] = max(series)
+        return summary
+
+    def slowest(self, count=10, planner=None):
+        """
+        Returns: list of dict. The slowest calls in the buffer, of the planner if given.
+        """
+        records = [record for record in self.records if planner is None or record['planner'] == planner]
+        return sorted(records, key=lambda record: record['duration'], reverse=True)[:count]
+
+    def report(self, count=10):
+        """
+        Returns: str. The summary and the slowest calls, one per line.
+        """
+        lines = ['%d planner calls traced, %d kept' % (self.calls, len(self.records))]
+        for planner, stats in sorted(self.summary().items()):
+            lines.append('%-28s %s' % (planner, ' '.join('%s=%s' % (name, _format(stats[name])) for name in sorted(stats))))
+        lines.append('slowest calls:')
+        for record in self.slowest(count):
+            lines.append('%-28s %s' % (record['planner'], ' '.join(
+                '%s=%s' % (name, _format(record[name])) for name in sorted(record) if name != 'planner')))
+        return '\n'.join(lines)
+
+
+def _format(value):
+    return '%.6g' % value if isinstance(value, float) else str(value)
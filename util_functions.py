@@ -1,6 +1,5 @@
 from utils import MapTiles
 from utils import Directions
-import emoji as em
 import numpy as np
 
 MAP_TYPES = ['ascii', 'emoji']
@@ -16,13 +15,6 @@ def map_to_text(game_map, type='a'):
                   MapTiles.MOUNTAIN: 'M', MapTiles.WALL: 'W',
                   MapTiles.UNKNOWN: 'U'}
 
-    emoji_dict = {
-        MapTiles.UNKNOWN: em.emojize(':white_large_square:'),
-        MapTiles.MOUNTAIN: em.emojize(':mountain:'),
-        MapTiles.SAND: em.emojize(':palm_tree:'),
-        MapTiles.PATH: em.emojize(':motorway:'),
-        MapTiles.WALL: em.emojize(':construction:', use_aliases=True)}
-
     printable_map = np.full((len(game_map), len(game_map[0])), "x")
 
     assert type in MAP_TYPES
@@ -36,7 +28,14 @@ def map_to_text(game_map, type='a'):
         raise NotImplementedError('Unicode map display not yet implemented')
         # chosen_dict = unicode_dict
     elif type == 'emoji':
-        chosen_dict = emoji_dict
+        # only imported when an emoji map is asked for
+        import emoji as em
+        chosen_dict = {
+            MapTiles.UNKNOWN: em.emojize(':white_large_square:'),
+            MapTiles.MOUNTAIN: em.emojize(':mountain:'),
+            MapTiles.SAND: em.emojize(':palm_tree:'),
+            MapTiles.PATH: em.emojize(':motorway:'),
+            MapTiles.WALL: em.emojize(':construction:', use_aliases=True)}
 
     for i in range(len(game_map)):
         for j in range(len(game_map[i])):
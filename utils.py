@@ -118,3 +118,28 @@ class Boss(StaticMonster):
         self.strength = 100
         self.label = 'boss'
         self.delta = -100
+
+
+def object_kind(map_object):
+    """
+    Kind of a map object, as indexed by the agents
+
+    Parameters
+    ----------
+    map_object: MapObject
+        Object of the map
+
+    Returns
+    -------
+    kind: str
+        One of 'power_up', 'boss', 'monster' and 'agent', or None
+    """
+    if isinstance(map_object, PowerUp):
+        return 'power_up'
+    if isinstance(map_object, Boss):
+        return 'boss'
+    if isinstance(map_object, (StaticMonster, DynamicMonster)):
+        return 'monster'
+    if isinstance(map_object, AgentPlaceholder):
+        return 'agent'
+    return None
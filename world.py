@@ -0,0 +1,172 @@
+import os
+import tempfile
+
+import numpy as np
+
+from utils import MapTiles
+
+# tiles by storage code: the value of the tile plus one, so that the zeros of a new file are unknown tiles
+TILES = [MapTiles(code - 1) for code in range(5)]
+_TILE_ARRAY = np.array(TILES, dtype=object)
+# probabilities of the path, sand, mountain and wall tiles, as in GameDriver.generate_map
+TILE_PROBABILITIES = (0.4, 0.3, 0.2, 0.1)
+
+
+class ChunkedWorld(object):
+    """
+    Game map stored one byte per tile in a memory-mapped file, and generated
+    chunk by chunk the first time a tile of the chunk is read.
+
+    Each chunk is drawn from a generator seeded by the seed of the world and
+    the position of the chunk, so the same seed always gives the same world
+    whatever the order the chunks are visited in. Only the chunks read so far
+    are generated, and the file is sparse: the tiles take memory and disk for
+    the chunks in use only. What the agents keep of the map is not chunked,
+    see the README for the size of map each agent can play on.
+
+    Single tiles are read as `world[row, col]`; rows and rectangles of tiles
+    as arrays of MapTiles, like a map held in memory.
+    """
+
+    def __init__(self, height, width, seed=0, chunk_size=256, path=None):
+        """
+        Constructor
+        Args:
+            height: int. Height of the map.
+            width: int. Width of the map.
+            seed: int. Seed of the world.
+            chunk_size: int. Height and width of the chunks.
+            path: str. File of the tiles, reopened if it exists. A temporary file if None,
+                removed when the world is closed.
+        """
+        self.height = height
+        self.width = width
+        self.seed = seed
+        self.chunk_size = chunk_size
+
+        self._temporary = path is None
+        if path is None:
+            descriptor, path = tempfile.mkstemp(suffix='.world')
+            os.close(descriptor)
+            os.remove(path)
+        self.path = path
+        existing = os.path.exists(path)
+        if existing and os.path.getsize(path) != height * width:
+            raise ValueError('%s does not hold a world of %dx%d tiles' % (path, height, width))
+        self.tiles = np.memmap(path, dtype=np.uint8, mode='r+' if existing else 'w+', shape=(height, width))
+
+        # every tile of a generated chunk is known, so the corners of the chunks tell which ones are
+        self.generated = self.tiles[::chunk_size, ::chunk_size] != 0
+
+    @property
+    def shape(self):
+        return self.height, self.width
+
+    @property
+    def size(self):
+        return self.height * self.width
+
+    @property
+    def ndim(self):
+        return 2
+
+    @property
+    def dtype(self):
+        return _TILE_ARRAY.dtype
+
+    def __len__(self):
+        return self.height
+
+    def chunks_generated(self):
+        return int(self.generated.sum())
+
+    def generate_chunk(self, chunk_row, chunk_col):
+        """
+        Draw the tiles of a chunk, unless it was generated already.
+        """
+        if self.generated[chunk_row, chunk_col]:
+            return
+        rows = slice(chunk_row * self.chunk_size, min((chunk_row + 1) * self.chunk_size, self.height))
+        cols = slice(chunk_col * self.chunk_size, min((chunk_col + 1) * self.chunk_size, self.width))
+        rng = np.random.default_rng((self.seed, chunk_row, chunk_col))
+        shape = (rows.stop - rows.start, cols.stop - cols.start)
+        self.tiles[rows, cols] = rng.choice(4, shape, p=TILE_PROBABILITIES).astype(np.uint8) + 1
+        self.generated[chunk_row, chunk_col] = True
+
+    def generate_region(self, row_start, row_stop, col_start, col_stop):
+        """
+        Generate the chunks covering the tiles of the rows and columns in [start, stop).
+        """
+        if row_start >= row_stop or col_start >= col_stop:
+            return
+        chunk_rows = range(row_start // self.chunk_size, (row_stop - 1) // self.chunk_size + 1)
+        chunk_cols = range(col_start // self.chunk_size, (col_stop - 1) // self.chunk_size + 1)
+        if self.generated[chunk_rows.start:chunk_rows.stop, chunk_cols.start:chunk_cols.stop].all():
+            return
+        for chunk_row in chunk_rows:
+            for chunk_col in chunk_cols:
+                self.generate_chunk(chunk_row, chunk_col)
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple) and len(key) == 2 and \
+                isinstance(key[0], (int, np.integer)) and isinstance(key[1], (int, np.integer)):
+            row, col = _index(key[0], self.height), _index(key[1], self.width)
+            if not self.generated[row // self.chunk_size, col // self.chunk_size]:
+                self.generate_chunk(row // self.chunk_size, col // self.chunk_size)
+            return TILES[self.tiles[row, col]]
+
+        if not isinstance(key, tuple):
+            key = (key, slice(None))
+        if len(key) != 2 or not all(isinstance(k, (int, np.integer, slice)) for k in key):
+            raise IndexError('Worlds are indexed by rows and columns, as integers or slices')
+        bounds = []
+        for k, length in zip(key, self.shape):
+            if isinstance(k, slice):
+                indices = range(*k.indices(length))
+                bounds.append((min(indices), max(indices) + 1) if len(indices) > 0 else (0, 0))
+            else:
+                k = _index(k, length)
+                bounds.append((k, k + 1))
+        self.generate_region(bounds[0][0], bounds[0][1], bounds[1][0], bounds[1][1])
+        return _TILE_ARRAY[self.tiles[key]]
+
+    def take(self, rows, cols):
+        """
+        Returns: numpy.ndarray of MapTiles. The tiles at the given rows and columns.
+        """
+        rows, cols = np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp)
+        chunks = np.unique(np.stack([rows // self.chunk_size, cols // self.chunk_size]), axis=1)
+        for chunk_row, chunk_col in chunks.T:
+            self.generate_chunk(chunk_row, chunk_col)
+        return _TILE_ARRAY[self.tiles[rows, cols]]
+
+    def __array__(self, dtype=None, copy=None):
+        array = self[:, :]
+        return array.astype(dtype) if dtype is not None and dtype != array.dtype else array
+
+    def flush(self):
+        self.tiles.flush()
+
+    def close(self):
+        """
+        Write the generated chunks to the file, or remove the file if it is temporary.
+        """
+        if self.tiles is None:
+            return
+        self.tiles.flush()
+        # the file is unmapped once the last reference to the array goes
+        self.tiles = None
+        if self._temporary:
+            os.remove(self.path)
+
+    def __del__(self):
+        if getattr(self, 'tiles', None) is not None:
+            self.close()
+
+
+def _index(index, length):
+    if index < 0:
+        index += length
+    if not 0 <= index < length:
+        raise IndexError('index %d is out of bounds for a map of %d tiles' % (index, length))
+    return int(index)